@@ -1,25 +1,39 @@
+import time
+_PROCESS_T0 = time.perf_counter()
+
 import sys
 import os
-import io
+import json
 from typing import Optional, Tuple
 import numpy as np
-from PIL import Image, ImageOps
-import onnxruntime as ort
-import cv2
-from scipy import ndimage
 
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QPushButton, QVBoxLayout,
-    QHBoxLayout, QSlider, QFrame, QMessageBox, QProgressBar,
+    QHBoxLayout, QSlider, QCheckBox, QFrame, QMessageBox, QProgressBar,
     QDialog, QGraphicsOpacityEffect, QGroupBox, QSizePolicy, QGridLayout,
     QGraphicsDropShadowEffect
 )
-from PySide6.QtCore import Qt, QThread, Signal, QByteArray, QBuffer, QIODevice, QPropertyAnimation, QEasingCurve, QMargins
+from PySide6.QtCore import (
+    Qt, QThread, QTimer, Signal, QMutex, QMutexLocker, QWaitCondition, QPropertyAnimation, QEasingCurve, QMargins,
+    QPointF, QRect, QRectF
+)
 from PySide6.QtGui import (
-    QPainter, QPen, QColor, QImage, QPixmap, QIcon, QKeySequence, QFont, QShortcut, QLinearGradient # Добавлено QLinearGradient
+    QPainter, QPainterPath, QPen, QColor, QImage, QPixmap, QIcon, QKeySequence, QFont, QShortcut, QLinearGradient # Добавлено QLinearGradient
 )
-# Qt Charts
-from PySide6.QtCharts import QChart, QChartView, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
+# onnxruntime, cv2, scipy и QtCharts импортируются лениво: первые — в фоновом
+# потоке загрузки модели и при первой предобработке, QtCharts — в ProbabilityDialog
+from preprocessing import (get_best_shift, shift, preprocess_canvas, preprocess_batch, rasterize_strokes, segment_digits,
+                           tta_variants, TTA_SIZES)
+
+# Пауза пера (мс), после которой в живом режиме запускается распознавание
+LIVE_DEBOUNCE_MS = 300
+# Вход модели строится из векторных штрихов (rasterize_strokes), а не из растра холста;
+# DIGIT_VECTOR_INPUT=0 возвращает прежний путь через preprocess_canvas
+VECTOR_INPUT = os.environ.get("DIGIT_VECTOR_INPUT", "1").strip().lower() not in ("0", "false", "no", "off")
+# Усреднение по вариантам входа (TTA): включено ли при старте и сколько мс можно потратить на запрос;
+# число вариантов подбирается под бюджет по замерам во время работы
+TTA_ENABLED = os.environ.get("DIGIT_TTA", "0").strip().lower() not in ("0", "false", "no", "off", "")
+TTA_BUDGET_MS = float(os.environ.get("DIGIT_TTA_BUDGET_MS", "15"))
 
 # ---------- Helper ----------
 def resource_path(relative_path: str) -> str:
@@ -31,43 +45,248 @@ def resource_path(relative_path: str) -> str:
         rel = relative_path
     return os.path.join(base_path, rel)
 
+
+# ---------- Startup timing ----------
+_startup_marks = {}
+
+
+def mark_startup(stage: str):
+    """Запоминает момент (мс от старта процесса), когда достигнут этап запуска."""
+    _startup_marks.setdefault(stage, (time.perf_counter() - _PROCESS_T0) * 1000.0)
+
+
+def report_startup(extra: dict):
+    """Печатает отчёт о запуске и дописывает его JSON-строкой в DIGIT_STARTUP_LOG, если он задан."""
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), **_startup_marks, **extra}
+    stages = ", ".join(f"{k}={v:.0f} мс" for k, v in report.items() if isinstance(v, float))
+    print(f"Запуск: {stages}")
+    log_path = os.environ.get("DIGIT_STARTUP_LOG")
+    if log_path:
+        try:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Не удалось записать отчёт о запуске: {e}")
+
+
+def report_drawing(stats: dict):
+    """Печатает стоимость рисования за сеанс и дописывает её в DIGIT_DRAW_LOG, если он задан."""
+    if not stats["events"]:
+        return
+    print(f"Рисование: {stats['events']} событий, {stats['event_us']:.0f} мкс на событие, "
+          f"{stats['events_per_flush']:.1f} событий на кадр, отрисовка точек {stats['flush_ms']:.2f} мс, "
+          f"перерисовка {stats['paint_ms']:.2f} мс ({stats['painted_fraction'] * 100:.0f}% холста)")
+    log_path = os.environ.get("DIGIT_DRAW_LOG")
+    if log_path:
+        try:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), **stats},
+                                   ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Не удалось записать отчёт о рисовании: {e}")
+
 # ---------- Worker ----------
-# Используем улучшенную версию из второго файла
-class InferenceWorker(QThread):
-    result_ready = Signal(np.ndarray)
-    error = Signal(str)
+class InferenceService(QThread):
+    """Долгоживущий поток инференса с очередью из одного (самого свежего) запроса.
+
+    submit() заменяет ещё не взятый в работу запрос новым и возвращает его
+    монотонно растущий id; результаты приходят вместе с id, чтобы UI мог
+    отбросить устаревшие ответы. submit_canvas() и submit_strokes() принимают
+    сырой холст или векторные штрихи и выполняют предобработку тоже в этом
+    потоке, не нагружая UI. submit_digits() делит холст на цифры и
+    распознаёт их одной пачкой: результат — (N, n_classes) слева направо.
+    При tta_enabled каждое изображение размножается на K вариантов (TtaBudget
+    выбирает K под бюджет задержки), все они идут в один session.run, а в UI
+    уходят уже усреднённые вероятности. Замеры для TtaBudget делаются лениво,
+    при первом запросе с включённым TTA.
+
+    Перед обслуживанием запросов поток сам загружает и прогревает модель, чтобы
+    окно появлялось сразу; о готовности сообщают model_ready / model_failed.
+    """
+    model_ready = Signal(object, dict)
+    model_failed = Signal(str)
+    result_ready = Signal(int, np.ndarray)
+    error = Signal(int, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.recognizer = None
+        self._mutex = QMutex()
+        self._cond = QWaitCondition()
+        self._pending: Optional[Tuple[int, object, str]] = None
+        self._last_id = 0
+        self._stopping = False
+        self.tta_enabled = TTA_ENABLED
+        self.tta = None
+        # K последнего запроса — для подписи в UI
+        self.last_tta_k = 1
+
+    def submit(self, img_array: np.ndarray) -> int:
+        return self._enqueue(img_array.astype(np.float32), "array")
+
+    def submit_canvas(self, canvas: np.ndarray) -> int:
+        # Копия обязательна: get_array() — вид на холст, который продолжает меняться
+        return self._enqueue(np.array(canvas, dtype=np.uint8), "canvas")
+
+    def submit_strokes(self, strokes: list, widths: list, size: int) -> int:
+        # get_strokes() и так возвращает новые массивы — копировать не нужно
+        return self._enqueue((strokes, widths, size), "strokes")
+
+    def submit_digits(self, canvas: np.ndarray) -> int:
+        return self._enqueue(np.array(canvas, dtype=np.uint8), "digits")
+
+    def cancel(self):
+        """Снимает ещё не начатый запрос; уже идущий будет отброшен по id в UI."""
+        with QMutexLocker(self._mutex):
+            self._pending = None
+
+    def _enqueue(self, data, kind: str) -> int:
+        with QMutexLocker(self._mutex):
+            self._last_id += 1
+            self._pending = (self._last_id, data, kind)
+            self._cond.wakeOne()
+            return self._last_id
+
+    def stop(self):
+        with QMutexLocker(self._mutex):
+            self._stopping = True
+            self._pending = None
+            self._cond.wakeOne()
+        self.wait()
 
-    def __init__(self, session: ort.InferenceSession, img_array: np.ndarray):
-        super().__init__()
-        self.session = session
-        self.img = img_array.astype(np.float32)
+    @staticmethod
+    def _load_model():
+        # Используем логику из второго файла; onnxruntime импортируется уже здесь, в фоне
+        timings = {}
+        t = time.perf_counter()
+        from inference import DigitRecognizer, SessionConfig, default_model_paths, model_filenames
+        timings["import_ort_ms"] = (time.perf_counter() - t) * 1000.0
+
+        t = time.perf_counter()
+        model_paths = []
+        for name in model_filenames():
+            model_paths += [resource_path(f"resources/models/{name}")] + default_model_paths(name)
+        # Настройки читаются один раз и до перебора путей: ошибка в DIGIT_ORT_* уходит
+        # в model_failed как есть, а не превращается в «модель не найдена»
+        config = SessionConfig.from_env()
+        cache_size = int(os.environ.get("DIGIT_CACHE_SIZE", "256"))
+        recognizer = None
+        for p in model_paths:
+            try:
+                if os.path.exists(p):
+                    recognizer = DigitRecognizer(p, config=config, cache_size=cache_size)
+                    break
+            except Exception:
+                continue
+        if recognizer is None:
+            raise FileNotFoundError("Не удалось загрузить ONNX модель. Проверьте пути.")
+        timings["session_ms"] = (time.perf_counter() - t) * 1000.0
+
+        # Прогрев: первый session.run заметно дольше последующих
+        t = time.perf_counter()
+        recognizer.predict(np.zeros((28, 28), dtype=np.float32))
+        timings["warmup_ms"] = (time.perf_counter() - t) * 1000.0
+        return recognizer, timings
 
     def run(self):
         try:
-            name = self.session.get_inputs()[0].name
-            outs = self.session.run(None, {name: self.img})
-            # Берём первый тензор выхода и аккуратно приводим к форме (n_classes,)
-            out = outs[0]
-            if hasattr(out, "shape") and out.ndim > 1:
-                out = out[0]
-            out = np.asarray(out).astype(np.float32)
-            # Нормализуем (на всякий случай), если суммы не 1
-            if out.sum() > 0:
-                out = out / out.sum()
-            self.result_ready.emit(out)
+            self.recognizer, timings = self._load_model()
         except Exception as e:
-            self.error.emit(str(e))
+            self.model_failed.emit(str(e))
+            return
+        self.model_ready.emit(self.recognizer, timings)
+        while True:
+            with QMutexLocker(self._mutex):
+                while self._pending is None and not self._stopping:
+                    self._cond.wait(self._mutex)
+                if self._stopping:
+                    return
+                request_id, img, kind = self._pending
+                self._pending = None
+            try:
+                if kind == "digits":
+                    # Все цифры — один session.run, а не по вызову на цифру; выход (N, n_classes)
+                    batch, _ = segment_digits(img)
+                    out = self._predict_batch(batch)
+                else:
+                    if kind == "canvas":
+                        img = preprocess_batch(img)
+                    elif kind == "strokes":
+                        img = rasterize_strokes(*img)
+                    # Сам движок нормализует выход; одно изображение -> (n_classes,)
+                    out = self._predict_batch(img)[0]
+                self.result_ready.emit(request_id, out)
+            except Exception as e:
+                self.error.emit(request_id, str(e))
+
+    def _predict_batch(self, images: np.ndarray) -> np.ndarray:
+        images = np.asarray(images, dtype=np.float32).reshape(-1, 28, 28)
+        if self.tta_enabled:
+            if self.tta is None:
+                # Начальные замеры — только когда TTA впервые понадобился, а не при каждом запуске
+                from inference import TtaBudget
+                self.tta = TtaBudget(TTA_BUDGET_MS, TTA_SIZES)
+                self.tta.calibrate(self.recognizer)
+            probs, self.last_tta_k = self.tta.predict(self.recognizer, images, tta_variants)
+            return probs
+        self.last_tta_k = 1
+        return self.recognizer.predict_batch(images)
+
+class GradCamWorker(QThread):
+    """Считает Grad-CAM одного изображения в фоне, чтобы окно предпросмотра не подвисало.
+
+    Движок (вспомогательный ONNX-граф) загружается при первом запросе; готовый
+    можно передать в explainer, чтобы не создавать сессию повторно.
+    """
+    done = Signal(np.ndarray, np.ndarray)
+    failed = Signal(str)
+
+    def __init__(self, image: np.ndarray, explainer=None, parent=None):
+        super().__init__(parent)
+        self.image = np.array(image, dtype=np.float32)
+        self.explainer = explainer
+
+    def run(self):
+        try:
+            from explain import GradCamExplainer, render_overlay
+            from inference import GRADCAM_MODEL_FILENAME, SessionConfig, default_model_paths
+            if self.explainer is None:
+                config = SessionConfig.from_env()
+                paths = [resource_path(f"resources/models/{GRADCAM_MODEL_FILENAME}")]
+                paths += default_model_paths(GRADCAM_MODEL_FILENAME)
+                self.explainer = GradCamExplainer.from_paths(paths, config=config)
+            heatmap, probs = self.explainer.explain(self.image)
+            self.done.emit(render_overlay(self.image, heatmap), probs)
+        except Exception as e:
+            self.failed.emit(str(e))
 
 # ---------- Drawing Widget ----------
 # Используем UI версию из первого файла
 class DrawingWidget(QWidget):
+    # Испускается раз в кадр, если с прошлого кадра холст изменился штрихом (нажатие и движение пера)
+    stroke_changed = Signal()
+
     def __init__(self, size: int = 280, brush: int = 12):
         super().__init__()
         self.setFixedSize(size, size)
         self.size_px = size
         self.brush_size = brush
         self.pen_color = QColor("black")
+        self._pen = QPen(self.pen_color, self.brush_size, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
         self._image = QImage(self.size_px, self.size_px, QImage.Format_Grayscale8)
+        # Постоянная копия холста для отрисовки: обновляется только в грязных прямоугольниках
+        self._pixmap = QPixmap(self.size_px, self.size_px)
+        # Точки, пришедшие с прошлого кадра: рисуются одним QPainter при ближайшей отрисовке
+        self._pending = QPainterPath()
+        self._pending_dots = []
+        self._dirty = QRect()
+        self._stroke_pending = False
+        # Векторная запись рисунка: точки каждого штриха и толщина кисти, которой он нарисован
+        self._strokes = []
+        self._stroke_widths = []
+        self._stats = dict.fromkeys(("events", "event_ms", "flushes", "flush_ms", "paints", "paint_ms", "painted_px"), 0)
+        # Растёт на каждом штрихе и очистке: одинаковая версия — тот же холст
+        self.version = 0
         self.clear()
         self.last_pos = None
         self.setCursor(Qt.CrossCursor)
@@ -75,59 +294,149 @@ class DrawingWidget(QWidget):
         self.setStyleSheet("border: 2px solid #4a90e2; border-radius: 8px;")
 
     def clear(self):
+        self._pending = QPainterPath()
+        self._pending_dots = []
+        self._dirty = QRect()
+        self._stroke_pending = False
+        self._strokes = []
+        self._stroke_widths = []
         self._image.fill(255)
+        self._pixmap.fill(Qt.white)
+        self.version += 1
         self.update()
 
     def set_brush(self, size: int):
+        # Накопленные точки дорисовываются прежней кистью
+        self._flush()
         self.brush_size = max(1, int(size))
+        self._pen = QPen(self.pen_color, self.brush_size, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
 
     def paintEvent(self, event):
+        t = time.perf_counter()
+        self._flush()
+        rect = event.rect()
         p = QPainter(self)
-        pix = QPixmap.fromImage(self._image)
-        p.drawPixmap(0, 0, pix)
+        p.drawPixmap(rect, self._pixmap, rect)
+        p.end()
+        self._stats["paints"] += 1
+        self._stats["paint_ms"] += (time.perf_counter() - t) * 1000.0
+        self._stats["painted_px"] += rect.width() * rect.height()
+        if self._stroke_pending:
+            self._stroke_pending = False
+            self.stroke_changed.emit()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
-            self.last_pos = event.position() if hasattr(event, 'position') else event.pos()
-            self._draw_point(self.last_pos)
-            self.update()
+            t = time.perf_counter()
+            self.last_pos = self._event_point(event)
+            self._pending_dots.append(self.last_pos)
+            # Новый подпуть: штрихи, попавшие в один кадр, не должны соединяться линией
+            self._pending.moveTo(self.last_pos)
+            self._begin_stroke(self.last_pos)
+            self._mark_dirty(self.last_pos, self.last_pos)
+            self._count_event(t)
 
     def mouseMoveEvent(self, event):
         if event.buttons() & Qt.LeftButton and self.last_pos is not None:
-            pos = event.position() if hasattr(event, 'position') else event.pos()
-            self._draw_line(self.last_pos, pos)
+            t = time.perf_counter()
+            pos = self._event_point(event)
+            if self._pending.isEmpty():
+                self._pending.moveTo(self.last_pos)
+            self._pending.lineTo(pos)
+            if not self._strokes:
+                # Холст очистили посреди штриха — продолжение записываем как новый штрих
+                self._begin_stroke(self.last_pos)
+            self._strokes[-1].append((pos.x(), pos.y()))
+            self._mark_dirty(self.last_pos, pos)
             self.last_pos = pos
-            self.update()
+            self._count_event(t)
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.last_pos = None
 
-    def _draw_point(self, pos):
-        painter = QPainter(self._image)
-        pen = QPen(self.pen_color, self.brush_size, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-        painter.setPen(pen)
-        x, y = int(pos.x()), int(pos.y())
-        painter.drawPoint(x, y)
-        painter.end()
+    def _begin_stroke(self, pos: QPointF):
+        self._strokes.append([(pos.x(), pos.y())])
+        self._stroke_widths.append(self.brush_size)
 
-    def _draw_line(self, p1, p2):
+    @staticmethod
+    def _event_point(event) -> QPointF:
+        pos = event.position() if hasattr(event, 'position') else event.pos()
+        # Целые координаты, как и раньше: штрихи попиксельно совпадают с прежней отрисовкой
+        return QPointF(int(pos.x()), int(pos.y()))
+
+    def _mark_dirty(self, p1: QPointF, p2: QPointF):
+        # Прямоугольник отрезка, расширенный на радиус кисти с запасом на скругление
+        r = self.brush_size / 2.0 + 2.0
+        rect = QRectF(p1, p2).normalized().adjusted(-r, -r, r, r).toAlignedRect()
+        self._dirty = self._dirty.united(rect)
+        self._stroke_pending = True
+        self.version += 1
+        # Qt объединяет все update() до следующего кадра в одну перерисовку
+        self.update(rect)
+
+    def _flush(self):
+        """Рисует накопленные точки на холсте и переносит грязную область в pixmap."""
+        if self._dirty.isEmpty():
+            return
+        t = time.perf_counter()
         painter = QPainter(self._image)
-        pen = QPen(self.pen_color, self.brush_size, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-        painter.setPen(pen)
-        painter.drawLine(int(p1.x()), int(p1.y()), int(p2.x()), int(p2.y()))
+        painter.setPen(self._pen)
+        if not self._pending.isEmpty():
+            painter.drawPath(self._pending)
+        # Путь из одной точки QPainter не рисует — точки нажатий отдельно
+        for dot in self._pending_dots:
+            painter.drawPoint(dot)
         painter.end()
+        dirty = self._dirty.intersected(self._image.rect())
+        painter = QPainter(self._pixmap)
+        painter.drawImage(dirty, self._image, dirty)
+        painter.end()
+        self._pending = QPainterPath()
+        self._pending_dots = []
+        self._dirty = QRect()
+        self._stats["flushes"] += 1
+        self._stats["flush_ms"] += (time.perf_counter() - t) * 1000.0
+
+    def _count_event(self, start: float):
+        self._stats["events"] += 1
+        self._stats["event_ms"] += (time.perf_counter() - start) * 1000.0
+
+    def draw_stats(self) -> dict:
+        """Стоимость рисования: обработка событий мыши, отрисовка точек и перерисовка виджета."""
+        s = self._stats
+        flushes, paints = max(1, s["flushes"]), max(1, s["paints"])
+        return {
+            "events": s["events"],
+            "event_us": s["event_ms"] * 1000.0 / max(1, s["events"]),
+            "events_per_flush": s["events"] / flushes,
+            "flush_ms": s["flush_ms"] / flushes,
+            "paint_ms": s["paint_ms"] / paints,
+            "painted_fraction": s["painted_px"] / paints / (self.size_px * self.size_px),
+        }
+
+    def get_strokes(self) -> Tuple[list, list]:
+        """Штрихи как массивы (K, 2) float32 в пикселях холста и толщины кисти для rasterize_strokes()."""
+        return [np.array(pts, dtype=np.float32) for pts in self._strokes], list(self._stroke_widths)
 
-    def get_pil_image(self) -> Image.Image:
-        buffer = QByteArray()
-        buf = QBuffer(buffer)
-        buf.open(QIODevice.WriteOnly)
-        self._image.save(buf, "PNG")
-        buf.close()
-        pil_img = Image.open(io.BytesIO(buffer.data()))
-        if pil_img.mode != "L":
-            pil_img = pil_img.convert("L")
-        return pil_img
+    def get_array(self) -> np.ndarray:
+        """NumPy-представление (H, W) uint8 поверх байтов Grayscale8 QImage без копирования.
+
+        Точки, ещё не нарисованные до кадра, сначала дорисовываются.
+
+        Строки QImage выровнены по 4 байта, поэтому буфер читается с шагом
+        bytesPerLine и лишние байты выравнивания отрезаются срезом.
+        Массив остаётся видом на холст: он меняется при следующем рисовании.
+        """
+        self._flush()
+        h, w = self._image.height(), self._image.width()
+        stride = self._image.bytesPerLine()
+        buf = np.frombuffer(self._image.constBits(), dtype=np.uint8, count=stride * h)
+        return buf.reshape(h, stride)[:, :w]
+
+    def get_pil_image(self):
+        from PIL import Image
+        return Image.fromarray(np.ascontiguousarray(self.get_array()))
 
 # ---------- Theme transition overlay ----------
 # Используем улучшенную версию из второго файла
@@ -157,6 +466,8 @@ class ThemeTransitionOverlay(QWidget):
 class ProbabilityDialog(QDialog):
     def __init__(self, probabilities: np.ndarray, parent=None):
         super().__init__(parent)
+        # Qt Charts нужен только здесь — импортируем при первом открытии диалога
+        from PySide6.QtCharts import QChart, QChartView, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
         self.setWindowTitle("Вероятности предсказаний")
         self.resize(750, 500)
         self.setModal(True)
@@ -355,10 +666,20 @@ class ProbabilityDialog(QDialog):
 # ---------- Preview Dialog ----------
 # Используем улучшенную UI версию из первого файла
 class PreviewDialog(QDialog):
+    IMAGE_SIZE = 200
+    IMAGE_STYLE = """
+        QLabel {
+            background: rgba(0, 0, 0, 0.2);
+            border-radius: 8px;
+            border: 1px solid #34495e;
+            padding: 10px;
+        }
+    """
+
     def __init__(self, processed_array: np.ndarray, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Анализ обработанного изображения")
-        self.resize(380, 480)
+        self.resize(520, 500)
         self.setModal(True)
         # Стилизация окна
         self.setStyleSheet("""
@@ -396,19 +717,31 @@ class PreviewDialog(QDialog):
         arr_u8 = (arr * 255).astype(np.uint8)
         h, w = arr_u8.shape
         img = QImage(arr_u8.data, w, h, w, QImage.Format_Grayscale8).copy()
-        pix = QPixmap.fromImage(img).scaled(280, 280, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        pix = QPixmap.fromImage(img).scaled(self.IMAGE_SIZE, self.IMAGE_SIZE, Qt.KeepAspectRatio,
+                                            Qt.SmoothTransformation)
         img_label = QLabel()
         img_label.setPixmap(pix)
         img_label.setAlignment(Qt.AlignCenter)
-        img_label.setStyleSheet("""
-            QLabel {
-                background: rgba(0, 0, 0, 0.2);
-                border-radius: 8px;
-                border: 1px solid #34495e;
-                padding: 10px;
-            }
-        """)
-        main_layout.addWidget(img_label)
+        img_label.setStyleSheet(self.IMAGE_STYLE)
+
+        # Grad-CAM приходит позже из фонового потока (set_gradcam / set_gradcam_error)
+        self.gradcam_label = QLabel("Вычисляем Grad-CAM...")
+        self.gradcam_label.setFixedSize(self.IMAGE_SIZE + 22, self.IMAGE_SIZE + 22)
+        self.gradcam_label.setAlignment(Qt.AlignCenter)
+        self.gradcam_label.setWordWrap(True)
+        self.gradcam_label.setStyleSheet(self.IMAGE_STYLE)
+        self.gradcam_caption = QLabel("Grad-CAM")
+        self.gradcam_caption.setAlignment(Qt.AlignCenter)
+
+        images_layout = QHBoxLayout()
+        for widget, caption in ((img_label, QLabel("Вход модели 28x28")),
+                                (self.gradcam_label, self.gradcam_caption)):
+            caption.setAlignment(Qt.AlignCenter)
+            column = QVBoxLayout()
+            column.addWidget(widget)
+            column.addWidget(caption)
+            images_layout.addLayout(column)
+        main_layout.addLayout(images_layout)
 
         # Статистика
         stats = arr_u8.flatten()
@@ -467,17 +800,32 @@ class PreviewDialog(QDialog):
 
         self.setLayout(main_layout)
 
+    def set_gradcam(self, overlay: np.ndarray, probs: np.ndarray):
+        h, w, _ = overlay.shape
+        img = QImage(np.ascontiguousarray(overlay).data, w, h, 3 * w, QImage.Format_RGB888).copy()
+        self.gradcam_label.setPixmap(QPixmap.fromImage(img).scaled(
+            self.IMAGE_SIZE, self.IMAGE_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        digit = int(np.argmax(probs))
+        self.gradcam_caption.setText(f"Grad-CAM для цифры {digit} ({float(probs[digit]):.1%})")
+
+    def set_gradcam_error(self, err: str):
+        self.gradcam_label.setText(f"Grad-CAM недоступен:\n{err}")
+
 # ---------- Main Window ----------
 class ModernDigitRecognizerMain(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AI Распознавание цифр — QtCharts & Animations")
         self.setMinimumSize(620, 820)
-        self._load_model()
+        self.recognizer = None
+        self._explainer = None
+        self._gradcam_worker = None
         self._init_themes()
         self.current_theme = "dark"
         self._build_ui()
         self.apply_theme(self.current_theme)  # Применяем тему при запуске
+        # Модель грузится в фоне, окно доступно сразу
+        self._start_inference_service()
 
         # храним анимации, overlay и др. (из второго файла)
         self._theme_overlay = None
@@ -486,23 +834,62 @@ class ModernDigitRecognizerMain(QMainWindow):
         self._result_anim = None
         self._confidence_anim = None
 
-    def _load_model(self):
-        # Используем логику из второго файла
-        model_paths = [
-            resource_path("resources/models/improved_digit_recognition_model.onnx"),
-            "resources/models/improved_digit_recognition_model.onnx",
-            "improved_digit_recognition_model.onnx",
-        ]
-        self.model_session = None
-        for p in model_paths:
-            try:
-                if os.path.exists(p):
-                    self.model_session = ort.InferenceSession(p, providers=['CPUExecutionProvider'])
-                    break
-            except Exception:
-                continue
-        if self.model_session is None:
-            raise FileNotFoundError("Не удалось загрузить ONNX модель. Проверьте пути.")
+        # Несколько цифр на холсте: результат — число, прочитанное слева направо
+        self.multi_mode = False
+
+        # Живое распознавание: ждём паузу пера и распознаём без нажатия кнопки
+        self.live_mode = False
+        self._live_timer = QTimer(self)
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(LIVE_DEBOUNCE_MS)
+        self._live_timer.timeout.connect(self._predict_live)
+        self.drawing.stroke_changed.connect(self._on_stroke_changed)
+
+    def _start_inference_service(self):
+        # Один поток на всё время жизни окна вместо нового QThread на каждый запрос
+        self._latest_request_id = 0
+        # Версии холста: отправленная в последнем запросе и та, для которой показан результат
+        self._request_version = -1
+        self._predicted_version = -1
+        self._live_request = False
+        self.inference_service = InferenceService(parent=self)
+        self.inference_service.model_ready.connect(self._on_model_ready)
+        self.inference_service.model_failed.connect(self._on_model_failed)
+        self.inference_service.result_ready.connect(self._on_service_result)
+        self.inference_service.error.connect(self._on_service_error)
+        self._set_model_loading(True)
+        self.inference_service.start()
+
+    def _set_model_loading(self, loading: bool):
+        self.btn_predict.setEnabled(not loading)
+        self.busy_progress.setVisible(loading)
+        if loading:
+            self.result_label.setText("Загрузка модели...")
+            self.result_label.setStyleSheet("color: #f39c12;")
+        else:
+            self.result_label.setText("Готов к распознаванию...")
+            self.result_label.setStyleSheet("color: #3498db;")
+
+    def _on_model_ready(self, recognizer, timings: dict):
+        self.recognizer = recognizer
+        self._set_model_loading(False)
+        mark_startup("model_ready")
+        report_startup({**timings, "model": os.path.basename(recognizer.model_path)})
+
+    def _on_model_failed(self, err: str):
+        self.btn_predict.setEnabled(False)
+        self.busy_progress.setVisible(False)
+        self.result_label.setText("Модель не загружена")
+        self.result_label.setStyleSheet("color: #e74c3c;")
+        self.details_label.setText(err)
+        QMessageBox.critical(self, "Ошибка запуска", err)
+
+    def closeEvent(self, event):
+        report_drawing(self.drawing.draw_stats())
+        self.inference_service.stop()
+        if self._gradcam_worker is not None:
+            self._gradcam_worker.wait()
+        super().closeEvent(event)
 
     def _init_themes(self):
         # Используем стилизованные темы из первого файла
@@ -903,12 +1290,39 @@ class ModernDigitRecognizerMain(QMainWindow):
         brush_container.addWidget(self.brush_size_label)
         controls_layout.addLayout(brush_container)
 
+        # Live recognition controls
+        live_container = QVBoxLayout()
+        live_container.setSpacing(6)
+        self.live_checkbox = QCheckBox("Распознавать при рисовании (Ctrl+L)")
+        self.live_checkbox.toggled.connect(self.set_live_mode)
+        self.live_delay_label = QLabel(f"Пауза пера: {LIVE_DEBOUNCE_MS} мс")
+        self.live_delay_label.setAlignment(Qt.AlignCenter)
+        self.slider_live_delay = QSlider(Qt.Horizontal)
+        self.slider_live_delay.setMinimum(50)
+        self.slider_live_delay.setMaximum(1000)
+        self.slider_live_delay.setSingleStep(50)
+        self.slider_live_delay.setValue(LIVE_DEBOUNCE_MS)
+        self.slider_live_delay.setFixedWidth(180)
+        self.slider_live_delay.valueChanged.connect(self.set_live_delay)
+        live_container.addWidget(self.live_checkbox)
+        self.multi_checkbox = QCheckBox("Несколько цифр (Ctrl+M)")
+        self.multi_checkbox.toggled.connect(self.set_multi_mode)
+        live_container.addWidget(self.multi_checkbox)
+        self.tta_checkbox = QCheckBox(f"Усреднять варианты (TTA, до {TTA_BUDGET_MS:.0f} мс)")
+        self.tta_checkbox.setChecked(TTA_ENABLED)
+        self.tta_checkbox.toggled.connect(self.set_tta_mode)
+        live_container.addWidget(self.tta_checkbox)
+        live_container.addWidget(self.live_delay_label)
+        live_container.addWidget(self.slider_live_delay)
+        controls_layout.addLayout(live_container)
+
         # Action buttons
         buttons_layout = QVBoxLayout()
         buttons_layout.setSpacing(8)
         btn_predict = QPushButton("Распознать (Enter/Пробел)")
         btn_predict.clicked.connect(self._predict)
         btn_predict.setObjectName("accent")
+        self.btn_predict = btn_predict
         btn_preview = QPushButton("Предпросмотр")
         btn_preview.clicked.connect(self._show_preview)
         btn_probs = QPushButton("Вероятности")
@@ -993,6 +1407,8 @@ class ModernDigitRecognizerMain(QMainWindow):
         QShortcut(QKeySequence("Ctrl+P"), self, activated=self._show_preview)
         QShortcut(QKeySequence("Ctrl+T"), self, activated=self._cycle_theme)
         QShortcut(QKeySequence("F11"), self, activated=self._toggle_fullscreen)
+        QShortcut(QKeySequence("Ctrl+L"), self, activated=self.live_checkbox.toggle)
+        QShortcut(QKeySequence("Ctrl+M"), self, activated=self.multi_checkbox.toggle)
         QShortcut(QKeySequence(Qt.Key_Return), self, activated=self._predict)
         QShortcut(QKeySequence(Qt.Key_Space), self, activated=self._predict)
 
@@ -1083,8 +1499,56 @@ class ModernDigitRecognizerMain(QMainWindow):
         else:
             self.showFullScreen()
 
+    def set_live_mode(self, enabled: bool):
+        self.live_mode = bool(enabled)
+        if not self.live_mode:
+            self._live_timer.stop()
+
+    def set_multi_mode(self, enabled: bool):
+        self.multi_mode = bool(enabled)
+        # Результат прежнего режима к тому же холсту не подходит
+        self._predicted_version = -1
+        if self.live_mode:
+            self._live_timer.start()
+
+    def set_tta_mode(self, enabled: bool):
+        self.inference_service.tta_enabled = bool(enabled)
+        self._predicted_version = -1
+        if self.live_mode:
+            self._live_timer.start()
+
+    def set_live_delay(self, ms: int):
+        self._live_timer.setInterval(int(ms))
+        self.live_delay_label.setText(f"Пауза пера: {int(ms)} мс")
+
+    def _on_stroke_changed(self):
+        if not self.live_mode:
+            return
+        # Новый штрих делает неактуальным всё, что уже посчитано или считается
+        self._latest_request_id = -1
+        self.inference_service.cancel()
+        self._live_timer.start()
+
+    def _predict_live(self):
+        if self.recognizer is None or self._canvas_unchanged():
+            return
+        self._live_request = True
+        self._request_version = self.drawing.version
+        if self.multi_mode:
+            self._latest_request_id = self.inference_service.submit_digits(self.drawing.get_array())
+        elif VECTOR_INPUT:
+            strokes, widths = self.drawing.get_strokes()
+            self._latest_request_id = self.inference_service.submit_strokes(strokes, widths, self.drawing.size_px)
+        else:
+            self._latest_request_id = self.inference_service.submit_canvas(self.drawing.get_array())
+
     def _clear_canvas(self):
         # Используем логику из первого файла
+        self._live_timer.stop()
+        self._latest_request_id = -1
+        self.inference_service.cancel()
+        # Ответ на отменённый запрос будет отброшен и индикатор сам не скроется
+        self.busy_progress.setVisible(False)
         self.drawing.clear()
         self.result_label.setText("Холст очищен. Нарисуйте цифру.")
         self.result_label.setStyleSheet("color: #3498db;")
@@ -1094,58 +1558,66 @@ class ModernDigitRecognizerMain(QMainWindow):
 
     @staticmethod
     def get_best_shift(img: np.ndarray) -> Tuple[int, int]:
-        # Используем улучшенную логику из второго файла
-        cy, cx = ndimage.center_of_mass(img)
-        rows, cols = img.shape
-        shiftx = int(np.round(cols / 2.0 - cx))
-        shifty = int(np.round(rows / 2.0 - cy))
-        return shiftx, shifty
+        return get_best_shift(img)
 
     @staticmethod
     def shift(img: np.ndarray, sx: int, sy: int) -> np.ndarray:
-        # Используем улучшенную логику из второго файла
-        rows, cols = img.shape
-        M = np.float32([[1, 0, sx], [0, 1, sy]])
-        shifted = cv2.warpAffine(img, M, (cols, rows))
-        return shifted
+        return shift(img, sx, sy)
 
     def preprocess_image(self) -> np.ndarray:
-        # Используем улучшенную логику из второго файла
-        pil = self.drawing.get_pil_image()
-        img_resized = pil.resize((28, 28), Image.LANCZOS)
-        img_array = np.array(img_resized).astype(np.uint8)
-        img_array = 255 - img_array
-        img_array = img_array / 255.0
-        img_pil = Image.fromarray((img_array * 255).astype(np.uint8))
-        bbox = ImageOps.invert(img_pil).getbbox()
-        if bbox:
-            img_cropped = img_pil.crop(bbox)
-            img_pil = ImageOps.pad(img_cropped, (28, 28), color=0)
-            img_array = np.array(img_pil) / 255.0
-        shiftx, shifty = self.get_best_shift(img_array)
-        img_array = self.shift(img_array, shiftx, shifty)
-        img_array = img_array.reshape(1, 28, 28, 1).astype(np.float32)
-        return img_array
+        # Сама предобработка живёт в preprocessing.py и не зависит от Qt
+        if VECTOR_INPUT:
+            strokes, widths = self.drawing.get_strokes()
+            return rasterize_strokes(strokes, widths, self.drawing.size_px)
+        return preprocess_canvas(self.drawing.get_array())
+
+    def _canvas_unchanged(self) -> bool:
+        return self.last_prediction is not None and self.drawing.version == self._predicted_version
 
     def _predict(self):
-        # Используем логику из второго файла
-        try:
-            img_array = self.preprocess_image()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка при подготовке изображения:\n{e}")
+        # Холст не менялся с прошлого распознавания — показываем готовый результат
+        if self._canvas_unchanged():
+            self._live_request = False
+            self._on_prediction(self.last_prediction)
             return
-        if self.model_session is None:
-            QMessageBox.critical(self, "Ошибка", "Модель не загружена.")
+        # Используем логику из второго файла
+        img_array = None
+        if not self.multi_mode:
+            try:
+                img_array = self.preprocess_image()
+            except Exception as e:
+                QMessageBox.critical(self, "Ошибка", f"Ошибка при подготовке изображения:\n{e}")
+                return
+        if self.recognizer is None:
+            if self.inference_service.isRunning():
+                self.result_label.setText("Модель ещё загружается...")
+            else:
+                QMessageBox.critical(self, "Ошибка", "Модель не загружена.")
             return
+        self._live_request = False
         self.busy_progress.setVisible(True)
         self.result_label.setText("Анализ...")
         self.result_label.setStyleSheet("color: #f39c12;")
         self.details_label.setText("")
         self.repaint()
-        self.worker = InferenceWorker(self.model_session, img_array)
-        self.worker.result_ready.connect(self._on_prediction)
-        self.worker.error.connect(self._on_inference_error)
-        self.worker.start()
+        self._request_version = self.drawing.version
+        if self.multi_mode:
+            # Разбиение на цифры — в потоке инференса, вместе с распознаванием
+            self._latest_request_id = self.inference_service.submit_digits(self.drawing.get_array())
+        else:
+            self._latest_request_id = self.inference_service.submit(img_array)
+
+    def _on_service_result(self, request_id: int, prediction: np.ndarray):
+        # Ответы на устаревшие запросы отбрасываем: на экране только самый свежий
+        if request_id != self._latest_request_id:
+            return
+        self._predicted_version = self._request_version
+        self._on_prediction(prediction)
+
+    def _on_service_error(self, request_id: int, err: str):
+        if request_id != self._latest_request_id:
+            return
+        self._on_inference_error(err)
 
     def _on_inference_error(self, err: str):
         # Используем логику из второго файла
@@ -1176,6 +1648,9 @@ class ModernDigitRecognizerMain(QMainWindow):
         self._confidence_anim = anim  # сохранить ссылку
 
     def _on_prediction(self, prediction: np.ndarray):
+        if np.ndim(prediction) == 2:
+            self._on_multi_prediction(prediction)
+            return
         # Используем улучшенную логику из второго файла
         self.busy_progress.setVisible(False)
         probs = np.asarray(prediction).astype(np.float32).flatten()
@@ -1202,16 +1677,52 @@ class ModernDigitRecognizerMain(QMainWindow):
 
         # Дополнительно показываем краткую уверенность
         details_text = f"Уверенность: {confidence:.1%}" + ((" | " + details_text) if details_text else "")
-        self.details_label.setText(details_text)
-        self._animate_result_appearance()
+        self.details_label.setText(details_text + self._tta_note())
+        # В живом режиме обновляем результат на месте, без повторного появления
+        if not self._live_request:
+            self._animate_result_appearance()
+        self._animate_confidence_bar(int(confidence * 100))
+
+    def _on_multi_prediction(self, probs: np.ndarray):
+        """Результат режима нескольких цифр: (N, n_classes) слева направо."""
+        self.busy_progress.setVisible(False)
+        self.last_prediction = probs
+        if len(probs) == 0:
+            self.result_label.setText("Цифры не найдены")
+            self.result_label.setStyleSheet("color: #3498db;")
+            self.details_label.setText("")
+            self._animate_confidence_bar(0)
+            return
+        digits = probs.argmax(axis=1)
+        confidences = probs.max(axis=1)
+        number = "".join(str(int(d)) for d in digits)
+        # Уверенность в числе не выше, чем в самой сомнительной цифре
+        confidence = float(confidences.min())
+        self.result_label.setText(f"Число: {number}   (Уверенность: {confidence:.1%})")
+        self.result_label.setStyleSheet("color: #27ae60; font-size: 20px; font-weight: bold;")
+        self.details_label.setText("По цифрам: " + "  |  ".join(
+            f"{int(d)}: {c:.1%}" for d, c in zip(digits, confidences)) + self._tta_note())
+        if not self._live_request:
+            self._animate_result_appearance()
         self._animate_confidence_bar(int(confidence * 100))
 
+    def _tta_note(self) -> str:
+        k = self.inference_service.last_tta_k
+        return f" | TTA: {k} вар." if self.inference_service.tta_enabled and k > 1 else ""
+
     def _show_probabilities(self):
         # Используем логику из первого файла
-        if self.last_prediction is None:
+        if self.last_prediction is None or len(self.last_prediction) == 0:
             QMessageBox.information(self, "Информация", "Сначала выполните распознавание!")
             return
-        dlg = ProbabilityDialog(self.last_prediction, parent=self)
+        probs = self.last_prediction
+        if probs.ndim == 2:
+            # Для числа показываем распределение самой сомнительной цифры
+            i = int(probs.max(axis=1).argmin())
+            dlg = ProbabilityDialog(probs[i], parent=self)
+            dlg.setWindowTitle(f"Вероятности: цифра {i + 1} из {len(probs)} (наименее уверенная)")
+        else:
+            dlg = ProbabilityDialog(probs, parent=self)
         dlg.exec()
 
     def _show_preview(self):
@@ -1222,17 +1733,35 @@ class ModernDigitRecognizerMain(QMainWindow):
             QMessageBox.critical(self, "Ошибка", f"Ошибка при предобработке: {e}")
             return
         dlg = PreviewDialog(arr, parent=self)
+        if self._gradcam_worker is not None:
+            self._gradcam_worker.wait()
+        worker = GradCamWorker(arr, self._explainer, self)
+        worker.done.connect(dlg.set_gradcam)
+        worker.failed.connect(dlg.set_gradcam_error)
+        worker.finished.connect(self._on_gradcam_finished)
+        self._gradcam_worker = worker
+        worker.start()
         dlg.exec()
 
+    def _on_gradcam_finished(self):
+        # Загруженный движок переиспользуем в следующих предпросмотрах
+        if self._gradcam_worker is not None:
+            self._explainer = self._gradcam_worker.explainer
+
 # ---------- Main ----------
 def main():
+    mark_startup("imports")
     app = QApplication(sys.argv)
     try:
         w = ModernDigitRecognizerMain()
     except Exception as e:
         QMessageBox.critical(None, "Ошибка запуска", str(e))
         raise
+    mark_startup("window_built")
+    app.aboutToQuit.connect(w.inference_service.stop)
     w.show()
+    # Первый проход цикла событий — окно уже на экране
+    QTimer.singleShot(0, lambda: mark_startup("window_shown"))
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+"""Пакетное распознавание папки с изображениями цифр (сканы, фото, PNG холста).
+
+Работает без Qt. Изображения декодируются и проходят ту же предобработку, что
+и в приложении (preprocess_batch), в пуле процессов; готовые тензоры собираются
+в батчи фиксированного размера для ONNX, а результаты сразу пишутся в CSV или
+JSONL. В памяти одновременно не больше --prefetch чанков, сколько бы файлов ни
+было в папке.
+
+    python batch_predict.py scans/ --output results.csv --workers 4 --batch-size 256
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from inference import DigitRecognizer, SessionConfig, default_model_paths, model_filenames
+from preprocessing import preprocess_batch
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp", ".pgm")
+FORMATS = ("csv", "jsonl")
+
+
+# ---------- Files ----------
+def iter_images(root: str, extensions: Sequence[str] = IMAGE_EXTENSIONS, recursive: bool = True) -> Iterator[str]:
+    """Пути к изображениям в папке по алфавиту; каталог обходится лениво, без полного списка."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if not recursive:
+            dirnames.clear()
+        for name in sorted(filenames):
+            if name.lower().endswith(tuple(extensions)):
+                yield os.path.join(dirpath, name)
+
+
+def _chunks(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------- Decoding (worker processes) ----------
+def decode_image(path: str, invert: bool = False) -> np.ndarray:
+    """Файл -> (28, 28) float32 в [0, 1]; ожидается тёмная цифра на светлом фоне, как на холсте."""
+    with Image.open(path) as img:
+        if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+            # Прозрачный фон считаем белым, как у холста
+            img = img.convert("RGBA")
+            background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        canvas = np.array(img.convert("L"))
+    if invert:
+        canvas = 255 - canvas
+    return preprocess_batch(canvas).reshape(28, 28)
+
+
+def decode_chunk(paths: Sequence[str], invert: bool = False) -> Tuple[List[Tuple[str, Optional[str]]], np.ndarray]:
+    """Чанк путей -> ([(путь, ошибка или None)] в исходном порядке, тензоры (n, 28, 28) float32 удачных файлов)."""
+    rows, images = [], []
+    for path in paths:
+        try:
+            images.append(decode_image(path, invert))
+            rows.append((path, None))
+        except Exception as e:
+            rows.append((path, f"{type(e).__name__}: {e}"))
+    stacked = np.stack(images) if images else np.zeros((0, 28, 28), dtype=np.float32)
+    return rows, stacked
+
+
+def decoded_chunks(paths: Iterable[str], chunk_size: int, workers: int, prefetch: int,
+                   invert: bool = False) -> Iterator[Tuple[List[Tuple[str, Optional[str]]], np.ndarray]]:
+    """Декодированные чанки в порядке файлов.
+
+    В пуле одновременно не больше prefetch чанков: следующий отправляется, только
+    когда забрали самый старый, поэтому память не растёт вместе с размером папки.
+    При workers=0 декодирование идёт в текущем процессе.
+    """
+    chunks = _chunks(paths, chunk_size)
+    if workers <= 0:
+        for chunk in chunks:
+            yield decode_chunk(chunk, invert)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(decode_chunk, chunk, invert))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# ---------- Output ----------
+class ResultWriter:
+    """Построчная запись результатов в CSV или JSONL с flush после каждого батча."""
+
+    def __init__(self, stream, fmt: str, top_k: int = 3):
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.stream = stream
+        self.fmt = fmt
+        self.top_k = top_k
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(["path", "digit", "confidence"] + [f"p{i}" for i in range(10)] + ["error"])
+
+    def write(self, paths: Sequence[str], probs: np.ndarray):
+        for path, p in zip(paths, probs):
+            digit = int(np.argmax(p))
+            if self._csv is not None:
+                self._csv.writerow([path, digit, f"{p[digit]:.6f}"] + [f"{v:.6f}" for v in p] + [""])
+            else:
+                top = np.argsort(p)[::-1][:self.top_k]
+                row = {"path": path, "digit": digit, "confidence": float(p[digit]),
+                       "top_k": [{"digit": int(i), "prob": float(p[i])} for i in top]}
+                self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def write_errors(self, errors: Sequence[Tuple[str, str]]):
+        for path, message in errors:
+            if self._csv is not None:
+                self._csv.writerow([path, "", ""] + [""] * 10 + [message])
+            else:
+                self.stream.write(json.dumps({"path": path, "error": message}, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+# ---------- Pipeline ----------
+def predict_folder(recognizer: DigitRecognizer, paths: Iterable[str], writer: ResultWriter, batch_size: int = 256,
+                   workers: int = 0, prefetch: int = 0, invert: bool = False, progress_s: float = 0.0,
+                   log=sys.stderr) -> dict:
+    """
+    Распознаёт файлы и пишет результаты по мере готовности; возвращает статистику.
+
+    Модель получает батчи ровно по batch_size изображений (кроме последнего):
+    чанки, уменьшившиеся из-за нечитаемых файлов, добираются следующими.
+    Строки пишутся в порядке файлов: ошибка ждёт в очереди, пока не записаны
+    результаты всех файлов перед ней.
+    """
+    prefetch = prefetch or max(2, 2 * workers)
+    stats = {"images": 0, "errors": 0, "batches": 0, "wait_s": 0.0, "inference_s": 0.0}
+    # Пути по порядку вместе с ошибкой (None — файл ждёт распознавания в buf_images)
+    buf_rows: "deque[Tuple[str, Optional[str]]]" = deque()
+    buf_images: List[np.ndarray] = []
+    buffered = 0
+
+    def write_rows(probs: np.ndarray):
+        """Пишет строки из головы очереди: все ошибки и len(probs) распознанных файлов."""
+        done, paths = 0, []
+        while buf_rows and (done < len(probs) or buf_rows[0][1] is not None):
+            path, error = buf_rows.popleft()
+            if error is None:
+                paths.append(path)
+                done += 1
+                continue
+            if paths:
+                writer.write(paths, probs[done - len(paths):done])
+                paths = []
+            writer.write_errors([(path, error)])
+        if paths:
+            writer.write(paths, probs[done - len(paths):done])
+
+    def run(n: int):
+        nonlocal buf_images, buffered
+        images = np.concatenate(buf_images) if len(buf_images) > 1 else buf_images[0]
+        t = time.perf_counter()
+        probs = recognizer.predict_batch(images[:n])
+        stats["inference_s"] += time.perf_counter() - t
+        write_rows(probs)
+        stats["images"] += n
+        stats["batches"] += 1
+        buf_images = [images[n:]] if len(images) > n else []
+        buffered -= n
+
+    start = last_report = time.perf_counter()
+    chunks = decoded_chunks(paths, batch_size, workers, prefetch, invert)
+    while True:
+        t = time.perf_counter()
+        item = next(chunks, None)
+        stats["wait_s"] += time.perf_counter() - t
+        if item is None:
+            break
+        rows, images = item
+        buf_rows.extend(rows)
+        stats["errors"] += len(rows) - len(images)
+        if len(images):
+            buf_images.append(images)
+            buffered += len(images)
+        while buffered >= batch_size:
+            run(batch_size)
+        # Ошибки, перед которыми нет ждущих файлов, можно записать сразу
+        write_rows(np.zeros((0, 10), dtype=np.float32))
+        if progress_s and log is not None and time.perf_counter() - last_report >= progress_s:
+            last_report = time.perf_counter()
+            log.write(f"  {stats['images']} изображений, {stats['images'] / (last_report - start):.0f} изобр./с\n")
+            log.flush()
+    if buffered:
+        run(buffered)
+    stats["wall_s"] = time.perf_counter() - start
+    stats["images_per_s"] = stats["images"] / stats["wall_s"] if stats["wall_s"] > 0 else 0.0
+    return stats
+
+
+def print_stats(stats: dict, log=sys.stderr):
+    log.write(
+        f"Распознано {stats['images']} изображений ({stats['errors']} с ошибками) за {stats['wall_s']:.2f} с: "
+        f"{stats['images_per_s']:.0f} изобр./с, {stats['batches']} батчей; "
+        f"инференс {stats['inference_s']:.2f} с, ожидание декодирования {stats['wait_s']:.2f} с\n")
+    log.flush()
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Распознавание всех изображений в папке (ONNX)")
+    # Настройки ONNX Runtime, кроме числа потоков, берутся из переменных окружения DIGIT_ORT_*
+    config = SessionConfig.from_env()
+    parser.add_argument("folder", help="папка с изображениями")
+    parser.add_argument("--output", "-o", default="-", help="файл результатов (.csv или .jsonl; '-' — stdout)")
+    parser.add_argument("--format", choices=FORMATS, help="формат вывода (по умолчанию — по расширению, иначе csv)")
+    parser.add_argument("--model", help="путь к .onnx (по умолчанию — как в приложении)")
+    parser.add_argument("--quantized", action="store_true", default=None,
+                        help="предпочитать INT8-модель, если она есть (или DIGIT_PREFER_QUANTIZED=1)")
+    parser.add_argument("--student", action="store_true", default=None,
+                        help="предпочитать модель-ученик, если она есть (или DIGIT_PREFER_STUDENT=1)")
+    parser.add_argument("--batch-size", type=int, default=256, help="изображений в одном session.run")
+    # Одно ядро остаётся основному процессу с ONNX Runtime
+    parser.add_argument("--workers", type=int, default=max(0, (os.cpu_count() or 1) - 1),
+                        help="процессов для декодирования (0 — в основном процессе)")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="максимум чанков в работе и в очереди (0 — 2 на процесс)")
+    parser.add_argument("--invert", action="store_true", help="светлая цифра на тёмном фоне (как в MNIST)")
+    parser.add_argument("--no-recursive", action="store_true", help="не заходить во вложенные папки")
+    parser.add_argument("--top-k", type=int, default=3, help="сколько вариантов писать в JSONL")
+    parser.add_argument("--progress", type=float, default=5.0, help="период вывода прогресса, с (0 — не выводить)")
+    parser.add_argument("--intra-threads", type=int, default=config.intra_op_threads,
+                        help="потоков ORT (0 — по умолчанию ORT)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"'{args.folder}' не папка")
+    if args.batch_size < 1:
+        parser.error("--batch-size должен быть >= 1")
+    fmt = args.format or ("jsonl" if args.output.lower().endswith((".jsonl", ".json")) else "csv")
+
+    config.intra_op_threads = args.intra_threads
+    if args.model:
+        paths = [args.model]
+    else:
+        paths = [p for name in model_filenames(args.quantized, args.student) for p in default_model_paths(name)]
+    recognizer = DigitRecognizer.from_paths(paths, batch_size=args.batch_size, config=config)
+    sys.stderr.write(f"Модель: {recognizer.model_path}\n")
+
+    stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        writer = ResultWriter(stream, fmt, args.top_k)
+        stats = predict_folder(recognizer, iter_images(args.folder, recursive=not args.no_recursive), writer,
+                               batch_size=args.batch_size, workers=args.workers, prefetch=args.prefetch,
+                               invert=args.invert, progress_s=args.progress)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Grad-CAM на ONNX Runtime, без TensorFlow.
+
+Использует вспомогательный граф, который строит utils/export_gradcam_onnx.py:
+он возвращает вероятности, активации последнего Conv2D и градиенты
+предсказанного класса по этим активациям. Дальше heatmap считается в NumPy
+так же, как GradCAM в utils/gradcam.py.
+"""
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from inference import GRADCAM_MODEL_FILENAME, SessionConfig, create_session, default_model_paths, resolve_model_path
+
+
+class GradCamExplainer:
+    """Heatmap'ы Grad-CAM для изображений 28x28 в [0, 1] через onnxruntime."""
+
+    def __init__(self, model_path: str, config: Optional[SessionConfig] = None):
+        self.model_path = model_path
+        self.session = create_session(model_path, config or SessionConfig())
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_shape = tuple(d if isinstance(d, int) else -1 for d in inp.shape)
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        missing = {"probs", "activations", "gradients"} - set(self.output_names)
+        if missing:
+            raise ValueError(f"В графе Grad-CAM нет выходов: {', '.join(sorted(missing))}")
+
+    @classmethod
+    def from_paths(cls, paths: Optional[Iterable[str]] = None, **kwargs) -> "GradCamExplainer":
+        p = resolve_model_path(list(paths) if paths is not None else default_model_paths(GRADCAM_MODEL_FILENAME))
+        if p is None:
+            raise FileNotFoundError(
+                f"Не найден {GRADCAM_MODEL_FILENAME}. Создайте его скриптом utils/export_gradcam_onnx.py."
+            )
+        return cls(p, **kwargs)
+
+    def explain_batch(self, images: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(N, 28, 28[, 1]) -> heatmap'ы (N, h, w) в [0, 1] и вероятности (N, классы)."""
+        x = np.asarray(images, dtype=np.float32).reshape((-1,) + self.input_shape[1:])
+        out = dict(zip(self.output_names, self.session.run(None, {self.input_name: x})))
+        acts, grads = out["activations"], out["gradients"]
+        weights = grads.mean(axis=(1, 2))
+        cams = np.maximum(np.einsum("nhwc,nc->nhw", acts, weights) / acts.shape[-1], 0)
+        peak = cams.max(axis=(1, 2), keepdims=True)
+        cams = np.divide(cams, peak, out=np.zeros_like(cams), where=peak > 0)
+        return cams, out["probs"]
+
+    def explain(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        heatmaps, probs = self.explain_batch(image)
+        return heatmaps[0], probs[0]
+
+
+def render_overlay(image: np.ndarray, heatmap: np.ndarray, size: int = 224, alpha: float = 0.4) -> np.ndarray:
+    """Наложение heatmap (цветовая карта JET) на изображение 28x28: (size, size, 3) uint8 RGB."""
+    import cv2
+    img = np.asarray(image, dtype=np.float32).reshape(28, 28)
+    gray = cv2.resize(np.uint8(255 * np.clip(img, 0, 1)), (size, size), interpolation=cv2.INTER_NEAREST)
+    heat = cv2.resize(np.asarray(heatmap, dtype=np.float32), (size, size), interpolation=cv2.INTER_LINEAR)
+    colored = cv2.applyColorMap(np.uint8(255 * np.clip(heat, 0, 1)), cv2.COLORMAP_JET)
+    colored = cv2.cvtColor(colored, cv2.COLOR_BGR2RGB)
+    return cv2.addWeighted(cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB), 1 - alpha, colored, alpha, 0)
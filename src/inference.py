@@ -0,0 +1,457 @@
+import hashlib
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+MODEL_FILENAME = "improved_digit_recognition_model.onnx"
+QUANTIZED_MODEL_FILENAME = "improved_digit_recognition_model.int8.onnx"
+# Маленькая модель-ученик из utils/distill.py — для случаев, где важна задержка
+STUDENT_MODEL_FILENAME = "student_digit_recognition_model.onnx"
+# Вспомогательный граф для Grad-CAM: вероятности, активации последнего Conv2D и их градиенты
+GRADCAM_MODEL_FILENAME = "improved_digit_recognition_model.gradcam.onnx"
+
+_GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+# ---------- Session config ----------
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name}: ожидается целое число, получено {value!r}") from None
+
+
+@dataclass
+class SessionConfig:
+    """Настройки ONNX Runtime для InferenceSession.
+
+    0 потоков означает значение ONNX Runtime по умолчанию. Если optimized_cache
+    включён, оптимизированный граф сохраняется в cache_dir при первой загрузке
+    и используется при следующих запусках без повторной оптимизации.
+    """
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    execution_mode: str = "sequential"
+    graph_optimization: str = "all"
+    enable_mem_arena: bool = True
+    enable_mem_pattern: bool = True
+    optimized_cache: bool = True
+    cache_dir: Optional[str] = None
+
+    def __post_init__(self):
+        if self.execution_mode not in _EXECUTION_MODES:
+            raise ValueError(f"execution_mode: ожидается одно из {sorted(_EXECUTION_MODES)}")
+        if self.graph_optimization not in _GRAPH_OPT_LEVELS:
+            raise ValueError(f"graph_optimization: ожидается одно из {sorted(_GRAPH_OPT_LEVELS)}")
+
+    @classmethod
+    def from_env(cls) -> "SessionConfig":
+        """Конфигурация из переменных окружения DIGIT_ORT_* (незаданные — по умолчанию).
+
+        Неверное значение даёт ValueError с именем переменной.
+        """
+        execution_mode = os.environ.get("DIGIT_ORT_EXECUTION_MODE", "sequential")
+        if execution_mode not in _EXECUTION_MODES:
+            raise ValueError(f"DIGIT_ORT_EXECUTION_MODE: ожидается одно из {sorted(_EXECUTION_MODES)}, "
+                             f"получено {execution_mode!r}")
+        graph_optimization = os.environ.get("DIGIT_ORT_GRAPH_OPT", "all")
+        if graph_optimization not in _GRAPH_OPT_LEVELS:
+            raise ValueError(f"DIGIT_ORT_GRAPH_OPT: ожидается одно из {sorted(_GRAPH_OPT_LEVELS)}, "
+                             f"получено {graph_optimization!r}")
+        return cls(
+            intra_op_threads=_env_int("DIGIT_ORT_INTRA_THREADS", 0),
+            inter_op_threads=_env_int("DIGIT_ORT_INTER_THREADS", 0),
+            execution_mode=execution_mode,
+            graph_optimization=graph_optimization,
+            enable_mem_arena=_env_bool("DIGIT_ORT_MEM_ARENA", True),
+            enable_mem_pattern=_env_bool("DIGIT_ORT_MEM_PATTERN", True),
+            optimized_cache=_env_bool("DIGIT_ORT_CACHE", True),
+            cache_dir=os.environ.get("DIGIT_ORT_CACHE_DIR") or None,
+        )
+
+    def session_options(self) -> ort.SessionOptions:
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = int(self.intra_op_threads)
+        opts.inter_op_num_threads = int(self.inter_op_threads)
+        opts.execution_mode = _EXECUTION_MODES[self.execution_mode]
+        opts.graph_optimization_level = _GRAPH_OPT_LEVELS[self.graph_optimization]
+        opts.enable_cpu_mem_arena = bool(self.enable_mem_arena)
+        opts.enable_mem_pattern = bool(self.enable_mem_pattern)
+        return opts
+
+    @property
+    def cache_level(self) -> str:
+        """Уровень оптимизации сохраняемого графа: не выше "extended".
+
+        Граф уровня "all" содержит раскладки и ядра под набор инструкций
+        конкретного процессора (AVX2, AVX-512, ...) — на другой машине с той же
+        архитектурой он может оказаться неверным, поэтому на диск не попадает.
+        """
+        return self.graph_optimization if self.graph_optimization in ("basic", "extended") else "extended"
+
+    def cache_path(self, model_path: str) -> str:
+        """Путь к оптимизированному графу; в имени — всё, от чего зависит результат оптимизации."""
+        cache_dir = self.cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "digit_recognizer")
+        st = os.stat(model_path)
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        key = f"{self.cache_level}-ort{ort.__version__}-{platform.machine()}-{st.st_size}-{int(st.st_mtime)}"
+        return os.path.join(cache_dir, f"{stem}.{key}.optimized.onnx")
+
+
+def create_session(model_path: str, config: Optional[SessionConfig] = None,
+                   providers: Optional[List[str]] = None) -> ort.InferenceSession:
+    """InferenceSession с настройками config и кэшем оптимизированного графа."""
+    config = config or SessionConfig()
+    providers = providers or ['CPUExecutionProvider']
+    opts = config.session_options()
+    if not config.optimized_cache or config.graph_optimization == "disable":
+        return ort.InferenceSession(model_path, sess_options=opts, providers=providers)
+
+    cached = config.cache_path(model_path)
+    if not os.path.exists(cached):
+        _save_optimized(model_path, cached, config, providers)
+    if os.path.exists(cached):
+        try:
+            # Сохранённый граф уже оптимизирован до config.cache_level: повторно его не трогаем,
+            # а аппаратно-зависимый уровень "all" доприменяется только в памяти
+            if config.graph_optimization != "all":
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return ort.InferenceSession(cached, sess_options=opts, providers=providers)
+        except Exception:
+            # Повреждённый или несовместимый кэш — удаляем, следующий запуск пересоздаст
+            os.remove(cached)
+    # Кэша нет (например, каталог только для чтения) — работаем без него
+    return ort.InferenceSession(model_path, sess_options=config.session_options(), providers=providers)
+
+
+def _save_optimized(model_path: str, cached: str, config: SessionConfig, providers: List[str]):
+    """Сохраняет граф, оптимизированный до config.cache_level, атомарно через временный файл."""
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        opts = config.session_options()
+        opts.graph_optimization_level = _GRAPH_OPT_LEVELS[config.cache_level]
+        opts.optimized_model_filepath = tmp
+        ort.InferenceSession(model_path, sess_options=opts, providers=providers)
+        os.replace(tmp, cached)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def make_session(model_path: str, threads: int) -> ort.InferenceSession:
+    """Сессия без кэша графа с фиксированным числом потоков — для замеров задержки."""
+    opts = SessionConfig(intra_op_threads=threads, inter_op_threads=1).session_options()
+    return ort.InferenceSession(model_path, sess_options=opts, providers=['CPUExecutionProvider'])
+
+
+def default_model_paths(filename: str = MODEL_FILENAME) -> List[str]:
+    """Кандидаты на файл модели в том же порядке, что и у приложения."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [
+        os.path.join(here, "resources", "models", filename),
+        os.path.join("resources", "models", filename),
+        filename,
+    ]
+
+
+def model_filenames(prefer_quantized: Optional[bool] = None, prefer_student: Optional[bool] = None) -> List[str]:
+    """Имена файлов модели в порядке предпочтения.
+
+    INT8-вариант (utils/quantize_model.py) идёт первым, если prefer_quantized
+    включён явно или через DIGIT_PREFER_QUANTIZED=1; модель-ученик
+    (utils/distill.py) — если prefer_student или DIGIT_PREFER_STUDENT=1.
+    Float-модель остаётся запасной.
+    """
+    if prefer_quantized is None:
+        prefer_quantized = _env_bool("DIGIT_PREFER_QUANTIZED", False)
+    if prefer_student is None:
+        prefer_student = _env_bool("DIGIT_PREFER_STUDENT", False)
+    names = []
+    if prefer_student:
+        names.append(STUDENT_MODEL_FILENAME)
+    if prefer_quantized:
+        names.append(QUANTIZED_MODEL_FILENAME)
+    return names + [MODEL_FILENAME]
+
+
+def resolve_model_path(paths: Iterable[str]) -> Optional[str]:
+    """Возвращает первый существующий путь из списка кандидатов (или None)."""
+    for p in paths:
+        if p and os.path.exists(p):
+            return p
+    return None
+
+
+# ---------- Timing ----------
+def percentiles(samples_ms) -> dict:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+    }
+
+
+def timed(fn, repeats: int, warmup: int = 3) -> list:
+    for _ in range(warmup):
+        fn()
+    out = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t) * 1000.0)
+    return out
+
+
+# ---------- Prediction cache ----------
+class PredictionCache:
+    """Ограниченный LRU-кэш вероятностей по хэшу предобработанного тензора 28x28."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max(1, int(max_size))
+        self._data: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tensor: np.ndarray) -> bytes:
+        t = np.ascontiguousarray(tensor, dtype=np.float32)
+        return hashlib.blake2b(t.tobytes(), digest_size=16, person=str(t.shape).encode()[:16]).digest()
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            probs = self._data.get(key)
+            if probs is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return probs
+
+    def put(self, key: bytes, probs: np.ndarray):
+        with self._lock:
+            self._data[key] = probs
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# ---------- Recognizer ----------
+class DigitRecognizer:
+    """Qt-независимая обёртка над ONNX InferenceSession с пакетным инференсом.
+
+    Принимает пачку изображений (N, 28, 28) или (N, 28, 28, 1) со значениями в [0, 1]
+    и возвращает вероятности (N, n_classes). Большие входы режутся на чанки по
+    batch_size, чтобы один session.run обслуживал сразу много изображений.
+    При cache_size > 0 одинаковые входы отвечаются из PredictionCache без инференса.
+    """
+
+    def __init__(self, model_path: str, batch_size: int = 256, providers: Optional[List[str]] = None,
+                 config: Optional[SessionConfig] = None, cache_size: int = 0):
+        if batch_size < 1:
+            raise ValueError("batch_size должен быть >= 1")
+        self.model_path = model_path
+        self.config = config or SessionConfig()
+        self.session = create_session(model_path, self.config, providers)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_rank = len(inp.shape)
+        # Ось батча у экспортированной модели динамическая ('unk__', None);
+        # если же она зафиксирована числом, подгоняем чанки под неё.
+        dim = inp.shape[0] if inp.shape else None
+        self.fixed_batch = dim if isinstance(dim, int) and dim > 0 else None
+        self.batch_size = self.fixed_batch or int(batch_size)
+        out_dim = self.session.get_outputs()[0].shape[-1]
+        self.n_classes = out_dim if isinstance(out_dim, int) else 10
+        self.cache = PredictionCache(cache_size) if cache_size > 0 else None
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str], **kwargs) -> "DigitRecognizer":
+        """Создаёт распознаватель из первого существующего файла модели."""
+        paths = list(paths)
+        p = resolve_model_path(paths)
+        if p is None:
+            raise FileNotFoundError("Не удалось загрузить ONNX модель. Проверьте пути.")
+        return cls(p, **kwargs)
+
+    def _to_input(self, images: np.ndarray) -> np.ndarray:
+        x = np.asarray(images, dtype=np.float32)
+        if x.ndim == 2:
+            x = x[None]
+        n = x.shape[0]
+        if self.input_rank == 4:
+            return x.reshape(n, 28, 28, 1)
+        return x.reshape(n, 28, 28)
+
+    def _run(self, chunk: np.ndarray) -> np.ndarray:
+        n = chunk.shape[0]
+        if self.fixed_batch is not None and n < self.fixed_batch:
+            # Дополняем нулями до фиксированного размера батча
+            pad = np.zeros((self.fixed_batch - n,) + chunk.shape[1:], dtype=np.float32)
+            chunk = np.concatenate([chunk, pad])
+        out = self.session.run(None, {self.input_name: chunk})[0]
+        return np.asarray(out, dtype=np.float32).reshape(chunk.shape[0], -1)[:n]
+
+    def predict_batch(self, images: np.ndarray, use_cache: bool = True) -> np.ndarray:
+        """Вероятности классов для пачки изображений: (N, 28, 28) -> (N, n_classes).
+
+        use_cache=False считает всё заново, не читая и не пополняя кэш (например, для замеров).
+        """
+        x = self._to_input(images)
+        if self.cache is None or not use_cache:
+            return self._predict_uncached(x)
+        keys = [self.cache.key(row) for row in x]
+        probs = np.empty((x.shape[0], self.n_classes), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                probs[i] = cached
+        if missing:
+            fresh = self._predict_uncached(x[missing])
+            for row, i in zip(fresh, missing):
+                probs[i] = row
+                self.cache.put(keys[i], row.copy())
+        return probs
+
+    def _predict_uncached(self, x: np.ndarray) -> np.ndarray:
+        n = x.shape[0]
+        probs = np.empty((n, self.n_classes), dtype=np.float32)
+        for start in range(0, n, self.batch_size):
+            stop = min(start + self.batch_size, n)
+            probs[start:stop] = self._run(np.ascontiguousarray(x[start:stop]))
+        # Нормализуем (на всякий случай), если суммы строк не 1
+        sums = probs.sum(axis=1, keepdims=True)
+        np.divide(probs, sums, out=probs, where=sums > 0)
+        return probs
+
+    def predict(self, image: np.ndarray) -> np.ndarray:
+        """Вероятности для одного изображения 28x28 -> (n_classes,)."""
+        return self.predict_batch(np.asarray(image).reshape(1, 28, 28))[0]
+
+
+# ---------- Test-time augmentation ----------
+class TtaBudget:
+    """Выбирает число TTA-вариантов K на изображение так, чтобы запрос укладывался в budget_ms.
+
+    Время session.run считается линейным по числу изображений в батче (a + b * n);
+    коэффициенты оцениваются по замерам во время работы — скользящему среднему
+    для каждого встреченного размера батча, — поэтому выбор подстраивается под
+    машину и её текущую загрузку. K берётся только из sizes.
+    """
+
+    def __init__(self, budget_ms: float, sizes: Sequence[int] = (1,), smoothing: float = 0.3):
+        self.budget_ms = float(budget_ms)
+        self.sizes = sorted({int(k) for k in sizes if int(k) >= 1}) or [1]
+        self.smoothing = float(smoothing)
+        self._ms: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, n_images: int, ms: float):
+        with self._lock:
+            prev = self._ms.get(n_images)
+            self._ms[n_images] = ms if prev is None else prev + self.smoothing * (ms - prev)
+
+    def estimate(self, n_images: int) -> Optional[float]:
+        """Ожидаемое время батча из n_images в мс (None, пока замеров нет)."""
+        with self._lock:
+            points = sorted(self._ms.items())
+        if not points:
+            return None
+        if len(points) == 1:
+            # По одной точке неизвестна постоянная часть — считаем время пропорциональным (с запасом)
+            n0, ms0 = points[0]
+            return ms0 * max(1.0, n_images / n0)
+        ns, ms = np.array(points, dtype=np.float64).T
+        slope, intercept = np.polyfit(ns, ms, 1)
+        return float(max(0.0, intercept + max(0.0, slope) * n_images))
+
+    def choose(self, n_inputs: int = 1) -> int:
+        """Наибольший K из sizes, при котором n_inputs * K изображений укладываются в бюджет."""
+        best = self.sizes[0]
+        for k in self.sizes[1:]:
+            expected = self.estimate(n_inputs * k)
+            if expected is None or expected > self.budget_ms:
+                break
+            best = k
+        return best
+
+    def calibrate(self, recognizer: "DigitRecognizer", repeats: int = 5):
+        """Начальные замеры для каждого K из sizes (медиана repeats прогонов, в обход кэша)."""
+        for k in self.sizes:
+            x = np.zeros((k, 28, 28), dtype=np.float32)
+            timings = []
+            for _ in range(repeats):
+                t = time.perf_counter()
+                recognizer.predict_batch(x, use_cache=False)
+                timings.append((time.perf_counter() - t) * 1000.0)
+            self.observe(k, float(np.median(timings)))
+
+    def predict(self, recognizer: "DigitRecognizer", images: np.ndarray,
+                make_variants: Callable[[np.ndarray, int], np.ndarray]) -> Tuple[np.ndarray, int]:
+        """Вероятности (N, n_classes), усреднённые по K вариантам каждого изображения, и выбранный K.
+
+        Все N * K вариантов уходят в один predict_batch; его время (вместе с
+        построением вариантов) идёт в замеры для следующих запросов.
+        """
+        images = np.asarray(images, dtype=np.float32).reshape(-1, 28, 28)
+        n = len(images)
+        k = self.choose(n)
+        if n == 0:
+            return np.zeros((0, recognizer.n_classes), dtype=np.float32), k
+        misses = recognizer.cache.misses if recognizer.cache is not None else None
+        t = time.perf_counter()
+        probs = recognizer.predict_batch(make_variants(images, k))
+        ms = (time.perf_counter() - t) * 1000.0
+        # Ответы из кэша не стоят инференса — учитываем только реально посчитанные строки
+        computed = n * k if misses is None else recognizer.cache.misses - misses
+        if computed:
+            self.observe(computed, ms)
+        return probs.reshape(n, k, -1).mean(axis=1), k
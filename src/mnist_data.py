@@ -0,0 +1,152 @@
+import gzip
+import os
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# Кэш хранится как несжатые uint8 .npy: они открываются через memmap мгновенно,
+# а страницы читаются с диска только при обращении к ним.
+DATA_DIR = os.environ.get("DIGIT_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".keras", "datasets", "mnist_npy")
+KERAS_NPZ = os.path.join(os.path.expanduser("~"), ".keras", "datasets", "mnist.npz")
+SPLITS = ("train", "test")
+# Имена файлов в исходном распространении MNIST (и совместимых наборах, например EMNIST)
+IDX_FILES = {
+    "train": ("train-images-idx3-ubyte", "train-labels-idx1-ubyte"),
+    "test": ("t10k-images-idx3-ubyte", "t10k-labels-idx1-ubyte"),
+}
+_IDX_DTYPES = {
+    0x08: np.uint8, 0x09: np.int8, 0x0B: np.dtype(">i2"),
+    0x0C: np.dtype(">i4"), 0x0D: np.dtype(">f4"), 0x0E: np.dtype(">f8"),
+}
+# Сколько изображений нормализуется и копируется за раз при потоковой обработке
+_CHUNK = 10000
+
+
+# ---------- Normalization ----------
+def normalize(images: np.ndarray) -> np.ndarray:
+    """uint8 -> float32 в [0, 1] одной аллокацией (без промежуточной float64-копии)."""
+    return np.divide(images, np.float32(255.0), dtype=np.float32)
+
+
+class MnistSplit:
+    """Часть набора: изображения (N, H, W) uint8 и метки (N,), обычно открытые через memmap."""
+
+    def __init__(self, images: np.ndarray, labels: np.ndarray):
+        if len(images) != len(labels):
+            raise ValueError(f"Изображений {len(images)}, меток {len(labels)}")
+        self.images = images
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def head(self, n: int) -> "MnistSplit":
+        return MnistSplit(self.images[:n], self.labels[:n])
+
+    def normalized(self, channel_axis: bool = False) -> np.ndarray:
+        """Весь набор во float32 — для небольших частей вроде теста."""
+        x = normalize(self.images)
+        return x[..., None] if channel_axis else x
+
+    def batches(self, batch_size: int = _CHUNK, channel_axis: bool = False) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Нормализованные батчи по порядку; в памяти одновременно только один батч."""
+        for i in range(0, len(self), batch_size):
+            x = normalize(self.images[i:i + batch_size])
+            yield (x[..., None] if channel_axis else x), np.asarray(self.labels[i:i + batch_size])
+
+
+# ---------- IDX ----------
+def _read_idx_header(f) -> Tuple[np.dtype, Tuple[int, ...], int]:
+    magic = f.read(4)
+    if len(magic) != 4 or magic[:2] != b"\x00\x00" or magic[2] not in _IDX_DTYPES:
+        raise ValueError("Файл не в формате IDX")
+    ndim = magic[3]
+    shape = tuple(int(d) for d in np.frombuffer(f.read(4 * ndim), dtype=">u4"))
+    return np.dtype(_IDX_DTYPES[magic[2]]), shape, 4 + 4 * ndim
+
+
+def read_idx(path: str) -> np.ndarray:
+    """Массив из IDX-файла: несжатый открывается через memmap, .gz читается целиком."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            dtype, shape, _ = _read_idx_header(f)
+            return np.frombuffer(f.read(), dtype=dtype).reshape(shape)
+    with open(path, "rb") as f:
+        dtype, shape, offset = _read_idx_header(f)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def _idx_to_npy(src: str, dst: str):
+    """Потоковая конвертация IDX (.gz или нет) в .npy кусками по _CHUNK записей."""
+    opener = gzip.open if src.endswith(".gz") else open
+    with opener(src, "rb") as f:
+        dtype, shape, _ = _read_idx_header(f)
+        row = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+        partial = dst + ".partial.npy"
+        out = np.lib.format.open_memmap(partial, mode="w+", dtype=dtype.newbyteorder("="), shape=shape)
+        for i in range(0, shape[0], _CHUNK):
+            n = min(_CHUNK, shape[0] - i)
+            chunk = np.frombuffer(f.read(row * n), dtype=dtype).reshape((n,) + shape[1:])
+            out[i:i + n] = chunk
+        out.flush()
+        del out
+    os.replace(partial, dst)
+
+
+def _find_idx(idx_dir: str, name: str) -> Optional[str]:
+    for candidate in (name, name + ".gz", name.replace("-idx", ".idx")):
+        path = os.path.join(idx_dir, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# ---------- Cache ----------
+def _paths(split: str, data_dir: str) -> Tuple[str, str]:
+    return os.path.join(data_dir, f"{split}_images.npy"), os.path.join(data_dir, f"{split}_labels.npy")
+
+
+def _save(path: str, array: np.ndarray):
+    partial = path + ".partial.npy"
+    np.save(partial, np.ascontiguousarray(array))
+    os.replace(partial, path)
+
+
+def prepare(data_dir: Optional[str] = None, idx_dir: Optional[str] = None) -> str:
+    """
+    Создаёт кэш .npy, если его ещё нет. Источник: каталог с IDX-файлами,
+    иначе mnist.npz из кэша Keras, иначе загрузка через Keras.
+    Уже созданный кэш не пересоздаётся: для другого набора нужен свой data_dir.
+    """
+    data_dir = data_dir or DATA_DIR
+    if all(os.path.exists(p) for split in SPLITS for p in _paths(split, data_dir)):
+        return data_dir
+    os.makedirs(data_dir, exist_ok=True)
+
+    if idx_dir:
+        for split in SPLITS:
+            for name, dst in zip(IDX_FILES[split], _paths(split, data_dir)):
+                src = _find_idx(idx_dir, name)
+                if src is None:
+                    raise FileNotFoundError(f"В '{idx_dir}' нет файла {name}[.gz]")
+                _idx_to_npy(src, dst)
+        return data_dir
+
+    if not os.path.exists(KERAS_NPZ):
+        # TensorFlow нужен только для первой загрузки
+        from tensorflow.keras.datasets import mnist
+        mnist.load_data()
+    with np.load(KERAS_NPZ) as f:
+        for split in SPLITS:
+            images_path, labels_path = _paths(split, data_dir)
+            _save(images_path, f[f"x_{split}"])
+            _save(labels_path, f[f"y_{split}"])
+    return data_dir
+
+
+def load(split: str, data_dir: Optional[str] = None, idx_dir: Optional[str] = None) -> MnistSplit:
+    """Часть "train" или "test" из кэша, открытая через memmap (кэш создаётся при первом вызове)."""
+    if split not in SPLITS:
+        raise ValueError(f"Неизвестная часть набора: {split}")
+    images_path, labels_path = _paths(split, prepare(data_dir, idx_dir))
+    return MnistSplit(np.load(images_path, mmap_mode="r"), np.load(labels_path, mmap_mode="r"))
@@ -0,0 +1,400 @@
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Точность фиксированной запятой, с которой PIL считает ресэмплинг 8-битных изображений
+_PRECISION_BITS = 32 - 8 - 2
+# Сколько полноразмерных холстов уменьшается за одно матричное умножение:
+# небольшие чанки держат float64-промежуточные данные в кэше процессора
+_RESIZE_CHUNK = 4
+# Векторные штрихи рисуются в сетке 28*_SUPERSAMPLE и усредняются по площади до 28x28;
+# координаты передаются в OpenCV с _SUBPIXEL_BITS дробными битами
+_SUPERSAMPLE = 8
+_SUBPIXEL_BITS = 4
+# Несколько цифр на холсте: связная область меньше этой доли холста — шум, а не цифра;
+# области, проекции которых на ось X перекрываются больше чем на _MERGE_OVERLAP
+# ширины более узкой, — части одной цифры (например, «4» или «5» из двух штрихов)
+_MIN_COMPONENT_AREA = 0.001
+_MERGE_OVERLAP = 0.5
+# Цифра занимает такую долю кадра по длинной стороне (как в MNIST: 20 из 28 пикселей);
+# кадры приводятся к стороне _DIGIT_CANVAS и проходят обычную preprocess_batch
+_DIGIT_FILL = 0.7
+_DIGIT_CANVAS = 112
+# Варианты для усреднения при распознавании (TTA): ("rotate", градусы), ("dilate"/"erode", ядро).
+# Идут симметричными парами, поэтому K берётся из TTA_SIZES — несимметричный набор
+# смещает среднее. Сдвиги не используются: их уже убирает центрирование по центру масс
+TTA_TRANSFORMS = (("identity",), ("rotate", -5.0), ("rotate", 5.0), ("dilate", 2), ("erode", 2))
+TTA_SIZES = (1, 3, 5)
+
+
+# ---------- Single image (reference) ----------
+# PIL, cv2 и scipy нужны только эталонному пути и импортируются при первом вызове:
+# preprocess_batch обходится одним NumPy, а приложение так быстрее стартует.
+class _StageClock:
+    """Накапливает длительность этапов (мс) в переданный словарь; без словаря ничего не делает."""
+
+    def __init__(self, timings: Optional[Dict[str, float]]):
+        self.timings = timings
+        self._last = time.perf_counter() if timings is not None else 0.0
+
+    def mark(self, stage: str):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._last) * 1000.0
+        self._last = now
+
+
+def get_best_shift(img: np.ndarray) -> Tuple[int, int]:
+    from scipy import ndimage
+    cy, cx = ndimage.center_of_mass(img)
+    rows, cols = img.shape
+    shiftx = int(np.round(cols / 2.0 - cx))
+    shifty = int(np.round(rows / 2.0 - cy))
+    return shiftx, shifty
+
+
+def shift(img: np.ndarray, sx: int, sy: int) -> np.ndarray:
+    import cv2
+    rows, cols = img.shape
+    M = np.float32([[1, 0, sx], [0, 1, sy]])
+    shifted = cv2.warpAffine(img, M, (cols, rows))
+    return shifted
+
+
+def preprocess_canvas(canvas: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Один холст (H, W) uint8, белый фон и чёрные штрихи -> тензор (1, 28, 28, 1) float32.
+
+    Если передан словарь timings, в него добавляется время каждого этапа в мс.
+    """
+    from PIL import Image, ImageOps
+    clock = _StageClock(timings)
+    pil = Image.fromarray(np.ascontiguousarray(canvas, dtype=np.uint8))
+    img_resized = pil.resize((28, 28), Image.LANCZOS)
+    clock.mark("resize")
+    img_array = np.array(img_resized).astype(np.uint8)
+    img_array = 255 - img_array
+    img_array = img_array / 255.0
+    img_pil = Image.fromarray((img_array * 255).astype(np.uint8))
+    clock.mark("invert")
+    bbox = ImageOps.invert(img_pil).getbbox()
+    clock.mark("bbox")
+    if bbox:
+        img_cropped = img_pil.crop(bbox)
+        img_pil = ImageOps.pad(img_cropped, (28, 28), color=0)
+        img_array = np.array(img_pil) / 255.0
+    clock.mark("crop_pad")
+    shiftx, shifty = get_best_shift(img_array)
+    clock.mark("center_of_mass")
+    img_array = shift(img_array, shiftx, shifty)
+    img_array = img_array.reshape(1, 28, 28, 1).astype(np.float32)
+    clock.mark("shift")
+    return img_array
+
+
+# ---------- Resampling (PIL-compatible) ----------
+def _lanczos(x: np.ndarray) -> np.ndarray:
+    # np.sinc(x) == sin(pi*x) / (pi*x), как sinc_filter в PIL
+    return np.where((x >= -3.0) & (x < 3.0), np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+
+def _bicubic(x: np.ndarray) -> np.ndarray:
+    a = -0.5
+    x = np.abs(x)
+    near = ((a + 2.0) * x - (a + 3.0)) * x * x + 1
+    far = (((x - 5) * x + 8) * x - 4) * a
+    return np.where(x < 1.0, near, np.where(x < 2.0, far, 0.0))
+
+
+_FILTERS = {
+    "lanczos": (_lanczos, 3.0),
+    "bicubic": (_bicubic, 2.0),
+}
+
+
+@lru_cache(maxsize=64)
+def _resample_weights(in_size: int, out_size: int, method: str) -> np.ndarray:
+    """Матрица (out_size, in_size) целочисленных весов ресэмплинга PIL (precompute_coeffs)."""
+    kernel, base_support = _FILTERS[method]
+    scale = filterscale = in_size / out_size
+    if filterscale < 1.0:
+        filterscale = 1.0
+    support = base_support * filterscale
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+        k = kernel((np.arange(xmin, xmax) - center + 0.5) * (1.0 / filterscale))
+        ww = k.sum()
+        if ww != 0.0:
+            k = k / ww
+        # normalize_coeffs_8bpc: округление к фиксированной запятой
+        weights[xx, xmin:xmax] = np.where(k < 0, np.trunc(-0.5 + k * (1 << _PRECISION_BITS)),
+                                          np.trunc(0.5 + k * (1 << _PRECISION_BITS)))
+    weights.flags.writeable = False
+    return weights
+
+
+def _clip8(acc: np.ndarray) -> np.ndarray:
+    # Аккумулятор точный (целые числа < 2**53 во float64), поэтому сдвиг == floor-деление
+    return np.clip(np.floor((acc + (1 << (_PRECISION_BITS - 1))) / (1 << _PRECISION_BITS)), 0, 255)
+
+
+def _resize_batch(batch: np.ndarray, out_h: int, out_w: int, method: str) -> np.ndarray:
+    """Ресэмплинг пачки (N, H, W) uint8 бит-в-бит как Image.resize: горизонтальный, затем вертикальный проход."""
+    n, h, w = batch.shape
+    out = batch.astype(np.float64)
+    if out_w != w:
+        out = _clip8(out @ _resample_weights(w, out_w, method).T)
+    if out_h != h:
+        out = _clip8(_resample_weights(h, out_h, method) @ out)
+    return out.astype(np.uint8)
+
+
+# ---------- Batch ----------
+def _bbox(mask: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Покадровый аналог getbbox: (has, top, bottom, left, right) для маски (N, H, W)."""
+    rows = mask.any(axis=2)
+    cols = mask.any(axis=1)
+    has = rows.any(axis=1)
+    top = rows.argmax(axis=1)
+    bottom = rows.shape[1] - rows[:, ::-1].argmax(axis=1)
+    left = cols.argmax(axis=1)
+    right = cols.shape[1] - cols[:, ::-1].argmax(axis=1)
+    return has, top, bottom, left, right
+
+
+def _contain_size(ch: int, cw: int, size: int = 28) -> Tuple[int, int]:
+    """Размер (h, w) после ImageOps.contain(crop, (size, size))."""
+    im_ratio = cw / ch
+    if im_ratio > 1.0:
+        return round(ch / cw * size), size
+    if im_ratio < 1.0:
+        return size, round(cw / ch * size)
+    return size, size
+
+
+def _crop_pad(imgs: np.ndarray, has: np.ndarray, top: np.ndarray, bottom: np.ndarray,
+              left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Обрезка по bbox и ImageOps.pad до 28x28 для всех кадров сразу.
+
+    Кадры, у которых bbox совпадает со всем изображением, не меняются; остальные
+    группируются по размеру обрезки и ресэмплируются одной матричной операцией на группу.
+    """
+    out = imgs.copy()
+    ch = bottom - top
+    cw = right - left
+    partial = np.nonzero(has & ((ch != 28) | (cw != 28)))[0]
+    if partial.size == 0:
+        return out
+    sizes = np.stack([ch[partial], cw[partial]], axis=1)
+    for gh, gw in np.unique(sizes, axis=0):
+        idx = partial[(sizes[:, 0] == gh) & (sizes[:, 1] == gw)]
+        rr = top[idx, None] + np.arange(gh)
+        cc = left[idx, None] + np.arange(gw)
+        crops = imgs[idx[:, None, None], rr[:, :, None], cc[:, None, :]]
+        nh, nw = _contain_size(int(gh), int(gw))
+        resized = _resize_batch(crops, nh, nw, "bicubic")
+        padded = np.zeros((idx.size, 28, 28), dtype=np.uint8)
+        y = round((28 - nh) * 0.5) if nw == 28 else 0
+        x = round((28 - nw) * 0.5) if nw != 28 else 0
+        padded[:, y:y + nh, x:x + nw] = resized
+        out[idx] = padded
+    return out
+
+
+def _center_shifts(imgs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Сдвиги (sx, sy), переносящие центр масс каждого кадра в центр; у пустых кадров — 0."""
+    n, rows, cols = imgs.shape
+    total = imgs.sum(axis=(1, 2))
+    safe = np.where(total > 0, total, 1.0)
+    cy = (imgs.sum(axis=2) * np.arange(rows)).sum(axis=1) / safe
+    cx = (imgs.sum(axis=1) * np.arange(cols)).sum(axis=1) / safe
+    sx = np.where(total > 0, np.round(cols / 2.0 - cx), 0).astype(np.int64)
+    sy = np.where(total > 0, np.round(rows / 2.0 - cy), 0).astype(np.int64)
+    return sx, sy
+
+
+def _shift_batch(imgs: np.ndarray, sx: np.ndarray, sy: np.ndarray) -> np.ndarray:
+    """Целочисленный сдвиг каждого кадра с нулевым заполнением (как warpAffine с BORDER_CONSTANT)."""
+    n, rows, cols = imgs.shape
+    src_r = np.arange(rows)[None, :] - sy[:, None]
+    src_c = np.arange(cols)[None, :] - sx[:, None]
+    valid = ((src_r >= 0) & (src_r < rows))[:, :, None] & ((src_c >= 0) & (src_c < cols))[:, None, :]
+    gathered = imgs[np.arange(n)[:, None, None],
+                    np.clip(src_r, 0, rows - 1)[:, :, None],
+                    np.clip(src_c, 0, cols - 1)[:, None, :]]
+    return np.where(valid, gathered, 0.0)
+
+
+def preprocess_batch(canvases: np.ndarray) -> np.ndarray:
+    """Векторизованный аналог preprocess_canvas для пачки холстов (N, H, W) uint8.
+
+    Выполняет те же шаги (LANCZOS-уменьшение, инверсия, обрезка по bbox, pad,
+    сдвиг центра масс в центр) над всей пачкой массивными операциями и
+    возвращает (N, 28, 28, 1) float32. Пустые холсты дают нулевой тензор.
+    """
+    x = np.asarray(canvases, dtype=np.uint8)
+    if x.ndim == 2:
+        x = x[None]
+    n = x.shape[0]
+    if n == 0:
+        return np.zeros((0, 28, 28, 1), dtype=np.float32)
+    small = np.empty((n, 28, 28), dtype=np.uint8)
+    for start in range(0, n, _RESIZE_CHUNK):
+        small[start:start + _RESIZE_CHUNK] = _resize_batch(x[start:start + _RESIZE_CHUNK], 28, 28, "lanczos")
+    inv = 255 - small
+    # ImageOps.invert(img).getbbox() в исходном пути == bbox пикселей, не равных 255
+    inv = _crop_pad(inv, *_bbox(inv != 255))
+    img = inv / 255.0
+    sx, sy = _center_shifts(img)
+    img = _shift_batch(img, sx, sy)
+    return img.reshape(n, 28, 28, 1).astype(np.float32)
+
+
+# ---------- Vector strokes ----------
+def strokes_to_payload(strokes: Sequence[np.ndarray], widths: Sequence[float], size: int) -> dict:
+    """Штрихи (K, 2) в пикселях холста size x size и толщины кисти -> компактный JSON-совместимый словарь."""
+    return {
+        "size": int(size),
+        "strokes": [{"width": float(w), "points": np.round(np.asarray(pts), 1).tolist()}
+                    for pts, w in zip(strokes, widths)],
+    }
+
+
+def strokes_from_payload(payload: dict) -> Tuple[List[np.ndarray], List[float], int]:
+    """Обратное к strokes_to_payload: (штрихи float32 (K, 2), толщины, сторона холста)."""
+    size = int(payload.get("size", 0))
+    if size <= 0:
+        raise ValueError("ожидается поле 'size' — сторона холста в пикселях")
+    strokes, widths = [], []
+    for stroke in payload.get("strokes", []):
+        pts = np.asarray(stroke["points"], dtype=np.float32).reshape(-1, 2)
+        width = float(stroke["width"])
+        if len(pts) == 0 or not width > 0:
+            raise ValueError("штрих должен содержать точки и положительную толщину")
+        strokes.append(pts)
+        widths.append(width)
+    return strokes, widths, size
+
+
+def rasterize_strokes(strokes: Sequence[np.ndarray], widths: Sequence[float], size: int) -> np.ndarray:
+    """Векторные штрихи холста size x size -> тензор (1, 28, 28, 1) float32.
+
+    Та же геометрия, что у preprocess_canvas (весь холст уменьшается до 28x28,
+    затем центр масс сдвигается в центр), но без холста в полном разрешении:
+    штрихи рисуются сразу в сетке 28x28 с _SUPERSAMPLE^2 отсчётами на пиксель
+    и усредняются по площади — доля покрытия пикселя кистью и есть его яркость.
+    """
+    import cv2
+    grid = 28 * _SUPERSAMPLE
+    scale = grid / size
+    ink = np.zeros((grid, grid), dtype=np.uint8)
+    for pts, w in zip(strokes, widths):
+        pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+        if len(pts) == 0:
+            continue
+        # Центры пикселей холста -> центры пикселей сетки, в фиксированной точке с _SUBPIXEL_BITS
+        fixed = np.round(((pts + 0.5) * scale - 0.5) * (1 << _SUBPIXEL_BITS)).astype(np.int32)
+        # Толстая линия OpenCV выходит шире заданной толщины: с поправкой доля чернил совпадает с QPainter
+        thickness = max(1, int(round(w * scale)) - 1)
+        if len(fixed) == 1:
+            # Нажатие без движения — круглая точка диаметром в кисть
+            cv2.circle(ink, tuple(int(v) for v in fixed[0]), int(w * scale / 2 * (1 << _SUBPIXEL_BITS)),
+                       255, -1, cv2.LINE_8, _SUBPIXEL_BITS)
+            continue
+        # Толстые линии OpenCV рисует с круглыми концами и стыками, как кисть DrawingWidget
+        cv2.polylines(ink, [fixed.reshape(-1, 1, 2)], False, 255, thickness, cv2.LINE_8, _SUBPIXEL_BITS)
+    img = cv2.resize(ink, (28, 28), interpolation=cv2.INTER_AREA)[None] / 255.0
+    sx, sy = _center_shifts(img)
+    img = _shift_batch(img, sx, sy)
+    return img.reshape(1, 28, 28, 1).astype(np.float32)
+
+
+# ---------- Multiple digits ----------
+def _group_components(stats: np.ndarray, min_area: int) -> List[List[int]]:
+    """Связные области -> группы (цифры) слева направо по перекрытию проекций на ось X."""
+    import cv2
+    order = [i for i in np.argsort(stats[1:, cv2.CC_STAT_LEFT]) + 1 if stats[i, cv2.CC_STAT_AREA] >= min_area]
+    groups, spans = [], []
+    for i in order:
+        left = stats[i, cv2.CC_STAT_LEFT]
+        right = left + stats[i, cv2.CC_STAT_WIDTH]
+        if spans:
+            g_left, g_right = spans[-1]
+            overlap = min(right, g_right) - max(left, g_left)
+            if overlap > _MERGE_OVERLAP * min(right - left, g_right - g_left):
+                groups[-1].append(i)
+                spans[-1] = (min(left, g_left), max(right, g_right))
+                continue
+        groups.append([i])
+        spans.append((left, right))
+    return groups
+
+
+def segment_digits(canvas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Холст (H, W) uint8 с несколькими цифрами -> ((N, 28, 28, 1) float32, рамки (N, 4) x, y, w, h).
+
+    Цифры — связные области штрихов (cv2.connectedComponentsWithStats), идут
+    слева направо. Каждая вырезается без соседей в квадратный кадр и проходит
+    ту же предобработку, что и одиночная цифра (preprocess_batch), — все кадры
+    одной пачкой, чтобы распознать их одним вызовом модели.
+    """
+    import cv2
+    canvas = np.asarray(canvas, dtype=np.uint8)
+    # Сглаженные края штрихов тоже считаются чернилами, иначе тонкие места рвут цифру
+    n, labels, stats, _ = cv2.connectedComponentsWithStats((canvas < 250).astype(np.uint8), connectivity=8)
+    groups = _group_components(stats, max(1, int(_MIN_COMPONENT_AREA * canvas.size)))
+    if not groups:
+        return np.zeros((0, 28, 28, 1), dtype=np.float32), np.zeros((0, 4), dtype=np.int64)
+
+    frames, boxes = [], []
+    for members in groups:
+        x0 = min(stats[i, cv2.CC_STAT_LEFT] for i in members)
+        y0 = min(stats[i, cv2.CC_STAT_TOP] for i in members)
+        x1 = max(stats[i, cv2.CC_STAT_LEFT] + stats[i, cv2.CC_STAT_WIDTH] for i in members)
+        y1 = max(stats[i, cv2.CC_STAT_TOP] + stats[i, cv2.CC_STAT_HEIGHT] for i in members)
+        h, w = y1 - y0, x1 - x0
+        # Штрихи соседних цифр, попавшие в рамку, закрашиваем фоном
+        own = np.isin(labels[y0:y1, x0:x1], members)
+        digit = np.where(own, canvas[y0:y1, x0:x1], 255).astype(np.uint8)
+        side = int(np.ceil(max(h, w) / _DIGIT_FILL))
+        frame = np.full((side, side), 255, dtype=np.uint8)
+        top, left = (side - h) // 2, (side - w) // 2
+        frame[top:top + h, left:left + w] = digit
+        frames.append(cv2.resize(frame, (_DIGIT_CANVAS, _DIGIT_CANVAS), interpolation=cv2.INTER_AREA))
+        boxes.append((x0, y0, w, h))
+    return preprocess_batch(np.stack(frames)), np.array(boxes, dtype=np.int64)
+
+
+# ---------- Test-time augmentation ----------
+def _tta_transform(img: np.ndarray, transform: tuple) -> np.ndarray:
+    import cv2
+    kind = transform[0]
+    if kind == "identity":
+        return img
+    if kind in ("dilate", "erode"):
+        kernel = np.ones((transform[1], transform[1]), dtype=np.uint8)
+        return cv2.dilate(img, kernel) if kind == "dilate" else cv2.erode(img, kernel)
+    if kind == "rotate":
+        m = cv2.getRotationMatrix2D((13.5, 13.5), transform[1], 1.0)
+        return cv2.warpAffine(img, m, (28, 28), flags=cv2.INTER_LINEAR, borderValue=0)
+    raise ValueError(f"Неизвестное преобразование TTA: {kind}")
+
+
+def tta_variants(images: np.ndarray, k: int) -> np.ndarray:
+    """(N, 28, 28[, 1]) float32 -> (N * k, 28, 28, 1): первые k из TTA_TRANSFORMS для каждого изображения.
+
+    Варианты одного изображения идут подряд, так что среднее по ним —
+    reshape(N, k, -1).mean(axis=1).
+    """
+    k = max(1, min(int(k), len(TTA_TRANSFORMS)))
+    imgs = np.asarray(images, dtype=np.float32).reshape(-1, 28, 28)
+    out = np.empty((len(imgs), k, 28, 28), dtype=np.float32)
+    for i, img in enumerate(imgs):
+        for j, transform in enumerate(TTA_TRANSFORMS[:k]):
+            out[i, j] = _tta_transform(img, transform)
+    return out.reshape(-1, 28, 28, 1)
@@ -0,0 +1,291 @@
+"""Локальный HTTP-сервер распознавания цифр с динамическим микробатчингом.
+
+Работает без Qt: только стандартная библиотека, onnxruntime и та же
+предобработка, что и в приложении. Запросы, пришедшие в пределах короткого
+окна, объединяются в один session.run.
+
+    python server.py --port 8000 --window-ms 5 --max-batch 64
+
+POST /predict?k=3
+    Content-Type: application/json  {"image": [[...28x28...]]} или {"images": [...]}
+        значения в [0, 1]; для других диапазонов — "max_value", например {"images": [...], "max_value": 255}
+    Content-Type: application/json  {"size": 340, "strokes": [{"width": 16, "points": [[x, y], ...]}, ...]}
+        векторные штрихи холста size x size (DrawingWidget.get_strokes)
+    Content-Type: image/png         сырой PNG холста (белый фон, чёрные штрихи)
+GET /health
+
+k — число вариантов в top_k (не меньше 1; больше числа классов — все классы).
+Тело запроса больше --max-body-kb отклоняется с кодом 413 до чтения; неверный k,
+NaN/inf или значения вне диапазона — с кодом 400.
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+from inference import DigitRecognizer, SessionConfig, default_model_paths, model_filenames
+from preprocessing import preprocess_batch, rasterize_strokes, strokes_from_payload
+
+# Предел тела запроса по умолчанию: PNG холста и JSON с пачкой 28x28 укладываются с большим запасом
+MAX_BODY_BYTES = 4 * 1024 * 1024
+
+
+# ---------- Micro-batching ----------
+class MicroBatcher:
+    """Склеивает запросы, пришедшие в течение window_ms, в один вызов predict_batch."""
+
+    def __init__(self, recognizer: DigitRecognizer, max_batch: int = 64, window_ms: float = 5.0):
+        self.recognizer = recognizer
+        self.max_batch = max(1, int(max_batch))
+        self.window = max(0.0, window_ms) / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[np.ndarray, Future, float]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, images: np.ndarray) -> Future:
+        """Ставит пачку (k, 28, 28) в очередь; Future вернёт (probs, timings)."""
+        fut: Future = Future()
+        self._queue.put((np.asarray(images, dtype=np.float32), fut, time.perf_counter()))
+        return fut
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first) -> List[Tuple[np.ndarray, Future, float]]:
+        items = [first]
+        total = len(first[0])
+        deadline = time.perf_counter() + self.window
+        while total < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Сигнал остановки обработаем после текущего батча
+                self._queue.put(None)
+                break
+            items.append(item)
+            total += len(item[0])
+        return items
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            items = self._collect(first)
+            start = time.perf_counter()
+            try:
+                probs = self.recognizer.predict_batch(np.concatenate([it[0] for it in items]))
+            except Exception as e:
+                for _, fut, _ in items:
+                    fut.set_exception(e)
+                continue
+            inference_ms = (time.perf_counter() - start) * 1000.0
+            offset = 0
+            for images, fut, enqueued in items:
+                n = len(images)
+                fut.set_result((probs[offset:offset + n], {
+                    "queue_ms": (start - enqueued) * 1000.0,
+                    "inference_ms": inference_ms,
+                    "batch_size": len(probs),
+                }))
+                offset += n
+
+
+# ---------- Request decoding ----------
+def decode_arrays(payload: dict) -> np.ndarray:
+    """JSON {"image": 28x28} / {"images": [28x28, ...]} -> (k, 28, 28) float32 в [0, 1].
+
+    Масштаб задаётся явно полем "max_value" (по умолчанию 1.0), а не угадывается
+    по значениям: холст 0/255, на котором всё 0 и 1, иначе не отличить от [0, 1].
+    """
+    if "images" in payload:
+        arr = np.asarray(payload["images"], dtype=np.float32)
+    elif "image" in payload:
+        arr = np.asarray(payload["image"], dtype=np.float32)[None]
+    else:
+        raise ValueError("ожидается поле 'image' или 'images'")
+    if arr.size == 0 or arr.size % (28 * 28) != 0:
+        raise ValueError(f"ожидаются массивы 28x28, получено {arr.shape}")
+    arr = arr.reshape(-1, 28, 28)
+    max_value = float(payload.get("max_value", 1.0))
+    if not np.isfinite(max_value) or max_value <= 0:
+        raise ValueError("'max_value' должно быть положительным конечным числом")
+    # NaN не ловится сравнениями ниже — проверяем отдельно
+    if not np.isfinite(arr).all():
+        raise ValueError("значения должны быть конечными числами")
+    if arr.min() < 0 or arr.max() > max_value:
+        raise ValueError(f"значения вне [0, {max_value:g}]; для другого диапазона укажите 'max_value'")
+    if max_value != 1.0:
+        arr = arr / np.float32(max_value)
+    return arr
+
+
+def decode_strokes(payload: dict) -> np.ndarray:
+    """JSON со штрихами -> (1, 28, 28) float32 той же растеризацией, что и в приложении."""
+    return rasterize_strokes(*strokes_from_payload(payload)).reshape(-1, 28, 28)
+
+
+def decode_png(body: bytes) -> np.ndarray:
+    """PNG холста -> (1, 28, 28) float32 той же предобработкой, что и в приложении."""
+    canvas = np.array(Image.open(io.BytesIO(body)).convert("L"))
+    return preprocess_batch(canvas).reshape(-1, 28, 28)
+
+
+def top_k(probs: np.ndarray, k: int) -> List[dict]:
+    idx = np.argsort(probs)[::-1][:k]
+    return [{"digit": int(i), "prob": float(probs[i])} for i in idx]
+
+
+# ---------- HTTP ----------
+class PredictHandler(BaseHTTPRequestHandler):
+    server_version = "DigitRecognizer/1.0"
+    batcher: MicroBatcher = None  # type: ignore  # задаётся в make_server
+    max_body: int = MAX_BODY_BYTES
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            recognizer = self.batcher.recognizer
+            self._reply(200, {
+                "status": "ok",
+                "model": recognizer.model_path,
+                "cache": recognizer.cache.stats() if recognizer.cache is not None else None,
+            })
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            self._reply(404, {"error": "not found"})
+            return
+        t0 = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0 or length > self.max_body:
+                # Тело не читаем: соединение закрывается, чтобы остаток не приняли за следующий запрос
+                self.close_connection = True
+                self._reply(413, {"error": f"тело запроса больше {self.max_body} байт"})
+                return
+            body = self.rfile.read(length)
+            k = int(parse_qs(url.query).get("k", ["3"])[0])
+            if k < 1:
+                raise ValueError("'k' должно быть не меньше 1")
+            ctype = self.headers.get("Content-Type", "")
+            if ctype.startswith("image/"):
+                images = decode_png(body)
+            else:
+                payload = json.loads(body)
+                images = decode_strokes(payload) if "strokes" in payload else decode_arrays(payload)
+        except Exception as e:
+            self._reply(400, {"error": str(e)})
+            return
+        t1 = time.perf_counter()
+        try:
+            probs, timings = self.batcher.submit(images).result()
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        t2 = time.perf_counter()
+        self._reply(200, {
+            "predictions": [{"digit": int(np.argmax(p)), "top_k": top_k(p, k)} for p in probs],
+            "batch_size": timings["batch_size"],
+            "latency_ms": {
+                "decode": (t1 - t0) * 1000.0,
+                "queue": timings["queue_ms"],
+                "inference": timings["inference_ms"],
+                "total": (t2 - t0) * 1000.0,
+            },
+        })
+
+
+def make_server(recognizer: DigitRecognizer, host: str = "127.0.0.1", port: int = 8000,
+                max_batch: int = 64, window_ms: float = 5.0, max_body: int = MAX_BODY_BYTES) -> ThreadingHTTPServer:
+    batcher = MicroBatcher(recognizer, max_batch=max_batch, window_ms=window_ms)
+    handler = type("BoundPredictHandler", (PredictHandler,), {"batcher": batcher, "max_body": int(max_body)})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сервер распознавания цифр (ONNX)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", help="путь к .onnx (по умолчанию — как в приложении)")
+    parser.add_argument("--quantized", action="store_true", default=None,
+                        help="предпочитать INT8-модель, если она есть (или DIGIT_PREFER_QUANTIZED=1)")
+    parser.add_argument("--student", action="store_true", default=None,
+                        help="предпочитать модель-ученик, если она есть (или DIGIT_PREFER_STUDENT=1)")
+    parser.add_argument("--max-batch", type=int, default=64, help="максимум изображений в одном session.run")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="окно ожидания для склейки запросов")
+    parser.add_argument("--max-body-kb", type=int, default=MAX_BODY_BYTES // 1024,
+                        help="предел размера тела запроса; больше — ответ 413")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="размер LRU-кэша результатов по входному тензору (0 — без кэша)")
+    # Настройки ONNX Runtime; по умолчанию берутся из переменных окружения DIGIT_ORT_*
+    env = SessionConfig.from_env()
+    parser.add_argument("--intra-threads", type=int, default=env.intra_op_threads, help="0 — по умолчанию ORT")
+    parser.add_argument("--inter-threads", type=int, default=env.inter_op_threads)
+    parser.add_argument("--execution-mode", choices=["sequential", "parallel"], default=env.execution_mode)
+    parser.add_argument("--graph-opt", choices=["disable", "basic", "extended", "all"], default=env.graph_optimization)
+    parser.add_argument("--no-mem-arena", action="store_true", help="отключить CPU memory arena")
+    parser.add_argument("--no-optimized-cache", action="store_true", help="не кэшировать оптимизированный граф")
+    parser.add_argument("--cache-dir", default=env.cache_dir)
+    args = parser.parse_args()
+
+    config = SessionConfig(
+        intra_op_threads=args.intra_threads,
+        inter_op_threads=args.inter_threads,
+        execution_mode=args.execution_mode,
+        graph_optimization=args.graph_opt,
+        enable_mem_arena=env.enable_mem_arena and not args.no_mem_arena,
+        enable_mem_pattern=env.enable_mem_pattern,
+        optimized_cache=env.optimized_cache and not args.no_optimized_cache,
+        cache_dir=args.cache_dir,
+    )
+    if args.model:
+        paths = [args.model]
+    else:
+        paths = [p for name in model_filenames(args.quantized, args.student) for p in default_model_paths(name)]
+    recognizer = DigitRecognizer.from_paths(paths, batch_size=args.max_batch, config=config,
+                                             cache_size=args.cache_size)
+    httpd = make_server(recognizer, args.host, args.port, args.max_batch, args.window_ms, args.max_body_kb * 1024)
+    print(f"Модель: {recognizer.model_path}")
+    print(f"Сервер слушает http://{args.host}:{args.port} (окно {args.window_ms} мс, батч до {args.max_batch})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        httpd.RequestHandlerClass.batcher.close()
+
+
+if __name__ == "__main__":
+    main()
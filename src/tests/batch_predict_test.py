@@ -0,0 +1,49 @@
+import io
+import json
+import os
+import sys
+
+import cv2
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "utils"))
+
+from batch_predict import ResultWriter, iter_images, predict_folder  # noqa: E402
+from benchmark import render_samples  # noqa: E402
+from inference import DigitRecognizer, MODEL_FILENAME, SessionConfig  # noqa: E402
+
+MODEL_PATH = os.path.join(SRC_DIR, "resources", "models", MODEL_FILENAME)
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="нет ONNX-модели")
+@pytest.mark.parametrize("workers", [0, 2])
+def test_predict_folder_streams_fixed_batches(tmp_path, workers):
+    canvases, labels = render_samples()
+    (tmp_path / "sub").mkdir()
+    for i, (canvas, label) in enumerate(zip(canvases, labels)):
+        folder = tmp_path / "sub" if i % 2 else tmp_path
+        cv2.imwrite(str(folder / f"{i:02d}_{label}.png"), canvas)
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    # Битый файл посреди папки: между распознанными файлами одного батча
+    (tmp_path / "04_bad.png").write_bytes(b"not an image either")
+
+    recognizer = DigitRecognizer(MODEL_PATH, config=SessionConfig(optimized_cache=False))
+    batch_sizes = []
+    predict_batch = recognizer.predict_batch
+    recognizer.predict_batch = lambda x: batch_sizes.append(len(x)) or predict_batch(x)
+    out = io.StringIO()
+    stats = predict_folder(recognizer, iter_images(str(tmp_path)), ResultWriter(out, "jsonl"),
+                           batch_size=4, workers=workers, prefetch=2, log=None)
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    errors = [r for r in rows if "error" in r]
+    assert sorted(os.path.basename(r["path"]) for r in errors) == ["04_bad.png", "broken.png"]
+    # Строки идут в порядке файлов, включая строки с ошибками
+    assert [r["path"] for r in rows] == list(iter_images(str(tmp_path)))
+    predicted = [r for r in rows if "error" not in r]
+    assert stats["images"] == len(predicted) == len(labels) and stats["errors"] == 2
+    # Битые файлы укорачивают свои чанки, но модель всё равно получает полные батчи
+    assert batch_sizes == [4] * (len(labels) // 4) + ([len(labels) % 4] if len(labels) % 4 else [])
+    assert all(str(r["digit"]) == os.path.basename(r["path"])[3] for r in predicted)
@@ -0,0 +1,135 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from inference import DigitRecognizer, MODEL_FILENAME, PredictionCache, SessionConfig, TtaBudget  # noqa: E402
+
+MODEL_PATH = os.path.join(SRC_DIR, "resources", "models", MODEL_FILENAME)
+needs_model = pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="нет ONNX-модели")
+
+
+def _recognizer(path: str = MODEL_PATH, **kwargs) -> DigitRecognizer:
+    return DigitRecognizer(path, config=SessionConfig(optimized_cache=False), **kwargs)
+
+
+def _images(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((n, 28, 28), dtype=np.float32)
+
+
+def _fixed_batch_model(path: str, batch: int):
+    """Маленькая линейная модель с фиксированной осью батча: (batch, 28, 28, 1) -> softmax (batch, 10)."""
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper, numpy_helper
+    weights = np.random.default_rng(1).normal(size=(784, 10)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Reshape", ["input", "shape"], ["flat"]),
+         helper.make_node("MatMul", ["flat", "weights"], ["logits"]),
+         helper.make_node("Softmax", ["logits"], ["probs"], axis=1)],
+        "fixed_batch",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch, 28, 28, 1])],
+        [helper.make_tensor_value_info("probs", TensorProto.FLOAT, [batch, 10])],
+        [numpy_helper.from_array(np.array([batch, 784], dtype=np.int64), "shape"),
+         numpy_helper.from_array(weights, "weights")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return weights
+
+
+@needs_model
+@pytest.mark.parametrize("n", [0, 1, 7, 16, 37])
+def test_predict_batch_chunks_match_single_call(n):
+    x = _images(n)
+    chunked = _recognizer(batch_size=8).predict_batch(x)
+    whole = _recognizer(batch_size=64).predict_batch(x)
+    assert chunked.shape == (n, 10) and chunked.dtype == np.float32
+    np.testing.assert_allclose(chunked, whole, atol=1e-6)
+    if n:
+        np.testing.assert_allclose(chunked.sum(axis=1), 1.0, atol=1e-5)
+        np.testing.assert_allclose(_recognizer().predict(x[0]), whole[0], atol=1e-6)
+
+
+@pytest.mark.parametrize("n", [1, 4, 6])
+def test_fixed_batch_is_padded_and_trimmed(tmp_path, n):
+    path = str(tmp_path / "fixed.onnx")
+    weights = _fixed_batch_model(path, batch=4)
+    recognizer = _recognizer(path, batch_size=64)
+    # Размер чанка берётся из модели, а не из аргумента
+    assert recognizer.fixed_batch == 4 and recognizer.batch_size == 4
+    x = _images(n, seed=2)
+    probs = recognizer.predict_batch(x)
+    logits = x.reshape(n, 784) @ weights
+    expected = np.exp(logits - logits.max(axis=1, keepdims=True))
+    expected /= expected.sum(axis=1, keepdims=True)
+    assert probs.shape == (n, 10)
+    np.testing.assert_allclose(probs, expected, rtol=1e-4, atol=1e-6)
+
+
+def test_prediction_cache_lru_eviction():
+    cache = PredictionCache(max_size=2)
+    a, b, c = (PredictionCache.key(np.full((28, 28), v, dtype=np.float32)) for v in (0.1, 0.2, 0.3))
+    cache.put(a, np.array([1.0]))
+    cache.put(b, np.array([2.0]))
+    # Обращение к a делает его свежим — вытесняется b
+    assert cache.get(a)[0] == 1.0
+    cache.put(c, np.array([3.0]))
+    assert cache.get(b) is None and cache.get(a) is not None and cache.get(c) is not None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 3, 1)
+    assert stats["hit_rate"] == 0.75
+
+
+@needs_model
+def test_predict_batch_reuses_cached_rows():
+    recognizer = _recognizer(cache_size=16)
+    x = _images(4)
+    first = recognizer.predict_batch(x)
+    assert (recognizer.cache.hits, recognizer.cache.misses) == (0, 4)
+    # Два уже известных изображения вперемешку с новыми: считаются только новые
+    mixed = np.stack([x[2], _images(1, seed=5)[0], x[0], _images(1, seed=6)[0]])
+    probs = recognizer.predict_batch(mixed)
+    assert (recognizer.cache.hits, recognizer.cache.misses) == (2, 6)
+    np.testing.assert_array_equal(probs[[0, 2]], first[[2, 0]])
+    np.testing.assert_allclose(probs, _recognizer().predict_batch(mixed), atol=1e-6)
+    # Из кэша отдаётся копия строки, а не вид на чужой результат
+    probs[0] = 0.0
+    np.testing.assert_array_equal(recognizer.predict_batch(x[2:3])[0], first[2])
+    # use_cache=False не читает и не пополняет кэш
+    counts = (recognizer.cache.hits, recognizer.cache.misses)
+    np.testing.assert_allclose(recognizer.predict_batch(_images(3, seed=7), use_cache=False),
+                               _recognizer().predict_batch(_images(3, seed=7)), atol=1e-6)
+    assert (recognizer.cache.hits, recognizer.cache.misses) == counts
+
+
+def test_tta_budget_picks_largest_k_within_budget():
+    budget = TtaBudget(4.0, sizes=(1, 3, 5))
+    # Без замеров — только наименьший K
+    assert budget.choose() == 1
+    # 1 мс постоянной части + 0.5 мс на изображение
+    for n in (1, 3, 5):
+        budget.observe(n, 1.0 + 0.5 * n)
+    assert abs(budget.estimate(4) - 3.0) < 1e-9
+    assert budget.choose(1) == 5
+    assert budget.choose(2) == 3
+    assert budget.choose(4) == 1
+    # Машина замедлилась: скользящее среднее сдвигается, и K уменьшается
+    for _ in range(20):
+        budget.observe(5, 8.0)
+    assert budget.choose(1) < 5
+
+
+@pytest.mark.parametrize("name, value", [
+    ("DIGIT_ORT_INTRA_THREADS", "many"),
+    ("DIGIT_ORT_EXECUTION_MODE", "async"),
+    ("DIGIT_ORT_GRAPH_OPT", "max"),
+])
+def test_session_config_from_env_names_bad_variable(monkeypatch, name, value):
+    monkeypatch.setenv(name, value)
+    with pytest.raises(ValueError, match=name):
+        SessionConfig.from_env()
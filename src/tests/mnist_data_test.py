@@ -0,0 +1,52 @@
+import gzip
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mnist_data  # noqa: E402
+
+
+def _write_idx(path: str, array: np.ndarray):
+    """IDX-файл из uint8-массива: магическое число, размерности big-endian, данные."""
+    header = bytes([0, 0, 0x08, array.ndim]) + np.asarray(array.shape, dtype=">u4").tobytes()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as f:
+        f.write(header + array.astype(np.uint8).tobytes())
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_idx_cache_roundtrip(tmp_path, monkeypatch, suffix):
+    rng = np.random.default_rng(0)
+    data = {}
+    for split, (images_name, labels_name) in mnist_data.IDX_FILES.items():
+        n = 23 if split == "train" else 7
+        data[split] = (rng.integers(0, 256, (n, 28, 28), dtype=np.uint8), rng.integers(0, 10, n, dtype=np.uint8))
+        _write_idx(str(tmp_path / (images_name + suffix)), data[split][0])
+        _write_idx(str(tmp_path / (labels_name + suffix)), data[split][1])
+    # Маленькие куски, чтобы проверить потоковую конвертацию через границы
+    monkeypatch.setattr(mnist_data, "_CHUNK", 5)
+
+    cache = str(tmp_path / "cache")
+    for split, (images, labels) in data.items():
+        loaded = mnist_data.load(split, data_dir=cache, idx_dir=str(tmp_path))
+        assert isinstance(loaded.images, np.memmap)
+        np.testing.assert_array_equal(loaded.images, images)
+        np.testing.assert_array_equal(loaded.labels, labels)
+        batches = list(loaded.batches(4, channel_axis=True))
+        x = np.concatenate([b[0] for b in batches])
+        assert x.dtype == np.float32 and x.shape == images.shape + (1,)
+        np.testing.assert_array_equal(x[..., 0], images.astype(np.float32) / 255.0)
+
+    raw = mnist_data.read_idx(str(tmp_path / (mnist_data.IDX_FILES["test"][0] + suffix)))
+    np.testing.assert_array_equal(raw, data["test"][0])
+
+
+def test_read_idx_rejects_other_files(tmp_path):
+    path = tmp_path / "not_idx"
+    path.write_bytes(b"PK\x03\x04" + bytes(16))
+    with pytest.raises(ValueError):
+        mnist_data.read_idx(str(path))
@@ -1,50 +1,103 @@
+import argparse
+import os
+import sys
+import time
+
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.datasets import mnist
-import matplotlib.pyplot as plt
 
-# Загрузка обученной модели
-model = load_model("../resources/models/improved_digit_recognition_model.h5")
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(SRC_DIR, "resources", "models")
+sys.path.insert(0, SRC_DIR)
+
+import mnist_data  # noqa: E402
+
+
+def make_predictor(backend: str, model_path: str, batch_size: int):
+    """Функция (N, 28, 28) float32 -> (N, 10) для выбранного бэкенда."""
+    if backend == "onnx":
+        from inference import DigitRecognizer
+        recognizer = DigitRecognizer(model_path, batch_size=batch_size)
+        return recognizer.predict_batch
+    from tensorflow.keras.models import load_model
+    model = load_model(model_path)
+    return lambda x: model.predict(x.reshape(-1, 28, 28, 1), batch_size=batch_size, verbose=0)
+
+
+# Оценка модели на тестовых данных большими батчами
+def evaluate(predict, x_test: np.ndarray, y_test: np.ndarray, batch_size: int = 1000) -> dict:
+    n = len(y_test)
+    predicted = np.empty(n, dtype=np.int64)
+    start = time.perf_counter()
+    for i in range(0, n, batch_size):
+        # Нормализуем по батчу во float32, без полной копии всего набора
+        batch = mnist_data.normalize(x_test[i:i + batch_size])
+        predicted[i:i + batch_size] = np.argmax(predict(batch), axis=1)
+    wall = time.perf_counter() - start
 
-# Загружаем данные MNIST
-(x_train, y_train), (x_test, y_test) = mnist.load_data()
+    correct = predicted == y_test
+    per_class = {
+        int(c): float(correct[y_test == c].mean()) for c in np.unique(y_test)
+    }
+    return {
+        "accuracy": float(correct.mean()),
+        "per_class": per_class,
+        "wall_time": wall,
+        "images_per_sec": n / wall if wall > 0 else float("inf"),
+        "predicted": predicted,
+    }
 
-# Нормализуем данные
-x_test = x_test / 255.0
 
+def print_report(result: dict, n: int):
+    print(f"Точность на тестовых данных: {result['accuracy'] * 100:.2f}% ({n} изображений)")
+    print("Точность по классам:")
+    for c, acc in result["per_class"].items():
+        print(f"  {c}: {acc * 100:.2f}%")
+    print(f"Время: {result['wall_time']:.2f} с, {result['images_per_sec']:.0f} изображений/с")
 
-# Тестирование модели на тестовых данных
-def test_model(model, x_test, y_test):
-    correct_predictions = 0
-    total_predictions = len(y_test)
 
-    # Перебираем тестовые данные
-    for i in range(total_predictions):
-        img = x_test[i]
-        true_label = y_test[i]
+def show_errors(x_test: np.ndarray, y_test: np.ndarray, predicted: np.ndarray, limit: int = 16):
+    import matplotlib.pyplot as plt
+    wrong = np.nonzero(predicted != y_test)[0][:limit]
+    if len(wrong) == 0:
+        return
+    cols = min(8, len(wrong))
+    rows = (len(wrong) + cols - 1) // cols
+    fig, axes = plt.subplots(rows, cols, figsize=(2 * cols, 2.2 * rows), squeeze=False)
+    for ax in axes.flat:
+        ax.axis("off")
+    for ax, i in zip(axes.flat, wrong):
+        ax.imshow(x_test[i], cmap="gray")
+        ax.set_title(f"True: {y_test[i]}, Pred: {predicted[i]}", fontsize=8)
+    plt.tight_layout()
+    plt.show()
 
-        # Изменяем размер изображения до (28, 28, 1) для подачи в модель
-        img = img.reshape(1, 28, 28, 1)
 
-        # Прогнозируем
-        prediction = model.predict(img)
-        predicted_label = np.argmax(prediction)
+def main():
+    parser = argparse.ArgumentParser(description="Оценка модели на тестовой выборке MNIST")
+    parser.add_argument("--backend", choices=["onnx", "keras"], default="onnx")
+    parser.add_argument("--model", help="путь к модели (.onnx для onnx, .h5/.keras для keras)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=0, help="оценить только первые N изображений")
+    parser.add_argument("--show-errors", action="store_true", help="показать ошибочно распознанные изображения")
+    args = parser.parse_args()
 
-        # Сравниваем с истинной меткой
-        if predicted_label == true_label:
-            correct_predictions += 1
+    default_name = ("improved_digit_recognition_model.onnx" if args.backend == "onnx"
+                    else "improved_digit_recognition_model.h5")
+    model_path = args.model or os.path.join(MODELS_DIR, default_name)
 
-        # Показываем картинку и предсказания
-        if i % 100 == 0:  # показываем изображение каждые 100 примеров
-            plt.imshow(img.reshape(28, 28), cmap="gray")
-            plt.title(f"True: {true_label}, Predicted: {predicted_label}")
-            plt.show()
+    # uint8 через memmap: страницы читаются по мере оценки
+    test = mnist_data.load("test")
+    if args.limit:
+        test = test.head(args.limit)
+    x_test, y_test = test.images, np.asarray(test.labels)
 
-    # Печатаем общую точность
-    accuracy = correct_predictions / total_predictions
-    print(f"Точность на тестовых данных: {accuracy * 100:.2f}%")
+    # Загрузка модели
+    predict = make_predictor(args.backend, model_path, args.batch_size)
+    result = evaluate(predict, x_test, y_test, args.batch_size)
+    print_report(result, len(y_test))
+    if args.show_errors:
+        show_errors(x_test, y_test, result["predicted"])
 
 
-# Тестируем модель
-test_model(model, x_test, y_test)
+if __name__ == "__main__":
+    main()
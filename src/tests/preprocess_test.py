@@ -0,0 +1,98 @@
+import os
+import sys
+
+import numpy as np
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import (preprocess_batch, preprocess_canvas, rasterize_strokes,  # noqa: E402
+                           segment_digits, strokes_from_payload, strokes_to_payload, tta_variants,
+                           TTA_SIZES, TTA_TRANSFORMS)
+
+
+def _random_canvas(rng: np.random.Generator, size: int = 340) -> np.ndarray:
+    """Холст как в DrawingWidget: белый фон, несколько толстых чёрных штрихов."""
+    canvas = np.full((size, size), 255, dtype=np.uint8)
+    for _ in range(rng.integers(1, 4)):
+        pts = rng.integers(size // 8, size - size // 8, size=(rng.integers(2, 6), 2))
+        cv2.polylines(canvas, [pts.astype(np.int32)], False, 0, int(rng.integers(8, 30)), cv2.LINE_AA)
+    return canvas
+
+
+def _edge_canvas(size: int = 340) -> np.ndarray:
+    """Холст, у которого верхние строки полностью залиты — bbox меньше всего кадра."""
+    canvas = np.full((size, size), 255, dtype=np.uint8)
+    canvas[:40] = 0
+    cv2.line(canvas, (size // 2, 40), (size // 3, size - 60), 0, 20)
+    return canvas
+
+
+@pytest.mark.parametrize("size", [280, 340])
+def test_batch_matches_single_image_path(size):
+    rng = np.random.default_rng(size)
+    canvases = np.stack([_random_canvas(rng, size) for _ in range(32)] + [_edge_canvas(size)])
+    expected = np.concatenate([preprocess_canvas(c) for c in canvases])
+    actual = preprocess_batch(canvases)
+    assert actual.shape == (len(canvases), 28, 28, 1)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, atol=1e-6)
+
+
+def test_blank_canvas_gives_zeros():
+    out = preprocess_batch(np.full((2, 280, 280), 255, dtype=np.uint8))
+    assert out.shape == (2, 28, 28, 1)
+    assert not out.any()
+
+
+def test_vector_strokes_match_raster_path():
+    rng = np.random.default_rng(7)
+    size = 340
+    for _ in range(16):
+        strokes = [rng.integers(size // 8, size - size // 8, size=(rng.integers(2, 6), 2)).astype(np.float32)
+                   for _ in range(rng.integers(1, 3))]
+        width = int(rng.integers(10, 24))
+        canvas = np.full((size, size), 255, dtype=np.uint8)
+        # Толщина cv2 на ~2 пикселя больше заданной — компенсируем, чтобы сравнивать одинаковые кисти
+        for pts in strokes:
+            cv2.polylines(canvas, [pts.astype(np.int32)], False, 0, width - 2, cv2.LINE_AA)
+        expected = preprocess_batch(canvas)
+        payload = strokes_to_payload(strokes, [width] * len(strokes), size)
+        actual = rasterize_strokes(*strokes_from_payload(payload))
+        assert actual.shape == (1, 28, 28, 1) and actual.dtype == np.float32
+        assert np.abs(actual - expected).mean() < 0.03
+        assert abs(actual.sum() / expected.sum() - 1.0) < 0.15
+
+
+def test_empty_strokes_give_zeros():
+    assert not rasterize_strokes([], [], 340).any()
+
+
+def test_segment_digits_orders_and_merges():
+    canvas = np.full((200, 400), 255, dtype=np.uint8)
+    # Справа налево: вертикальная черта, две несвязанные черты друг над другом (одна цифра), кружок
+    cv2.line(canvas, (330, 40), (330, 160), 0, 14, cv2.LINE_AA)
+    cv2.line(canvas, (160, 60), (240, 60), 0, 14, cv2.LINE_AA)
+    cv2.line(canvas, (170, 140), (230, 140), 0, 14, cv2.LINE_AA)
+    cv2.circle(canvas, (70, 100), 45, 0, 14, cv2.LINE_AA)
+    digits, boxes = segment_digits(canvas)
+    assert digits.shape == (3, 28, 28, 1) and digits.dtype == np.float32
+    assert list(boxes[:, 0]) == sorted(boxes[:, 0]) and boxes[0, 0] < 40 < 300 < boxes[2, 0]
+    assert digits.reshape(3, -1).max(axis=1).min() > 0.5
+
+    digits, boxes = segment_digits(np.full((200, 400), 255, dtype=np.uint8))
+    assert digits.shape == (0, 28, 28, 1) and boxes.shape == (0, 4)
+
+
+def test_tta_variants_keep_original_first():
+    rng = np.random.default_rng(3)
+    images = preprocess_batch(np.stack([_random_canvas(rng) for _ in range(3)]))
+    k = max(TTA_SIZES)
+    variants = tta_variants(images, k)
+    assert k <= len(TTA_TRANSFORMS) and variants.shape == (3 * k, 28, 28, 1)
+    grouped = variants.reshape(3, k, 28, 28, 1)
+    np.testing.assert_array_equal(grouped[:, 0], images)
+    # Остальные варианты отличаются от исходника, но не уничтожают цифру
+    assert all(not np.array_equal(grouped[:, j], images) for j in range(1, k))
+    assert (grouped.reshape(3, k, -1).sum(axis=2) > 0).all()
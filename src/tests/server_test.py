@@ -0,0 +1,110 @@
+import io
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+from PIL import Image
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "utils"))
+
+from benchmark import render_samples, sample_strokes  # noqa: E402
+from inference import DigitRecognizer, MODEL_FILENAME, SessionConfig  # noqa: E402
+from preprocessing import preprocess_batch, strokes_to_payload  # noqa: E402
+from server import decode_arrays, make_server  # noqa: E402
+
+MODEL_PATH = os.path.join(SRC_DIR, "resources", "models", MODEL_FILENAME)
+pytestmark = pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="нет ONNX-модели")
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    recognizer = DigitRecognizer(MODEL_PATH, config=SessionConfig(optimized_cache=False))
+    # Порт 0 — свободный порт от ОС
+    httpd = make_server(recognizer, port=0, window_ms=1.0, max_body=64 * 1024)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    httpd.RequestHandlerClass.batcher.close()
+
+
+def _post(url: str, body: bytes, ctype: str = "application/json"):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": ctype}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_health(base_url):
+    with urllib.request.urlopen(base_url + "/health", timeout=10) as response:
+        body = json.loads(response.read())
+    assert response.status == 200 and body["status"] == "ok" and body["model"] == MODEL_PATH
+
+
+def test_predict_json_png_and_strokes(base_url):
+    canvases, labels = render_samples()
+    digit = int(labels[3])
+
+    images = preprocess_batch(canvases[:4]).reshape(4, 28, 28)
+    status, body = _post(base_url + "/predict?k=2", json.dumps({"images": images.tolist()}).encode())
+    assert status == 200 and [p["digit"] for p in body["predictions"]] == [int(v) for v in labels[:4]]
+    assert all(len(p["top_k"]) == 2 for p in body["predictions"])
+    # Тот же вход в диапазоне 0..255 с явным масштабом
+    scaled = {"image": (images[3] * 255).round().tolist(), "max_value": 255}
+    status, body = _post(base_url + "/predict", json.dumps(scaled).encode())
+    assert status == 200 and body["predictions"][0]["digit"] == digit
+
+    png = io.BytesIO()
+    Image.fromarray(canvases[3]).save(png, format="PNG")
+    status, body = _post(base_url + "/predict", png.getvalue(), "image/png")
+    assert status == 200 and body["predictions"][0]["digit"] == digit
+
+    strokes, stroke_digit = sample_strokes()[3]
+    payload = strokes_to_payload(strokes, [16] * len(strokes), canvases.shape[1])
+    status, body = _post(base_url + "/predict", json.dumps(payload).encode())
+    assert status == 200 and body["predictions"][0]["digit"] == stroke_digit == digit
+
+
+def test_rejects_bad_and_oversized_requests(base_url):
+    status, body = _post(base_url + "/predict", json.dumps({"image": [[300.0] * 28] * 28}).encode())
+    assert status == 400 and "max_value" in body["error"]
+    status, body = _post(base_url + "/predict", b"{" + b" " * (64 * 1024) + b"}")
+    assert status == 413
+    status, _ = _post(base_url + "/nope", b"{}")
+    assert status == 404
+    # NaN проходит сравнения с границами диапазона, поэтому отклоняется отдельно
+    status, body = _post(base_url + "/predict", json.dumps({"image": [[float("nan")] * 28] * 28}).encode())
+    assert status == 400 and "конечными" in body["error"]
+    status, _ = _post(base_url + "/predict", json.dumps({"image": [[0.0] * 28] * 28, "max_value": float("inf")}).encode())
+    assert status == 400
+
+
+@pytest.mark.parametrize("k, expected", [("1", 1), ("3", 3), ("50", 10)])
+def test_top_k_sizes(base_url, k, expected):
+    payload = json.dumps({"image": [[0.0] * 28] * 28}).encode()
+    status, body = _post(base_url + f"/predict?k={k}", payload)
+    assert status == 200 and len(body["predictions"][0]["top_k"]) == expected
+
+
+@pytest.mark.parametrize("k", ["0", "-1", "x"])
+def test_rejects_bad_k(base_url, k):
+    status, body = _post(base_url + f"/predict?k={k}", json.dumps({"image": [[0.0] * 28] * 28}).encode())
+    assert status == 400
+
+
+def test_decode_arrays_uses_explicit_scale():
+    # Холст 0/255, где все значения 0 или 1, больше не принимается за [0, 1] по догадке
+    ones = np.zeros((28, 28))
+    ones[10:18, 12:16] = 1
+    np.testing.assert_allclose(decode_arrays({"image": ones.tolist(), "max_value": 255})[0], ones / 255, atol=1e-7)
+    np.testing.assert_array_equal(decode_arrays({"image": ones.tolist()})[0], ones)
@@ -0,0 +1,218 @@
+import argparse
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from tensorflow.keras.optimizers import AdamW
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return project_root
+
+
+project_root = get_project_root()
+sys.path.insert(0, os.path.join(project_root, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from model import create_improved_cnn_model, load_data, make_eval_dataset, make_train_dataset  # noqa: E402
+from distill import measure  # noqa: E402
+from convert_model_format import export_onnx  # noqa: E402
+from mnist_data import normalize  # noqa: E402
+
+BASELINE = {"filters": (32, 64, 128), "dense": 512, "sparsity": 0.0}
+
+
+# ---------- Прунинг ----------
+def magnitude_prune(model, sparsity):
+    """Обнуляет долю sparsity наименьших по модулю весов каждого ядра Conv2D/Dense; возвращает маски."""
+    masks = []
+    for layer in model.layers:
+        if not isinstance(layer, (layers.Conv2D, layers.Dense)):
+            continue
+        w = layer.kernel.numpy()
+        k = int(w.size * sparsity)
+        if k == 0:
+            continue
+        threshold = np.partition(np.abs(w).ravel(), k - 1)[k - 1]
+        mask = (np.abs(w) > threshold).astype(w.dtype)
+        layer.kernel.assign(w * mask)
+        masks.append((layer.kernel, mask))
+    return masks
+
+
+class KeepPruned(tf.keras.callbacks.Callback):
+    """Возвращает обнулённые веса в ноль после каждого шага дообучения."""
+
+    def __init__(self, masks):
+        super().__init__()
+        self.masks = masks
+
+    def on_train_batch_end(self, batch, logs=None):
+        for kernel, mask in self.masks:
+            kernel.assign(kernel * mask)
+
+
+# ---------- Кандидаты ----------
+def output_side(n_blocks, side=28):
+    """Сторона карты признаков после n_blocks блоков create_improved_cnn_model (<= 0 — вход слишком мал)."""
+    for i in range(n_blocks):
+        # Блок с пулингом: две свёртки 3x3 без паддинга и пулинг 2x2; последний — одна свёртка
+        side = (side - 4) // 2 if i < n_blocks - 1 else side - 2
+        if side <= 0:
+            return side
+    return side
+
+
+def candidate_name(c):
+    name = f"f{'-'.join(map(str, c['filters']))}_d{c['dense']}"
+    if c["sparsity"]:
+        name += f"_p{int(c['sparsity'] * 100)}"
+    return name
+
+
+def train_candidate(c, data, epochs, finetune_epochs, batch_size):
+    (x_train, y_train), (x_val, y_val) = data
+    model = create_improved_cnn_model(c["filters"], c["dense"])
+    model.compile(
+        optimizer=AdamW(learning_rate=0.001, weight_decay=1e-4),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    train_ds = make_train_dataset(x_train, y_train, batch_size=batch_size)
+    val_ds = make_eval_dataset(x_val, y_val)
+    model.fit(train_ds, epochs=epochs, validation_data=val_ds, verbose=0)
+    if c["sparsity"]:
+        masks = magnitude_prune(model, c["sparsity"])
+        if finetune_epochs:
+            model.fit(train_ds, epochs=finetune_epochs, validation_data=val_ds,
+                      callbacks=[KeepPruned(masks)], verbose=0)
+    return model
+
+
+def gzip_size_kb(path):
+    # Нули после прунинга ORT не ускоряют, но хорошо сжимаются
+    with open(path, "rb") as f:
+        return len(gzip.compress(f.read(), 6)) / 1024
+
+
+def pareto_front(results):
+    """Индексы недоминируемых кандидатов: ниже задержка и/или выше точность."""
+    front = []
+    for i, a in enumerate(results):
+        dominated = any(
+            b["latency_ms"] <= a["latency_ms"] and b["accuracy"] >= a["accuracy"]
+            and (b["latency_ms"] < a["latency_ms"] or b["accuracy"] > a["accuracy"])
+            for j, b in enumerate(results) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def print_table(results):
+    print(f"\n{'кандидат':<24}{'точность':>10}{'параметры':>12}{'p50, мс':>10}{'ускорение':>11}"
+          f"{'мс/изобр. (256)':>17}{'gzip, КБ':>10}  Парето")
+    for r in sorted(results, key=lambda r: r["latency_ms"]):
+        print(f"{r['name']:<24}{r['accuracy'] * 100:>9.2f}%{r['params']:>12,}{r['latency_ms']:>10.3f}"
+              f"{r['speedup']:>10.1f}x{r['latency_batch256_per_image_ms']:>17.4f}{r['size_gzip_kb']:>10.0f}"
+              f"  {'*' if r['pareto'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор архитектур и прунинга: задержка против точности")
+    parser.add_argument("--filters", default="32,64,128;16,32,64;8,16,32;16,32",
+                        help="варианты фильтров по блокам через ';' (число блоков = длина варианта)")
+    parser.add_argument("--dense", default="512,128,32", help="варианты ширины полносвязного слоя")
+    parser.add_argument("--prune", default="0", help="доли magnitude-прунинга, например 0,0.5,0.8")
+    parser.add_argument("--epochs", type=int, default=3, help="короткий бюджет обучения на кандидата")
+    parser.add_argument("--finetune-epochs", type=int, default=1, help="дообучение после прунинга")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=200, help="повторов при замере задержки")
+    parser.add_argument("--output-dir", default="sweep_models", help="куда сохранять ONNX кандидатов")
+    parser.add_argument("--report", default="sweep_report.json")
+    args = parser.parse_args()
+
+    filters = [tuple(int(v) for v in group.split(",")) for group in args.filters.split(";")]
+    # Слишком глубокий вариант упал бы в Keras посреди перебора — отклоняем заранее
+    too_deep = [f for f in filters if output_side(len(f)) <= 0]
+    if too_deep:
+        parser.error(f"для входа 28x28 не больше 3 блоков, а в вариантах "
+                     f"{'; '.join(','.join(map(str, f)) for f in too_deep)} их больше")
+    dense = [int(v) for v in args.dense.split(",")]
+    sparsity = [float(v) for v in args.prune.split(",")]
+    candidates = [{"filters": f, "dense": d, "sparsity": s} for f, d, s in itertools.product(filters, dense, sparsity)]
+
+    (x_train, y_train), (x_val, y_val), (x_test, y_test) = load_data()
+    # Обучение нормализует uint8 по батчам, а сверке ONNX и замерам нужен float32-массив
+    x_test = normalize(x_test)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    results = []
+    for n, c in enumerate(candidates, 1):
+        name = candidate_name(c)
+        print(f"[{n}/{len(candidates)}] {name}")
+        start = time.perf_counter()
+        model = train_candidate(c, ((x_train, y_train), (x_val, y_val)), args.epochs, args.finetune_epochs,
+                                args.batch_size)
+        train_s = time.perf_counter() - start
+        onnx_path = os.path.join(args.output_dir, f"{name}.onnx")
+        export_onnx(model, onnx_path, x_test[:500])
+        m = measure(onnx_path, x_test, y_test, args.repeats)
+        results.append({
+            "name": name,
+            "filters": list(c["filters"]),
+            "dense": c["dense"],
+            "sparsity": c["sparsity"],
+            "params": int(model.count_params()),
+            "accuracy": m["accuracy"],
+            "latency_ms": m["latency_batch1_ms"]["p50"],
+            "latency_batch1_ms": m["latency_batch1_ms"],
+            "latency_batch256_per_image_ms": m["latency_batch256_per_image_ms"],
+            "size_kb": m["size_kb"],
+            "size_gzip_kb": gzip_size_kb(onnx_path),
+            "train_s": train_s,
+            "onnx": onnx_path,
+        })
+        print(f"    точность {m['accuracy'] * 100:.2f}%, p50 {results[-1]['latency_ms']:.3f} мс, "
+              f"обучение {train_s:.0f} с")
+        tf.keras.backend.clear_session()
+
+    # Ускорение считаем относительно исходной архитектуры, а если её не было — самого медленного кандидата
+    baseline = next((r for r in results if (tuple(r["filters"]), r["dense"], r["sparsity"])
+                     == (BASELINE["filters"], BASELINE["dense"], BASELINE["sparsity"])), None)
+    reference = baseline or max(results, key=lambda r: r["latency_ms"])
+    front = set(pareto_front(results))
+    for i, r in enumerate(results):
+        r["speedup"] = reference["latency_ms"] / r["latency_ms"]
+        r["accuracy_drop_pp"] = (reference["accuracy"] - r["accuracy"]) * 100
+        r["pareto"] = i in front
+
+    print_table(results)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "epochs": args.epochs,
+            "finetune_epochs": args.finetune_epochs,
+            "reference": reference["name"],
+            "latency": "ORT CPU, 1 поток, батч 1, p50",
+            "train_images": int(len(x_train)),
+            "test_images": int(len(x_test)),
+        },
+        "candidates": results,
+        "pareto": [r["name"] for r in sorted((results[i] for i in front), key=lambda r: r["latency_ms"])],
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nОтчёт записан в '{args.report}'")
+
+
+if __name__ == "__main__":
+    main()
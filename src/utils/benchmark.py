@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return project_root
+
+
+project_root = get_project_root()
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+from inference import (MODEL_FILENAME, default_model_paths, make_session, percentiles,  # noqa: E402
+                       resolve_model_path, timed)
+from preprocessing import preprocess_batch, preprocess_canvas, rasterize_strokes  # noqa: E402
+
+SAMPLES_PATH = os.path.join(project_root, "src", "resources", "samples", "canvases.npz")
+PREPROCESS_STAGES = ["resize", "invert", "bbox", "crop_pad", "center_of_mass", "shift"]
+
+# Штрихи цифр 0-9 в координатах [0, 1] — из них строятся эталонные холсты
+_DIGIT_STROKES = {
+    0: [[(0.5, 0.2), (0.32, 0.3), (0.28, 0.5), (0.32, 0.7), (0.5, 0.8), (0.68, 0.7), (0.72, 0.5), (0.68, 0.3), (0.5, 0.2)]],
+    1: [[(0.4, 0.3), (0.52, 0.2), (0.52, 0.8)]],
+    2: [[(0.3, 0.32), (0.45, 0.2), (0.65, 0.25), (0.68, 0.42), (0.3, 0.8), (0.72, 0.8)]],
+    3: [[(0.3, 0.25), (0.6, 0.2), (0.66, 0.35), (0.45, 0.48), (0.68, 0.6), (0.62, 0.78), (0.3, 0.78)]],
+    4: [[(0.6, 0.8), (0.6, 0.2), (0.28, 0.6), (0.74, 0.6)]],
+    5: [[(0.68, 0.2), (0.35, 0.2), (0.32, 0.46), (0.6, 0.46), (0.7, 0.62), (0.6, 0.78), (0.3, 0.78)]],
+    6: [[(0.65, 0.2), (0.4, 0.35), (0.3, 0.62), (0.4, 0.8), (0.62, 0.78), (0.66, 0.58), (0.45, 0.5), (0.31, 0.6)]],
+    7: [[(0.28, 0.2), (0.72, 0.2), (0.42, 0.8)]],
+    8: [[(0.5, 0.5), (0.34, 0.36), (0.5, 0.2), (0.66, 0.36), (0.5, 0.5), (0.3, 0.66), (0.5, 0.8), (0.7, 0.66), (0.5, 0.5)]],
+    9: [[(0.68, 0.4), (0.5, 0.52), (0.33, 0.4), (0.5, 0.2), (0.68, 0.4), (0.62, 0.8)]],
+}
+
+
+def sample_strokes(size: int = 340) -> list:
+    """Эталонные штрихи в пикселях холста: список (штрихи (K, 2) int32, цифра)."""
+    return [([(np.array(stroke) * size).astype(np.int32) for stroke in strokes], digit)
+            for digit, strokes in _DIGIT_STROKES.items()]
+
+
+def render_samples(size: int = 340, brush: int = 16) -> tuple:
+    """Рисует эталонные холсты (белый фон, чёрные штрихи) как в DrawingWidget."""
+    import cv2
+    canvases, labels = [], []
+    for strokes, digit in sample_strokes(size):
+        canvas = np.full((size, size), 255, dtype=np.uint8)
+        for pts in strokes:
+            cv2.polylines(canvas, [pts], False, 0, brush, cv2.LINE_AA)
+        canvases.append(canvas)
+        labels.append(digit)
+    return np.stack(canvases), np.array(labels, dtype=np.uint8)
+
+
+def load_samples() -> tuple:
+    with np.load(SAMPLES_PATH) as f:
+        return f["canvases"], f["labels"]
+
+
+def postprocess(probs: np.ndarray) -> tuple:
+    """То же, что делают DigitRecognizer и _on_prediction с выходом модели."""
+    probs = np.asarray(probs, dtype=np.float32)
+    sums = probs.sum(axis=1, keepdims=True)
+    probs = np.divide(probs, sums, out=probs, where=sums > 0)
+    return probs.argmax(axis=1), probs.max(axis=1), np.argsort(probs, axis=1)[:, ::-1][:, :3]
+
+
+# ---------- Stages ----------
+def bench_canvas(canvases: np.ndarray, repeats: int) -> dict:
+    """get_pil_image/get_array настоящего DrawingWidget (offscreen, без дисплея)."""
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtWidgets import QApplication
+        from PySide6.QtGui import QImage
+        from app import DrawingWidget
+    except ImportError as e:
+        print(f"Пропускаем этап холста: {e}")
+        return {}
+    _qt_app = QApplication.instance() or QApplication([])  # noqa: F841
+    size = canvases.shape[1]
+    widget = DrawingWidget(size=size)
+    results = {"get_pil_image": [], "get_array": []}
+    for canvas in canvases:
+        img = QImage(canvas.data, size, size, size, QImage.Format_Grayscale8).copy()
+        widget._image = img
+        results["get_pil_image"] += timed(widget.get_pil_image, repeats)
+        results["get_array"] += timed(widget.get_array, repeats)
+    return {k: percentiles(v) for k, v in results.items()}
+
+
+def bench_preprocess(canvases: np.ndarray, repeats: int, warmup: int = 3) -> dict:
+    # Первые вызовы импортируют PIL, cv2 и scipy — в замеры они попасть не должны
+    for _ in range(warmup):
+        preprocess_canvas(canvases[0])
+    per_stage = {s: [] for s in PREPROCESS_STAGES}
+    total = []
+    for canvas in canvases:
+        for _ in range(repeats):
+            timings = {}
+            t = time.perf_counter()
+            preprocess_canvas(canvas, timings)
+            total.append((time.perf_counter() - t) * 1000.0)
+            for s in PREPROCESS_STAGES:
+                per_stage[s].append(timings.get(s, 0.0))
+    result = {f"preprocess.{s}": percentiles(v) for s, v in per_stage.items()}
+    result["preprocess_image"] = percentiles(total)
+    return result
+
+
+def bench_strokes(size: int, brush: int, repeats: int, warmup: int = 3) -> dict:
+    """Векторный путь: штрихи эталонных цифр сразу в тензор 28x28, без холста."""
+    samples = sample_strokes(size)
+    ms = []
+    for i, (strokes, _) in enumerate(samples):
+        # Полный прогрев (импорт cv2) нужен только перед первым набором
+        ms += timed(lambda: rasterize_strokes(strokes, [brush] * len(strokes), size), repeats,
+                    warmup=warmup if i == 0 else 1)
+    return {"rasterize_strokes": percentiles(ms)}
+
+
+def bench_inference(model_path: str, tensors: np.ndarray, batch_sizes, thread_counts, repeats: int) -> list:
+    rows = []
+    for threads in thread_counts:
+        session = make_session(model_path, threads)
+        name = session.get_inputs()[0].name
+        for bs in batch_sizes:
+            reps = int(np.ceil(bs / len(tensors)))
+            batch = np.ascontiguousarray(np.tile(tensors, (reps, 1, 1, 1))[:bs])
+            outs = session.run(None, {name: batch})[0]
+            run_ms = timed(lambda: session.run(None, {name: batch}), repeats)
+            post_ms = timed(lambda: postprocess(outs), repeats)
+            rows.append({
+                "threads": threads,
+                "batch_size": bs,
+                "session_run": percentiles(run_ms),
+                "session_run_per_image_ms": float(np.median(run_ms) / bs),
+                "postprocess": percentiles(post_ms),
+            })
+            print(f"  threads={threads:<2d} batch={bs:<4d} session.run p50={rows[-1]['session_run']['p50']:.3f} мс "
+                  f"({rows[-1]['session_run_per_image_ms']:.3f} мс/изобр.)")
+    return rows
+
+
+def bench_preprocess_batch(canvases: np.ndarray, batch_sizes, repeats: int) -> list:
+    rows = []
+    for bs in batch_sizes:
+        reps = int(np.ceil(bs / len(canvases)))
+        batch = np.tile(canvases, (reps, 1, 1))[:bs]
+        ms = timed(lambda: preprocess_batch(batch), repeats, warmup=1)
+        rows.append({"batch_size": bs, "preprocess_batch": percentiles(ms),
+                     "per_image_ms": float(np.median(ms) / bs)})
+    return rows
+
+
+def print_table(stages: dict):
+    print(f"{'этап':<28}{'p50':>10}{'p95':>10}{'p99':>10}  (мс)")
+    for name, st in stages.items():
+        print(f"{name:<28}{st['p50']:>10.3f}{st['p95']:>10.3f}{st['p99']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк задержек конвейера распознавания")
+    parser.add_argument("--model", help=f"путь к {MODEL_FILENAME} (по умолчанию — как в приложении)")
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--threads", default="1,2,4", help="значения intra_op_num_threads")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", default="benchmark.json", help="куда записать результаты в JSON")
+    parser.add_argument("--regenerate-samples", action="store_true", help="перерисовать эталонные холсты")
+    args = parser.parse_args()
+
+    if args.regenerate_samples or not os.path.exists(SAMPLES_PATH):
+        canvases, labels = render_samples()
+        os.makedirs(os.path.dirname(SAMPLES_PATH), exist_ok=True)
+        np.savez_compressed(SAMPLES_PATH, canvases=canvases, labels=labels)
+        print(f"Эталонные холсты сохранены в '{SAMPLES_PATH}'")
+    canvases, labels = load_samples()
+
+    model_path = resolve_model_path([args.model] if args.model else default_model_paths())
+    if model_path is None:
+        raise FileNotFoundError("Не удалось найти ONNX модель. Укажите --model.")
+    batch_sizes = [int(v) for v in args.batch_sizes.split(",")]
+    thread_counts = [int(v) for v in args.threads.split(",")]
+
+    print(f"Холстов: {len(canvases)}, повторов: {args.repeats}")
+    stages = {}
+    stages.update(bench_canvas(canvases, args.repeats))
+    stages.update(bench_preprocess(canvases, args.repeats))
+    stages.update(bench_strokes(canvases.shape[1], 16, args.repeats))
+    print_table(stages)
+
+    tensors = np.concatenate([preprocess_canvas(c) for c in canvases])
+    print("Инференс:")
+    inference = bench_inference(model_path, tensors, batch_sizes, thread_counts, args.repeats)
+    batch_preprocess = bench_preprocess_batch(canvases, batch_sizes, max(3, args.repeats // 10))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "model": os.path.abspath(model_path),
+            "samples": os.path.relpath(SAMPLES_PATH, project_root),
+            "n_samples": int(len(canvases)),
+            "repeats": args.repeats,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "onnxruntime": ort.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stages,
+        "inference": inference,
+        "preprocess_batch": batch_preprocess,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Результаты записаны в '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,28 +11,109 @@ onnx_output_path = os.path.join(project_root, "src", "resources", "models", "imp
 opset = 15
 # ------------------
 
-# 1. Используем тот же Python, что и для запуска скрипта
-python_executable = sys.executable # <-- Ключевое изменение
-
-command_list = [
-    python_executable, "-m", "tf2onnx.convert", # <-- Используем sys.executable
-    "--saved-model", saved_model_path,
-    "--output", onnx_output_path,
-    "--opset", str(opset)
-]
-
-print("Планируемая команда:", shlex.join(command_list))
-
-try:
-    result = subprocess.run(command_list, check=True, text=True)
-    print(" Конвертация завершена успешно!")
-except subprocess.CalledProcessError as e:
-    print(f" Ошибка при выполнении команды (код возврата {e.returncode}).")
-    print("Вы можете попробовать выполнить эту команду вручную в терминале:")
-    print(shlex.join(command_list))
-except FileNotFoundError:
-    print(" Ошибка: Python не найден.")
-except Exception as e:
-    print(f" Неожиданная ошибка: {e}")
-    print("Вы можете попробовать выполнить эту команду вручную в терминале:")
-    print(shlex.join(command_list))
+
+def convert_saved_model(saved_model_path: str, onnx_output_path: str, opset: int = opset) -> bool:
+    """Конвертирует SavedModel в ONNX через tf2onnx; True при успехе."""
+    # 1. Используем тот же Python, что и для запуска скрипта
+    python_executable = sys.executable # <-- Ключевое изменение
+
+    command_list = [
+        python_executable, "-m", "tf2onnx.convert", # <-- Используем sys.executable
+        "--saved-model", saved_model_path,
+        "--output", onnx_output_path,
+        "--opset", str(opset)
+    ]
+
+    print("Планируемая команда:", shlex.join(command_list))
+
+    try:
+        result = subprocess.run(command_list, check=True, text=True)
+        print(" Конвертация завершена успешно!")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f" Ошибка при выполнении команды (код возврата {e.returncode}).")
+        print("Вы можете попробовать выполнить эту команду вручную в терминале:")
+        print(shlex.join(command_list))
+    except FileNotFoundError:
+        print(" Ошибка: Python не найден.")
+    except Exception as e:
+        print(f" Неожиданная ошибка: {e}")
+        print("Вы можете попробовать выполнить эту команду вручную в терминале:")
+        print(shlex.join(command_list))
+    return False
+
+
+def export_onnx(model, onnx_path: str, check_images, opset: int = opset, atol: float = 1e-4,
+                repeats: int = 100) -> dict:
+    """
+    Конвертирует Keras-модель в ONNX прямо в процессе, с динамической осью батча.
+    Перед публикацией файла сверяет выходы Keras и ONNX Runtime на check_images
+    и замеряет задержку ORT; отчёт сохраняется рядом как <имя>.export.json.
+    """
+    import json
+    import time
+    import numpy as np
+    import tensorflow as tf
+    import tf2onnx
+    from inference import make_session, percentiles, timed
+
+    spec = tf.TensorSpec((None,) + tuple(model.inputs[0].shape[1:]), tf.float32, name="input")
+
+    @tf.function(input_signature=[spec])
+    def serve(x):
+        return {"output_0": model(x, training=False)}
+
+    partial = onnx_path + ".partial"
+    start = time.perf_counter()
+    tf2onnx.convert.from_function(serve, input_signature=[spec], opset=opset, output_path=partial)
+    convert_s = time.perf_counter() - start
+
+    try:
+        check = np.ascontiguousarray(check_images, dtype=np.float32)
+        session = make_session(partial, threads=1)
+        inp = session.get_inputs()[0]
+        if isinstance(inp.shape[0], int):
+            raise ValueError(f"Ось батча в ONNX зафиксирована: {inp.shape}")
+        expected = model.predict(check, batch_size=256, verbose=0)
+        actual = session.run(None, {inp.name: check})[0]
+        max_abs = float(np.abs(actual - expected).max())
+        same_class = actual.argmax(axis=1) == expected.argmax(axis=1)
+        agreement = float(same_class.mean())
+        # Классы при почти равных вероятностях могут разойтись из-за округления — их не считаем ошибкой
+        top2 = np.sort(expected, axis=1)[:, -2:]
+        decisive = (top2[:, 1] - top2[:, 0]) > atol
+        print(f"Сверка Keras и ONNX Runtime на {len(check)} изображениях: "
+              f"макс. расхождение {max_abs:.2e}, совпадение классов {agreement * 100:.2f}%")
+        if max_abs > atol or not same_class[decisive].all():
+            raise ValueError(f"ONNX расходится с Keras (макс. {max_abs:.2e} > {atol:.0e} "
+                             f"или совпадение классов {agreement * 100:.2f}%)")
+
+        batch = np.ascontiguousarray(np.resize(check, (256,) + check.shape[1:]))
+        batch1 = percentiles(timed(lambda: session.run(None, {inp.name: check[:1]}), repeats))
+        batch256 = percentiles(timed(lambda: session.run(None, {inp.name: batch}), max(3, repeats // 10)))
+    except Exception:
+        os.remove(partial)
+        raise
+    os.replace(partial, onnx_path)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "onnx": onnx_path,
+        "opset": opset,
+        "convert_s": convert_s,
+        "check_images": int(len(check)),
+        "max_abs_diff": max_abs,
+        "class_agreement": agreement,
+        "latency_batch1_ms": batch1,
+        "latency_batch256_per_image_ms": batch256["p50"] / 256,
+        "size_kb": os.path.getsize(onnx_path) / 1024,
+    }
+    with open(os.path.splitext(onnx_path)[0] + ".export.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"ONNX модель сохранена как '{onnx_path}' "
+          f"(ORT, 1 поток: батч 1 p50 {batch1['p50']:.3f} мс, батч 256 {report['latency_batch256_per_image_ms']:.4f} мс/изобр.)")
+    return report
+
+
+if __name__ == "__main__":
+    convert_saved_model(saved_model_path, onnx_output_path, opset)
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from tensorflow.keras.callbacks import EarlyStopping
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return project_root
+
+
+project_root = get_project_root()
+sys.path.insert(0, os.path.join(project_root, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from inference import (DigitRecognizer, SessionConfig, MODEL_FILENAME, STUDENT_MODEL_FILENAME,  # noqa: E402
+                       make_session, percentiles, timed)
+from model import (ThroughputLogger, load_data, load_pretrained_model, make_eval_dataset,  # noqa: E402
+                   make_train_dataset)
+from convert_model_format import export_onnx  # noqa: E402
+from mnist_data import normalize  # noqa: E402
+
+models_dir = os.path.join(project_root, "src", "resources", "models")
+STUDENT_NAME = "student_digit_recognition_model"
+
+
+# Маленькая CNN-ученик: два свёрточных блока и узкий полносвязный слой
+def create_student_model(filters=(8, 16), dense=32):
+    """Выдаёт логиты; для экспорта оборачивается в with_softmax()."""
+    model = models.Sequential([layers.Input(shape=(28, 28, 1))])
+    for f in filters:
+        model.add(layers.Conv2D(f, (3, 3), activation='relu'))
+        model.add(layers.MaxPooling2D((2, 2)))
+    model.add(layers.Flatten())
+    model.add(layers.Dense(dense, activation='relu'))
+    model.add(layers.Dense(10))
+    return model
+
+
+def with_softmax(student):
+    """Модель с тем же выходом, что у учителя: вероятности классов."""
+    return models.Sequential([layers.Input(shape=(28, 28, 1)), student, layers.Softmax()])
+
+
+class Distiller(tf.keras.Model):
+    """
+    Обучение ученика на мягких метках учителя.
+
+    loss = alpha * CE(метки, ученик) + (1 - alpha) * T^2 * KL(учитель_T || ученик_T),
+    где _T — softmax с температурой T. Учитель выдаёт вероятности, поэтому
+    его логиты восстанавливаются как log(p) (с точностью до константы, которая
+    в softmax сокращается). Учитель считается на тех же аугментированных батчах.
+    """
+
+    def __init__(self, student, teacher, temperature=4.0, alpha=0.1):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.temperature = temperature
+        self.alpha = alpha
+        self.loss_tracker = tf.keras.metrics.Mean(name="loss")
+        self.accuracy = tf.keras.metrics.SparseCategoricalAccuracy(name="accuracy")
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.accuracy]
+
+    def call(self, x, training=False):
+        return self.student(x, training=training)
+
+    def _hard_loss(self, y, logits):
+        return tf.reduce_mean(tf.keras.losses.sparse_categorical_crossentropy(y, logits, from_logits=True))
+
+    def train_step(self, data):
+        x, y = data
+        t = self.temperature
+        teacher_probs = self.teacher(x, training=False)
+        teacher_log_soft = tf.nn.log_softmax(tf.math.log(tf.clip_by_value(teacher_probs, 1e-7, 1.0)) / t)
+        soft_targets = tf.exp(teacher_log_soft)
+        with tf.GradientTape() as tape:
+            logits = self.student(x, training=True)
+            kl = tf.reduce_sum(soft_targets * (teacher_log_soft - tf.nn.log_softmax(logits / t)), axis=1)
+            soft_loss = tf.reduce_mean(kl)
+            loss = self.alpha * self._hard_loss(y, logits) + (1.0 - self.alpha) * t * t * soft_loss
+        grads = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(grads, self.student.trainable_variables))
+        self.loss_tracker.update_state(loss)
+        self.accuracy.update_state(y, logits)
+        return {m.name: m.result() for m in self.metrics}
+
+    def test_step(self, data):
+        x, y = data
+        logits = self.student(x, training=False)
+        self.loss_tracker.update_state(self._hard_loss(y, logits))
+        self.accuracy.update_state(y, logits)
+        return {m.name: m.result() for m in self.metrics}
+
+
+def measure(onnx_path, x_test, y_test, repeats):
+    """Точность на тесте и задержка ORT (1 поток) для батча 1 и батча 256."""
+    recognizer = DigitRecognizer(onnx_path, batch_size=1000, config=SessionConfig(optimized_cache=False))
+    correct = 0
+    for i in range(0, len(y_test), 1000):
+        probs = recognizer.predict_batch(x_test[i:i + 1000])
+        correct += int((probs.argmax(axis=1) == y_test[i:i + 1000]).sum())
+
+    session = make_session(onnx_path, threads=1)
+    name = session.get_inputs()[0].name
+    single = np.ascontiguousarray(x_test[:1])
+    batch = np.ascontiguousarray(np.resize(x_test, (256,) + x_test.shape[1:]))
+    batch1 = percentiles(timed(lambda: session.run(None, {name: single}), repeats))
+    batch256 = percentiles(timed(lambda: session.run(None, {name: batch}), max(3, repeats // 10)))
+    return {
+        "accuracy": correct / len(y_test),
+        "latency_batch1_ms": batch1,
+        "latency_batch256_per_image_ms": batch256["p50"] / 256,
+        "size_kb": os.path.getsize(onnx_path) / 1024,
+    }
+
+
+def print_report(report):
+    rows = [("учитель", report["teacher"]), ("ученик", report["student"])]
+    print(f"\n{'модель':<10}{'точность':>10}{'параметры':>12}{'p50, мс':>10}{'p95, мс':>10}"
+          f"{'мс/изобр. (256)':>18}{'размер, КБ':>12}")
+    for name, r in rows:
+        lat = r["latency_batch1_ms"]
+        print(f"{name:<10}{r['accuracy'] * 100:>9.2f}%{r['params']:>12,}{lat['p50']:>10.3f}{lat['p95']:>10.3f}"
+              f"{r['latency_batch256_per_image_ms']:>18.4f}{r['size_kb']:>12.0f}")
+    speedup = report["teacher"]["latency_batch1_ms"]["p50"] / report["student"]["latency_batch1_ms"]["p50"]
+    print(f"Ускорение (батч 1, p50): {speedup:.1f}x, "
+          f"потеря точности: {(report['teacher']['accuracy'] - report['student']['accuracy']) * 100:.2f} п.п.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дистилляция модели в маленькую CNN-ученик")
+    parser.add_argument("--teacher", help="модель-учитель (.keras/.h5 или SavedModel; по умолчанию — из resources/models)")
+    parser.add_argument("--teacher-onnx", default=os.path.join(models_dir, MODEL_FILENAME),
+                        help="ONNX учителя для сравнения (если нет — будет сконвертирован)")
+    parser.add_argument("--filters", default="8,16", help="число фильтров в свёрточных блоках ученика")
+    parser.add_argument("--dense", type=int, default=32, help="ширина полносвязного слоя ученика")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.1, help="вес жёстких меток в функции потерь")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=200, help="повторов при замере задержки")
+    parser.add_argument("--output-dir", default=models_dir)
+    parser.add_argument("--report", default="distill_report.json")
+    args = parser.parse_args()
+
+    (x_train, y_train), (x_val, y_val), (x_test, y_test) = load_data()
+    # Обучение нормализует uint8 по батчам, а сверке ONNX и замерам нужен float32-массив
+    x_test = normalize(x_test)
+
+    teacher = load_pretrained_model(args.teacher)
+    student = create_student_model(tuple(int(v) for v in args.filters.split(",")), args.dense)
+    distiller = Distiller(student, teacher, temperature=args.temperature, alpha=args.alpha)
+    distiller.compile(optimizer=tf.keras.optimizers.Adam(1e-3))
+
+    print(f"Учитель: {teacher.count_params():,} параметров, ученик: {student.count_params():,}")
+    start = time.perf_counter()
+    distiller.fit(
+        make_train_dataset(x_train, y_train, batch_size=args.batch_size),
+        epochs=args.epochs,
+        validation_data=make_eval_dataset(x_val, y_val),
+        callbacks=[
+            EarlyStopping(monitor='val_accuracy', mode='max', patience=5, restore_best_weights=True, verbose=1),
+            ThroughputLogger(len(x_train)),
+        ],
+        verbose=1
+    )
+    print(f"Дистилляция заняла {time.perf_counter() - start:.0f} с")
+
+    # Экспорт тем же путём, что и у основной модели: проверенная конвертация в ONNX
+    deployable = with_softmax(student)
+    keras_path = os.path.join(args.output_dir, f"{STUDENT_NAME}.keras")
+    onnx_path = os.path.join(args.output_dir, STUDENT_MODEL_FILENAME)
+    deployable.save(keras_path)
+    export_onnx(deployable, onnx_path, x_test[:1000])
+
+    teacher_onnx = args.teacher_onnx
+    if not os.path.exists(teacher_onnx):
+        export_onnx(teacher, teacher_onnx, x_test[:1000])
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "temperature": args.temperature,
+            "alpha": args.alpha,
+            "student_filters": args.filters,
+            "student_dense": args.dense,
+            "test_images": int(len(y_test)),
+        },
+        "teacher": {"onnx": teacher_onnx, "params": int(teacher.count_params()),
+                    **measure(teacher_onnx, x_test, y_test, args.repeats)},
+        "student": {"onnx": onnx_path, "params": int(student.count_params()),
+                    **measure(onnx_path, x_test, y_test, args.repeats)},
+    }
+    print_report(report)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Отчёт записан в '{args.report}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+from onnx import TensorProto
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return project_root
+
+
+project_root = get_project_root()
+sys.path.insert(0, os.path.join(project_root, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from inference import GRADCAM_MODEL_FILENAME, SessionConfig  # noqa: E402
+from explain import GradCamExplainer  # noqa: E402
+from gradcam import GradCAM  # noqa: E402
+import mnist_data  # noqa: E402
+
+models_dir = os.path.join(project_root, "src", "resources", "models")
+opset = 15
+
+
+def _relu_grad(ctx, node, name, args):
+    # В ONNX нет ReluGrad: grad * (features > 0)
+    grads, features = node.input
+    zero = ctx.make_const(tf2onnx.utils.make_name("zero"), np.zeros((), np.float32)).output[0]
+    mask = ctx.make_node("Greater", [features, zero]).output[0]
+    mask = ctx.make_node("Cast", [mask], attr={"to": TensorProto.FLOAT}).output[0]
+    node.type = "Mul"
+    ctx.replace_inputs(node, [grads, mask])
+
+
+def make_export_function(cam: GradCAM):
+    """tf.function: изображения -> вероятности, активации и градиенты предсказанного класса."""
+    grad_model = cam.grad_model
+    n_classes = grad_model.outputs[1].shape[-1]
+
+    @tf.function(input_signature=[tf.TensorSpec((None,) + cam.input_shape, tf.float32, name="input")])
+    def gradcam_outputs(images):
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions = grad_model(images, training=False)
+            # Маска one-hot вместо gather: градиент — простое умножение, граф ONNX остаётся компактным
+            mask = tf.one_hot(tf.argmax(predictions, axis=1), n_classes, dtype=predictions.dtype)
+            loss = tf.reduce_sum(predictions * mask)
+        grads = tape.gradient(loss, conv_outputs)
+        return {
+            "probs": tf.identity(predictions),
+            "activations": tf.identity(conv_outputs),
+            "gradients": tf.identity(grads),
+        }
+
+    return gradcam_outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт вспомогательного ONNX-графа для Grad-CAM в приложении")
+    parser.add_argument("--model", default=os.path.join(models_dir, "improved_digit_recognition_model.keras"))
+    parser.add_argument("--layer", help="имя сверточного слоя (по умолчанию — последний)")
+    parser.add_argument("--output", default=os.path.join(models_dir, GRADCAM_MODEL_FILENAME))
+    parser.add_argument("--check-size", type=int, default=256, help="изображений для сверки с TensorFlow")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    cam = GradCAM(model, args.layer)
+    fn = make_export_function(cam)
+
+    partial = args.output + ".partial"
+    tf2onnx.convert.from_function(
+        fn, input_signature=fn.input_signature, opset=opset, output_path=partial,
+        custom_op_handlers={"ReluGrad": (_relu_grad, [])},
+    )
+
+    # Сверка с Grad-CAM на TensorFlow до публикации файла
+    x = mnist_data.load("test").head(args.check_size).normalized(channel_axis=True)
+    expected, expected_probs = cam.heatmaps(x)
+    # Без кэша оптимизированного графа: иначе рядом с временным .partial останется лишний файл
+    heatmaps, probs = GradCamExplainer(partial, SessionConfig(optimized_cache=False)).explain_batch(x)
+    heat_diff = float(np.abs(heatmaps - expected).max())
+    prob_diff = float(np.abs(probs - expected_probs).max())
+    print(f"Расхождение с TensorFlow: heatmap {heat_diff:.2e}, вероятности {prob_diff:.2e}")
+    if heat_diff > 1e-3 or prob_diff > 1e-4:
+        os.remove(partial)
+        print("Расхождение слишком велико — граф не сохранён.")
+        sys.exit(1)
+    os.replace(partial, args.output)
+    print(f"Граф Grad-CAM сохранён как '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
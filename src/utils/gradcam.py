@@ -1,9 +1,13 @@
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
 import numpy as np
 import matplotlib.pyplot as plt
 import tensorflow as tf
-from tensorflow.keras.datasets import mnist
 import cv2
-import os
 
 
 def get_project_root():
@@ -12,6 +16,11 @@ def get_project_root():
     return project_root
 
 
+sys.path.insert(0, os.path.join(get_project_root(), "src"))
+
+import mnist_data  # noqa: E402
+
+
 def find_last_conv_layer(model):
     """
     Находит имя последнего сверточного слоя в модели
@@ -25,83 +34,110 @@ def find_last_conv_layer(model):
     return None
 
 
-# Загружаем модель
-project_root = get_project_root()
-model_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model.keras")
-model = tf.keras.models.load_model(model_path)
-
-print("Model type:", type(model))
-print("Trainable params:", model.count_params())
-
-# Показываем все слои для отладки
-print("\nСлои модели:")
-for i, layer in enumerate(model.layers):
-    print(f"{i}: {layer.name} ({type(layer).__name__})")
-
-# Находим последний сверточный слой автоматически
-last_conv_layer_name = find_last_conv_layer(model)
-if last_conv_layer_name is None:
-    raise ValueError("Не найден ни один сверточный слой в модели!")
-
-# Загружаем тестовые данные MNIST
-(_, _), (x_test, y_test) = mnist.load_data()
-x_test = x_test / 255.0
-x_test = np.expand_dims(x_test, axis=-1)
-
-# ВАЖНО: Прогоняем модель через данные для полной инициализации
-print("Инициализация модели...")
-dummy_input = np.expand_dims(x_test[0], axis=0)
-dummy_prediction = model(dummy_input)
-print("Модель инициализирована")
-
-# Создаем копию модели для Grad-CAM (без обучения)
-print("Создание копии модели для Grad-CAM...")
-model_copy = tf.keras.models.clone_model(model)
-model_copy.set_weights(model.get_weights())
-model_copy.trainable = False
+# ---------- Grad-CAM ----------
+class GradCAM:
+    """
+    Grad-CAM для пачки изображений.
 
+    Модель градиентов строится один раз, прямой и обратный проход скомпилированы
+    в tf.function. Для N изображений — одна лента: градиент суммы выбранных
+    логитов по активациям даёт градиенты каждого изображения сразу (изображения
+    в режиме инференса друг от друга не зависят), а веса каналов применяются
+    одной свёрткой einsum вместо цикла по каналам.
+    """
 
-# Функция Grad-CAM (исправленная)
+    def __init__(self, model, last_conv_layer_name=None):
+        self.model = model
+        self.layer_name = last_conv_layer_name or find_last_conv_layer(model)
+        if self.layer_name is None:
+            raise ValueError("Не найден ни один сверточный слой в модели!")
+        self.input_shape = tuple(model.inputs[0].shape[1:])
+        self.grad_model = self._build_grad_model(model, self.layer_name, self.input_shape)
+        self._compute = tf.function(
+            self._forward_backward,
+            input_signature=[
+                tf.TensorSpec((None,) + self.input_shape, tf.float32),
+                tf.TensorSpec((None,), tf.int32),
+            ],
+        )
+
+    @staticmethod
+    def _build_grad_model(model, layer_name, input_shape):
+        """Модель (изображения) -> (активации слоя, предсказания) на тех же весах, без копии модели."""
+        if isinstance(model, tf.keras.Sequential):
+            # Выход слоя внутри Sequential не связан с model.outputs — проводим вход через слои заново
+            inputs = tf.keras.Input(shape=input_shape)
+            x, conv_outputs = inputs, None
+            for layer in model.layers:
+                x = layer(x)
+                if layer.name == layer_name:
+                    conv_outputs = x
+            return tf.keras.models.Model(inputs=inputs, outputs=[conv_outputs, x])
+        return tf.keras.models.Model(
+            inputs=model.inputs,
+            outputs=[model.get_layer(layer_name).output, model.outputs[0]]
+        )
+
+    def _forward_backward(self, images, class_idx):
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions = self.grad_model(images, training=False)
+            # Отрицательный индекс — объяснять предсказанный класс
+            predicted = tf.argmax(predictions, axis=1, output_type=tf.int32)
+            class_idx = tf.where(class_idx >= 0, class_idx, predicted)
+            loss = tf.reduce_sum(tf.gather(predictions, class_idx, axis=1, batch_dims=1))
+        grads = tape.gradient(loss, conv_outputs)
+
+        # Веса каналов (N, C) и взвешенное среднее по каналам за одну редукцию
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+        channels = tf.cast(tf.shape(conv_outputs)[-1], tf.float32)
+        heatmaps = tf.nn.relu(tf.einsum("nhwc,nc->nhw", conv_outputs, pooled_grads) / channels)
+        peak = tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True)
+        return tf.math.divide_no_nan(heatmaps, peak), predictions
+
+    def heatmaps(self, images, class_idx=None, batch_size=256):
+        """
+        Heatmap'ы (N, h, w) в [0, 1] и вероятности (N, классы) для пачки изображений.
+        class_idx — классы для объяснения; по умолчанию предсказанные.
+        """
+        images = np.asarray(images, dtype=np.float32).reshape((-1,) + self.input_shape)
+        n = len(images)
+        if class_idx is None:
+            class_idx = np.full(n, -1, dtype=np.int32)
+        class_idx = np.asarray(class_idx, dtype=np.int32).reshape(n)
+        maps, probs = [], []
+        for i in range(0, n, batch_size):
+            h, p = self._compute(tf.constant(images[i:i + batch_size]), tf.constant(class_idx[i:i + batch_size]))
+            maps.append(h.numpy())
+            probs.append(p.numpy())
+        if not maps:
+            return np.zeros((0, 0, 0), dtype=np.float32), np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(maps), np.concatenate(probs)
+
+
+# Последние GradCAM по (id модели, слой): make_gradcam_heatmap в цикле не пересобирает
+# модель градиентов и не перетрассирует tf.function. GradCAM держит ссылку на модель,
+# поэтому id не может достаться другой модели, пока запись в кэше.
+_GRADCAM_CACHE_SIZE = 4
+_gradcam_cache: "OrderedDict[tuple, GradCAM]" = OrderedDict()
+
+
+def get_gradcam(model, last_conv_layer_name=None):
+    """GradCAM для модели и слоя из небольшого LRU-кэша (создаётся при первом обращении)."""
+    key = (id(model), last_conv_layer_name)
+    cam = _gradcam_cache.get(key)
+    if cam is None or cam.model is not model:
+        cam = GradCAM(model, last_conv_layer_name)
+        _gradcam_cache[key] = cam
+        while len(_gradcam_cache) > _GRADCAM_CACHE_SIZE:
+            _gradcam_cache.popitem(last=False)
+    _gradcam_cache.move_to_end(key)
+    return cam
+
+
+# Функция Grad-CAM для одного изображения (оставлена для совместимости)
 def make_gradcam_heatmap(img_array, model, last_conv_layer_name):
-    # Преобразуем numpy массив в TensorFlow тензор
-    img_array = tf.cast(img_array, tf.float32)
-    img_array = tf.expand_dims(img_array, axis=0)
-
-    # Получаем последний сверточный слой
-    last_conv_layer = model.get_layer(last_conv_layer_name)
-
-    # Создаем модель для получения градиентов
-    grad_model = tf.keras.models.Model(
-        inputs=model.layers[0].input,
-        outputs=[last_conv_layer.output, model.layers[-1].output]
-    )
-
-    with tf.GradientTape() as tape:
-        tape.watch(img_array)
-        conv_outputs, predictions = grad_model(img_array)
-        class_idx = tf.argmax(predictions[0])
-        loss = predictions[:, class_idx]
-
-    grads = tape.gradient(loss, conv_outputs)
-    if grads is None:
-        raise ValueError("Градиенты равны None. Проверьте имя слоя и модель.")
-
-    # Вычисляем heatmap
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-    conv_outputs = conv_outputs[0].numpy()
-    pooled_grads = pooled_grads.numpy()
-
-    for i in range(pooled_grads.shape[-1]):
-        conv_outputs[:, :, i] *= pooled_grads[i]
-
-    heatmap = np.mean(conv_outputs, axis=-1)
-    heatmap = np.maximum(heatmap, 0)
-    if np.max(heatmap) > 0:
-        heatmap = heatmap / np.max(heatmap)
-    else:
-        heatmap = np.zeros_like(heatmap)
-
-    return heatmap
+    heatmaps, _ = get_gradcam(model, last_conv_layer_name).heatmaps(img_array[None])
+    return heatmaps[0]
 
 
 # Визуализация Grad-CAM
@@ -114,46 +150,120 @@ def show_gradcam(img, heatmap, alpha=0.4):
     return superimposed_img
 
 
-# Пример на случайном изображении
-print("Выбираем случайное изображение...")
-i = np.random.randint(0, len(x_test))
-test_img, true_label = x_test[i], y_test[i]
-
-print(f"Изображение {i}, истинная метка: {true_label}")
-
-# Вызываем Grad-CAM с автоматически найденным слоем
-try:
-    print("Выполняем Grad-CAM...")
-    heatmap = make_gradcam_heatmap(test_img, model_copy, last_conv_layer_name)
-
-    if heatmap is not None:
-        gradcam_img = show_gradcam(test_img.squeeze(), heatmap)
-
-        # Визуализация
-        plt.figure(figsize=(12, 4))
-        plt.subplot(1, 3, 1)
-        plt.imshow(test_img.squeeze(), cmap="gray")
-        plt.title(f"Оригинал (label={true_label})")
-        plt.axis('off')
-
-        plt.subplot(1, 3, 2)
-        plt.imshow(heatmap, cmap="jet")
-        plt.title("Grad-CAM Heatmap")
-        plt.axis('off')
-
-        plt.subplot(1, 3, 3)
-        plt.imshow(gradcam_img)
-        plt.title("Grad-CAM Overlay")
-        plt.axis('off')
-
-        plt.tight_layout()
-        plt.show()
-        print("Grad-CAM успешно выполнен!")
-    else:
-        print("Не удалось создать heatmap")
-
-except Exception as e:
-    print(f"Ошибка: {e}")
-    import traceback
-
-    traceback.print_exc()
\ No newline at end of file
+def make_montage(images, heatmaps, captions, cols=10, scale=4, alpha=0.4):
+    """Сетка наложений Grad-CAM (BGR uint8) с подписями под каждой ячейкой."""
+    n = len(images)
+    size = images.shape[1] * scale
+    caption_h = 14
+    rows = (n + cols - 1) // cols
+    montage = np.full((rows * (size + caption_h), cols * size, 3), 255, dtype=np.uint8)
+    # Все изображения и heatmap'ы увеличиваются одним вызовом на пачку
+    imgs = tf.image.resize(images.reshape(n, images.shape[1], images.shape[2], 1), (size, size), "nearest")
+    maps = tf.image.resize(heatmaps[..., None], (size, size), "bilinear")
+    gray = np.uint8(255 * np.clip(imgs.numpy()[..., 0], 0, 1))
+    colored = cv2.applyColorMap(np.uint8(255 * np.clip(maps.numpy()[..., 0], 0, 1)).reshape(-1, size),
+                                cv2.COLORMAP_JET).reshape(n, size, size, 3)
+    overlay = (gray[..., None] * (1 - alpha) + colored * alpha).astype(np.uint8)
+    for i in range(n):
+        r, c = divmod(i, cols)
+        y = r * (size + caption_h)
+        montage[y:y + size, c * size:(c + 1) * size] = overlay[i]
+        cv2.putText(montage, captions[i], (c * size + 2, y + size + caption_h - 3),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 0, 0), 1, cv2.LINE_AA)
+    return montage
+
+
+def write_montages(output_dir, images, heatmaps, captions, per_page=100, cols=10, scale=4):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for page, i in enumerate(range(0, len(images), per_page)):
+        montage = make_montage(images[i:i + per_page], heatmaps[i:i + per_page], captions[i:i + per_page],
+                               cols=cols, scale=scale)
+        path = os.path.join(output_dir, f"gradcam_{page:03d}.png")
+        cv2.imwrite(path, montage)
+        paths.append(path)
+    return paths
+
+
+def show_single(cam, x_test, y_test):
+    # Пример на случайном изображении
+    print("Выбираем случайное изображение...")
+    i = np.random.randint(0, len(x_test))
+    test_img, true_label = x_test[i], y_test[i]
+    print(f"Изображение {i}, истинная метка: {true_label}")
+
+    heatmaps, _ = cam.heatmaps(test_img[None])
+    heatmap = heatmaps[0]
+    gradcam_img = show_gradcam(test_img.squeeze(), heatmap)
+
+    # Визуализация
+    plt.figure(figsize=(12, 4))
+    plt.subplot(1, 3, 1)
+    plt.imshow(test_img.squeeze(), cmap="gray")
+    plt.title(f"Оригинал (label={true_label})")
+    plt.axis('off')
+
+    plt.subplot(1, 3, 2)
+    plt.imshow(heatmap, cmap="jet")
+    plt.title("Grad-CAM Heatmap")
+    plt.axis('off')
+
+    plt.subplot(1, 3, 3)
+    plt.imshow(gradcam_img)
+    plt.title("Grad-CAM Overlay")
+    plt.axis('off')
+
+    plt.tight_layout()
+    plt.show()
+
+
+def main():
+    project_root = get_project_root()
+    parser = argparse.ArgumentParser(description="Grad-CAM для тестовых изображений MNIST")
+    parser.add_argument("--model", default=os.path.join(project_root, "src", "resources", "models",
+                                                        "improved_digit_recognition_model.keras"))
+    parser.add_argument("--layer", help="имя сверточного слоя (по умолчанию — последний)")
+    parser.add_argument("--mode", choices=["misclassified", "all", "random"], default="misclassified",
+                        help="misclassified/all — записать монтажи в --output-dir, random — показать одно изображение")
+    parser.add_argument("--limit", type=int, default=0, help="не больше N изображений в монтажах")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--per-page", type=int, default=100, help="изображений на один файл монтажа")
+    parser.add_argument("--scale", type=int, default=4, help="увеличение 28x28 в монтаже")
+    parser.add_argument("--output-dir", default="gradcam_output")
+    args = parser.parse_args()
+
+    # Загружаем модель
+    model = tf.keras.models.load_model(args.model)
+    print("Model type:", type(model))
+    print("Trainable params:", model.count_params())
+    cam = GradCAM(model, args.layer)
+
+    # Загружаем тестовые данные MNIST
+    test = mnist_data.load("test")
+    x_test, y_test = test.normalized(channel_axis=True), test.labels
+
+    if args.mode == "random":
+        show_single(cam, x_test, y_test)
+        return
+
+    start = time.perf_counter()
+    # Один проход по всему тесту: предсказания и heatmap'ы предсказанных классов
+    heatmaps, probs = cam.heatmaps(x_test, batch_size=args.batch_size)
+    predicted = probs.argmax(axis=1)
+    elapsed = time.perf_counter() - start
+    print(f"Grad-CAM для {len(x_test)} изображений: {elapsed:.2f} с ({len(x_test) / elapsed:.0f} изображений/с)")
+
+    selected = np.arange(len(x_test)) if args.mode == "all" else np.nonzero(predicted != y_test)[0]
+    if args.limit:
+        selected = selected[:args.limit]
+    print(f"Изображений в монтажах: {len(selected)}")
+    captions = [f"#{i} t={y_test[i]} p={predicted[i]}" for i in selected]
+    paths = write_montages(args.output_dir, x_test[selected, ..., 0], heatmaps[selected], captions,
+                           per_page=args.per_page, scale=args.scale)
+    for p in paths:
+        print(f"Сохранено: {p}")
+    print(f"Готово за {time.perf_counter() - start:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
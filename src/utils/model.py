@@ -1,6 +1,12 @@
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
-from tensorflow.keras.datasets import mnist
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 from tensorflow.keras.optimizers import AdamW
 from tensorflow.keras.regularizers import l2
@@ -8,6 +14,8 @@ from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
 import os
 
+from convert_model_format import export_onnx
+
 def get_project_root():
     """Возвращает путь к корневой директории проекта."""
     # Получаем путь к текущему файлу
@@ -16,119 +24,304 @@ def get_project_root():
     project_root = os.path.dirname(os.path.dirname(current_dir))
     return project_root
 
+sys.path.insert(0, os.path.join(get_project_root(), "src"))
+
+import mnist_data  # noqa: E402
+
 # Отключаем предупреждения
 tf.get_logger().setLevel('ERROR')
 
-# Загружаем данные MNIST
-(x_train, y_train), (x_test, y_test) = mnist.load_data()
-
-# Нормализуем данные
-x_train, x_test = x_train / 255.0, x_test / 255.0
+AUTOTUNE = tf.data.AUTOTUNE
 
-# Добавляем размерность для сверточной сети
-x_train_cnn = x_train.reshape(-1, 28, 28, 1)
-x_test_cnn = x_test.reshape(-1, 28, 28, 1)
+MODELS_DIR = os.path.join(get_project_root(), "src", "resources", "models")
+KERAS_MODEL_PATH = os.path.join(MODELS_DIR, "improved_digit_recognition_model.keras")
+ONNX_MODEL_PATH = os.path.join(MODELS_DIR, "improved_digit_recognition_model.onnx")
+SAVEDMODEL_PATH = os.path.join(MODELS_DIR, "improved_digit_recognition_model_savedmodel")
 
-# Разделяем обучающую выборку на train и validation
-x_train_split, x_val, y_train_split, y_val = train_test_split(
-    x_train_cnn, y_train, test_size=0.1, random_state=42, stratify=y_train
-)
+# Диапазоны аугментации — те же, что были у ImageDataGenerator
+ROTATION_RANGE = 10      # градусы
+ZOOM_RANGE = 0.1         # масштаб в [0.9, 1.1] независимо по осям
+SHIFT_RANGE = 0.1        # доля ширины/высоты
+SHEAR_RANGE = 0.1        # градусы, как shear_range в ImageDataGenerator
 
 
 # Улучшенная CNN модель
-def create_improved_cnn_model():
-    model = models.Sequential([
-        # Первый блок
-        layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
-        layers.BatchNormalization(),
-        layers.Conv2D(32, (3, 3), activation='relu'),
-        layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
-
-        # Второй блок
-        layers.Conv2D(64, (3, 3), activation='relu'),
-        layers.BatchNormalization(),
-        layers.Conv2D(64, (3, 3), activation='relu'),
-        layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
-
-        # Третий блок
-        layers.Conv2D(128, (3, 3), activation='relu'),
-        layers.BatchNormalization(),
-        layers.Dropout(0.3),
-
-        # Классификационный блок
-        layers.Flatten(),
-        layers.Dense(512, activation='relu', kernel_regularizer=l2(1e-4)),
-        layers.BatchNormalization(),
-        layers.Dropout(0.5),
-        layers.Dense(10, activation='softmax')
-    ])
+def create_improved_cnn_model(filters=(32, 64, 128), dense_units=512):
+    """
+    filters — число фильтров по блокам: все блоки, кроме последнего, состоят из
+    двух свёрток и пулинга, последний — из одной свёртки. По умолчанию —
+    исходная архитектура (три блока 32/64/128 и полносвязный слой на 512).
+    """
+    model = models.Sequential()
+    for i, f in enumerate(filters):
+        kwargs = {'input_shape': (28, 28, 1)} if i == 0 else {}
+        if i < len(filters) - 1:
+            # Блоки из двух свёрток с пулингом
+            model.add(layers.Conv2D(f, (3, 3), activation='relu', **kwargs))
+            model.add(layers.BatchNormalization())
+            model.add(layers.Conv2D(f, (3, 3), activation='relu'))
+            model.add(layers.MaxPooling2D((2, 2)))
+            model.add(layers.Dropout(0.25))
+        else:
+            # Последний блок
+            model.add(layers.Conv2D(f, (3, 3), activation='relu', **kwargs))
+            model.add(layers.BatchNormalization())
+            model.add(layers.Dropout(0.3))
+
+    # Классификационный блок
+    model.add(layers.Flatten())
+    model.add(layers.Dense(dense_units, activation='relu', kernel_regularizer=l2(1e-4)))
+    model.add(layers.BatchNormalization())
+    model.add(layers.Dropout(0.5))
+    model.add(layers.Dense(10, activation='softmax'))
     return model
 
 
-# Создаем модель
-model = create_improved_cnn_model()
-
-# Компилируем с улучшенным оптимизатором
-model.compile(
-    optimizer=AdamW(learning_rate=0.001, weight_decay=1e-4),
-    loss='sparse_categorical_crossentropy',
-    metrics=['accuracy']
-)
-
-# Callbacks для лучшего обучения
-callbacks = [
-    EarlyStopping(
-        monitor='val_loss',
-        patience=15,
-        restore_best_weights=True,
-        verbose=1
-    ),
-    ReduceLROnPlateau(
-        monitor='val_loss',
-        factor=0.2,
-        patience=7,
-        min_lr=1e-7,
-        verbose=1
-    )
-]
-
-# Аугментация данных
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-
-datagen = ImageDataGenerator(
-    rotation_range=10,
-    zoom_range=0.1,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.1
-)
+def load_pretrained_model(path=None):
+    """
+    Готовая модель для дообучения. .keras/.h5 загружаются как есть; из SavedModel
+    (его экспортирует обучение и он лежит в репозитории) веса переносятся
+    в create_improved_cnn_model() по порядку с проверкой форм.
+    """
+    if path is None:
+        path = KERAS_MODEL_PATH if os.path.exists(KERAS_MODEL_PATH) else SAVEDMODEL_PATH
+    if not os.path.isdir(path):
+        return tf.keras.models.load_model(path, compile=False)
+    loaded = tf.saved_model.load(path)
+    # Состояния генераторов случайных чисел Dropout весами модели не являются
+    variables = [v for v in loaded.variables if "seed_generator" not in v.name]
+    model = create_improved_cnn_model()
+    if len(variables) != len(model.weights):
+        raise ValueError(f"В SavedModel {len(variables)} весов, в модели {len(model.weights)}")
+    for weight, value in zip(model.weights, variables):
+        if tuple(weight.shape) != tuple(value.shape):
+            raise ValueError(f"Форма {weight.path} {tuple(weight.shape)} != {tuple(value.shape)} в SavedModel")
+        weight.assign(value)
+    return model
 
-datagen.fit(x_train_split)
 
-# Обучаем модель с аугментацией и правильной валидацией
-print("Начинаем обучение...")
-history = model.fit(
-    datagen.flow(x_train_split, y_train_split, batch_size=128),
-    epochs=200, # 200
-    validation_data=(x_val, y_val),
-    callbacks=callbacks,
-    verbose=1
-)
+# ---------- Данные ----------
+def load_data():
+    """
+    MNIST из общего кэша mnist_data с осью канала: train/validation/test.
+    Изображения остаются uint8 — во float32 их переводят make_train_dataset
+    и make_eval_dataset по батчам, а там, где нужен массив, — mnist_data.normalize().
+    """
+    train, test = mnist_data.load("train"), mnist_data.load("test")
 
-# Оцениваем модель на тестовых данных
-test_loss, test_acc = model.evaluate(x_test_cnn, y_test, verbose=0)
-print(f"\nТочность на тестовых данных: {test_acc:.4f}")
+    # Разделяем обучающую выборку на train и validation по индексам:
+    # разбиение то же, что и при разделении самих массивов
+    train_idx, val_idx = train_test_split(
+        np.arange(len(train)), test_size=0.1, random_state=42, stratify=train.labels
+    )
+    x_train = train.images[..., None]
+    y_train = np.asarray(train.labels)
+    return ((x_train[train_idx], y_train[train_idx]), (x_train[val_idx], y_train[val_idx]),
+            (test.images[..., None], test.labels))
+
+
+def to_float(images):
+    """uint8 в [0, 255] -> float32 в [0, 1]; float-батчи проходят как есть."""
+    if images.dtype == tf.uint8:
+        return tf.cast(images, tf.float32) / 255.0
+    return images
+
+
+def random_affine_transforms(batch_size, height, width):
+    """
+    Случайные аффинные преобразования для всего батча сразу: (N, 8) в формате
+    ImageProjectiveTransform (отображение координат выхода в координаты входа).
+    Поворот, сдвиг, наклон и масштаб — вокруг центра изображения.
+    """
+    def uniform(limit):
+        return tf.random.uniform((batch_size,), -limit, limit)
+
+    theta = uniform(ROTATION_RANGE * math.pi / 180.0)
+    shear = uniform(SHEAR_RANGE * math.pi / 180.0)
+    zx = 1.0 + uniform(ZOOM_RANGE)
+    zy = 1.0 + uniform(ZOOM_RANGE)
+    tx = uniform(SHIFT_RANGE) * width
+    ty = uniform(SHIFT_RANGE) * height
+
+    # A = поворот @ наклон @ масштаб
+    cos_t, sin_t = tf.cos(theta), tf.sin(theta)
+    a00 = cos_t * zx
+    a01 = (-cos_t * tf.sin(shear) - sin_t * tf.cos(shear)) * zy
+    a10 = sin_t * zx
+    a11 = (-sin_t * tf.sin(shear) + cos_t * tf.cos(shear)) * zy
+
+    # вход = центр + A (выход - центр) + сдвиг
+    cx, cy = (width - 1) / 2.0, (height - 1) / 2.0
+    b0 = cx - a00 * cx - a01 * cy + tx
+    b1 = cy - a10 * cx - a11 * cy + ty
+    zeros = tf.zeros((batch_size,))
+    return tf.stack([a00, a01, b0, a10, a11, b1, zeros, zeros], axis=1)
+
+
+def augment_batch(images, labels):
+    """Аугментация батча в графе TensorFlow одним вызовом ImageProjectiveTransformV3."""
+    images = to_float(images)
+    shape = tf.shape(images)
+    transforms = random_affine_transforms(shape[0], tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32))
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        fill_mode="NEAREST",
+    )
+    return images, labels
+
+
+def make_train_dataset(x, y, batch_size=128):
+    """
+    Обучающий конвейер: кэш исходных данных в памяти, перемешивание каждую эпоху,
+    батчи и векторная аугментация в параллельном map, предвыборка.
+    uint8-изображения кэшируются как есть и нормализуются уже в батчах.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((x, y)).cache()
+    ds = ds.shuffle(len(x), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(augment_batch, num_parallel_calls=AUTOTUNE, deterministic=False)
+    return ds.prefetch(AUTOTUNE)
+
+
+def make_eval_dataset(x, y, batch_size=512):
+    ds = tf.data.Dataset.from_tensor_slices((x, y)).batch(batch_size).cache()
+    return ds.map(lambda images, labels: (to_float(images), labels), num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Печатает скорость обучения за эпоху (изображений/с, без учёта валидации)."""
+
+    def __init__(self, n_samples):
+        super().__init__()
+        self.n_samples = n_samples
+        self.history = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._train_end = None
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._train_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = (self._train_end or time.perf_counter()) - self._start
+        rate = self.n_samples / elapsed if elapsed > 0 else 0.0
+        self.history.append(rate)
+        if logs is not None:
+            logs["samples_per_sec"] = rate
+        print(f"Эпоха {epoch + 1}: {rate:.0f} изображений/с ({elapsed:.1f} с на обучение)")
+
+
+# ---------- Чекпоинты ----------
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Раз в every эпох сохраняет всё, что нужно для продолжения обучения:
+    модель вместе с оптимизатором (в том числе текущий learning rate),
+    счётчики EarlyStopping и ReduceLROnPlateau, лучшие веса и историю метрик.
+    Файлы пишутся во временные и переименовываются, поэтому прерывание
+    во время сохранения не портит предыдущий чекпоинт.
+
+    Должен стоять в списке callbacks после EarlyStopping и ReduceLROnPlateau:
+    их состояние восстанавливается после того, как они сбросят его сами.
+    """
+    MODEL_FILE = "last.keras"
+    STATE_FILE = "state.json"
+    BEST_WEIGHTS_FILE = "best_weights.npz"
+
+    def __init__(self, directory, early_stopping=None, lr_plateau=None, every=1, state=None):
+        super().__init__()
+        self.directory = directory
+        self.early_stopping = early_stopping
+        self.lr_plateau = lr_plateau
+        self.every = max(1, int(every))
+        self._resume_state = state
+        self.history = {k: list(v) for k, v in (state or {}).get("history", {}).items()}
+        self._last_saved = (state or {}).get("epoch", 0)
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def load(cls, directory):
+        """Модель с оптимизатором и состояние обучения из последнего чекпоинта."""
+        with open(os.path.join(directory, cls.STATE_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+        model = tf.keras.models.load_model(os.path.join(directory, cls.MODEL_FILE))
+        best = os.path.join(directory, cls.BEST_WEIGHTS_FILE)
+        if os.path.exists(best):
+            with np.load(best) as f:
+                state["best_weights"] = [f[f"w{i}"] for i in range(len(f.files))]
+        return model, state
+
+    def on_train_begin(self, logs=None):
+        state = self._resume_state
+        if not state:
+            return
+        if self.early_stopping is not None and "early_stopping" in state:
+            es = state["early_stopping"]
+            self.early_stopping.wait = es["wait"]
+            self.early_stopping.best = es["best"]
+            self.early_stopping.best_epoch = es["best_epoch"]
+            self.early_stopping.best_weights = state.get("best_weights")
+        if self.lr_plateau is not None and "lr_plateau" in state:
+            lr = state["lr_plateau"]
+            self.lr_plateau.wait = lr["wait"]
+            self.lr_plateau.best = lr["best"]
+            self.lr_plateau.cooldown_counter = lr["cooldown_counter"]
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        if (epoch + 1) % self.every == 0:
+            self.save(epoch + 1)
+
+    def on_train_end(self, logs=None):
+        epochs_done = len(next(iter(self.history.values()), []))
+        if epochs_done > self._last_saved:
+            self.save(epochs_done)
+
+    def save(self, epoch):
+        stopped = bool(self.early_stopping is not None and self.early_stopping.stopped_epoch > 0)
+        state = {"epoch": epoch, "stopped_early": stopped, "history": self.history}
+        if self.early_stopping is not None:
+            es = self.early_stopping
+            best = None if es.best is None else float(es.best)
+            state["early_stopping"] = {"wait": es.wait, "best": best, "best_epoch": es.best_epoch}
+            if es.best_weights is not None:
+                self._replace(self.BEST_WEIGHTS_FILE, lambda p: np.savez(
+                    p, **{f"w{i}": w for i, w in enumerate(es.best_weights)}), suffix=".npz")
+        if self.lr_plateau is not None:
+            lr = self.lr_plateau
+            state["lr_plateau"] = {"wait": lr.wait, "best": float(lr.best), "cooldown_counter": lr.cooldown_counter}
+
+        self._replace(self.MODEL_FILE, self.model.save, suffix=".keras")
+
+        def write_state(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+        self._replace(self.STATE_FILE, write_state, suffix=".json")
+        self._last_saved = epoch
+
+    def _replace(self, name, write, suffix):
+        # Keras требует правильное расширение и у временного файла
+        target = os.path.join(self.directory, name)
+        tmp = os.path.join(self.directory, f"{name}.tmp{suffix}")
+        write(tmp)
+        os.replace(tmp, target)
 
 
 # Визуализация обучения
 def plot_training_history(history):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
 
+    # history — словарь метрик по эпохам (или объект History из model.fit)
+    history = getattr(history, "history", history)
+
     # График потерь
-    ax1.plot(history.history['loss'], label='Training Loss', color='blue')
-    ax1.plot(history.history['val_loss'], label='Validation Loss', color='red')
+    ax1.plot(history['loss'], label='Training Loss', color='blue')
+    ax1.plot(history['val_loss'], label='Validation Loss', color='red')
     ax1.set_title('Model Loss')
     ax1.set_xlabel('Epoch')
     ax1.set_ylabel('Loss')
@@ -136,8 +329,8 @@ def plot_training_history(history):
     ax1.grid(True)
 
     # График точности
-    ax2.plot(history.history['accuracy'], label='Training Accuracy', color='blue')
-    ax2.plot(history.history['val_accuracy'], label='Validation Accuracy', color='red')
+    ax2.plot(history['accuracy'], label='Training Accuracy', color='blue')
+    ax2.plot(history['val_accuracy'], label='Validation Accuracy', color='red')
     ax2.set_title('Model Accuracy')
     ax2.set_xlabel('Epoch')
     ax2.set_ylabel('Accuracy')
@@ -148,27 +341,120 @@ def plot_training_history(history):
     plt.show()
 
 
-# Показываем графики обучения
-plot_training_history(history)
-
-# Сохраняем модель
-project_root = get_project_root()
-model_save_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model.h5")
-model.save(model_save_path)
-print(f"Модель сохранена как '{model_save_path}'")
-
-# Сохраняем модель в формате Keras
-keras_save_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model.keras")
-model.save(keras_save_path)
-print(f"Модель сохранена в формате Keras как '{keras_save_path}'")
-
-# Также сохраняем в формате SavedModel
-savedmodel_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model_savedmodel")
-model.export(savedmodel_path)
-
-print(f"Модель также сохранена в формате SavedModel как '{savedmodel_path}'")
-
-# Выводим информацию о модели
-print("\nАрхитектура модели:")
-model.summary()
-
+def main():
+    parser = argparse.ArgumentParser(description="Обучение CNN для распознавания цифр")
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--no-plot", action="store_true", help="не показывать графики обучения")
+    parser.add_argument("--checkpoint-dir", default=os.path.join(get_project_root(), "checkpoints"))
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="сохранять чекпоинт каждые N эпох")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--resume", action="store_true", help="продолжить с последнего чекпоинта")
+    mode.add_argument("--warm-start", nargs="?", const="", metavar="PATH",
+                      help="дообучить готовую модель (.keras/.h5 или SavedModel; по умолчанию — из resources/models)")
+    parser.add_argument("--no-onnx", action="store_true", help="не экспортировать ONNX после обучения")
+    parser.add_argument("--learning-rate", type=float,
+                        help="начальный learning rate (по умолчанию 1e-3, для --warm-start 1e-4)")
+    args = parser.parse_args()
+
+    (x_train_split, y_train_split), (x_val, y_val), (x_test_cnn, y_test) = load_data()
+
+    state = None
+    if args.resume:
+        # Модель вместе с оптимизатором и его текущим learning rate
+        model, state = TrainingCheckpoint.load(args.checkpoint_dir)
+        print(f"Продолжаем обучение с эпохи {state['epoch'] + 1} (чекпоинт '{args.checkpoint_dir}')")
+    else:
+        if args.warm_start is not None:
+            # Дообучение с готовых весов вместо случайной инициализации
+            model = load_pretrained_model(args.warm_start or None)
+            learning_rate = args.learning_rate or 1e-4
+            print(f"Дообучение готовой модели, learning rate {learning_rate}")
+        else:
+            # Создаем модель
+            model = create_improved_cnn_model()
+            learning_rate = args.learning_rate or 1e-3
+
+        # Компилируем с улучшенным оптимизатором
+        model.compile(
+            optimizer=AdamW(learning_rate=learning_rate, weight_decay=1e-4),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy']
+        )
+
+    # Callbacks для лучшего обучения
+    early_stopping = EarlyStopping(
+        monitor='val_loss',
+        patience=15,
+        restore_best_weights=True,
+        verbose=1
+    )
+    lr_plateau = ReduceLROnPlateau(
+        monitor='val_loss',
+        factor=0.2,
+        patience=7,
+        min_lr=1e-7,
+        verbose=1
+    )
+    checkpoint = TrainingCheckpoint(args.checkpoint_dir, early_stopping, lr_plateau,
+                                    every=args.checkpoint_every, state=state)
+    callbacks = [early_stopping, lr_plateau, ThroughputLogger(len(x_train_split)), checkpoint]
+
+    # Аугментация данных в конвейере tf.data
+    train_ds = make_train_dataset(x_train_split, y_train_split, batch_size=args.batch_size)
+    val_ds = make_eval_dataset(x_val, y_val)
+
+    # Обучаем модель с аугментацией и правильной валидацией
+    initial_epoch = state["epoch"] if state else 0
+    if state and (state["stopped_early"] or initial_epoch >= args.epochs):
+        print("Обучение в чекпоинте уже завершено")
+        if state.get("best_weights") is not None:
+            model.set_weights(state["best_weights"])
+    else:
+        print("Начинаем обучение...")
+        model.fit(
+            train_ds,
+            epochs=args.epochs,
+            initial_epoch=initial_epoch,
+            validation_data=val_ds,
+            callbacks=callbacks,
+            verbose=1
+        )
+
+    # Оцениваем модель на тестовых данных
+    test_loss, test_acc = model.evaluate(make_eval_dataset(x_test_cnn, y_test), verbose=0)
+    print(f"\nТочность на тестовых данных: {test_acc:.4f}")
+
+    # Показываем графики обучения
+    if not args.no_plot:
+        # История вместе с эпохами из предыдущих запусков
+        plot_training_history(checkpoint.history)
+
+    # Сохраняем модель
+    project_root = get_project_root()
+    model_save_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model.h5")
+    model.save(model_save_path)
+    print(f"Модель сохранена как '{model_save_path}'")
+
+    # Сохраняем модель в формате Keras
+    keras_save_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model.keras")
+    model.save(keras_save_path)
+    print(f"Модель сохранена в формате Keras как '{keras_save_path}'")
+
+    # Также сохраняем в формате SavedModel
+    savedmodel_path = os.path.join(project_root, "src", "resources", "models", "improved_digit_recognition_model_savedmodel")
+    model.export(savedmodel_path)
+
+    print(f"Модель также сохранена в формате SavedModel как '{savedmodel_path}'")
+
+    # ONNX для приложения: конвертация в процессе, сверка с Keras и замер задержки
+    if not args.no_onnx:
+        export_onnx(model, ONNX_MODEL_PATH, mnist_data.normalize(x_test_cnn[:1000]))
+
+    # Выводим информацию о модели
+    print("\nАрхитектура модели:")
+    model.summary()
+
+
+if __name__ == "__main__":
+    main()
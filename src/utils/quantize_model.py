@@ -0,0 +1,114 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return project_root
+
+
+project_root = get_project_root()
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+from inference import DigitRecognizer, SessionConfig, MODEL_FILENAME, QUANTIZED_MODEL_FILENAME  # noqa: E402
+import mnist_data  # noqa: E402
+
+models_dir = os.path.join(project_root, "src", "resources", "models")
+
+
+class MnistCalibrationReader(CalibrationDataReader):
+    """Отдаёт калибровочные батчи обучающих изображений в формате входа модели."""
+
+    def __init__(self, input_name: str, images: np.ndarray, batch_size: int = 50):
+        self.input_name = input_name
+        # Гистограммные калибраторы требуют батчи одинакового размера — хвост отбрасываем
+        self.images = images[:max(1, len(images) // batch_size) * batch_size]
+        self.batch_size = batch_size
+        self._pos = 0
+
+    def get_next(self):
+        if self._pos >= len(self.images):
+            return None
+        batch = self.images[self._pos:self._pos + self.batch_size]
+        self._pos += self.batch_size
+        x = mnist_data.normalize(batch).reshape(-1, 28, 28, 1)
+        return {self.input_name: x}
+
+    def rewind(self):
+        self._pos = 0
+
+
+def accuracy(model_path: str, test: mnist_data.MnistSplit) -> float:
+    # Временные файлы не должны оседать в кэше оптимизированных графов
+    recognizer = DigitRecognizer(model_path, batch_size=1000, config=SessionConfig(optimized_cache=False))
+    correct = 0
+    for x, y in test.batches(1000):
+        correct += int((recognizer.predict_batch(x).argmax(axis=1) == y).sum())
+    return correct / len(test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статическая INT8-квантизация ONNX модели с проверкой точности")
+    parser.add_argument("--input", default=os.path.join(models_dir, MODEL_FILENAME))
+    parser.add_argument("--output", default=os.path.join(models_dir, QUANTIZED_MODEL_FILENAME))
+    parser.add_argument("--calibration-size", type=int, default=1000, help="число обучающих изображений для калибровки")
+    parser.add_argument("--max-drop", type=float, default=0.5,
+                        help="допустимое падение точности на тесте, в процентных пунктах")
+    parser.add_argument("--calibrate-method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    train, test = mnist_data.load("train"), mnist_data.load("test")
+    rng = np.random.default_rng(args.seed)
+    calib = train.images[rng.choice(len(train), size=min(args.calibration_size, len(train)), replace=False)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, "prepared.onnx")
+        quantized = os.path.join(tmp, "quantized.onnx")
+        print("Подготовка графа (shape inference, свёртка констант)...")
+        quant_pre_process(args.input, prepared, skip_symbolic_shape=True)
+
+        input_name = DigitRecognizer(prepared, config=SessionConfig(optimized_cache=False)).input_name
+        print(f"Калибровка на {len(calib)} обучающих изображениях...")
+        quantize_static(
+            prepared, quantized,
+            MnistCalibrationReader(input_name, calib),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method={"minmax": CalibrationMethod.MinMax,
+                              "entropy": CalibrationMethod.Entropy,
+                              "percentile": CalibrationMethod.Percentile}[args.calibrate_method],
+        )
+
+        float_acc = accuracy(args.input, test)
+        int8_acc = accuracy(quantized, test)
+        drop = (float_acc - int8_acc) * 100
+        print(f"Точность float: {float_acc * 100:.2f}%, INT8: {int8_acc * 100:.2f}% (падение {drop:.2f} п.п.)")
+        print(f"Размер: {os.path.getsize(args.input) / 1024:.0f} КБ -> {os.path.getsize(quantized) / 1024:.0f} КБ")
+
+        if drop > args.max_drop:
+            print(f"Падение точности больше допустимого ({args.max_drop} п.п.) — модель не опубликована.")
+            sys.exit(1)
+        _publish(quantized, args.output)
+    print(f"Квантизированная модель сохранена как '{args.output}'")
+
+
+def _publish(src: str, dst: str):
+    # Пишем рядом и переименовываем, чтобы приложение не увидело недописанный файл
+    partial = dst + ".partial"
+    shutil.copyfile(src, partial)
+    os.replace(partial, dst)
+
+
+if __name__ == "__main__":
+    main()